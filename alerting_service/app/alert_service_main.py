@@ -3,17 +3,25 @@ import logging
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 from alerting_service.app.api.endpoints import alerts_router
+from alerting_service.app.api.photos import photos_router
+from alerting_service.app.api.stats import stats_router
 from services.db import get_db
 from services.cache import RedisCache
-from services.consumer import RabbitMQConsumer
+from services.codec import APIResponse
+from services.consumer import ConsumerGroup, rollup_aggregator, window_store
+from services.logging_setup import setup_logging
+from services.metrics import metrics_router
+from services.partitions import PartitionManager
+from config import config
 import uvicorn
 
 # Initialize services
 redis_cache = RedisCache()
-consumer = RabbitMQConsumer()
+consumer = ConsumerGroup()
+partition_manager = PartitionManager(tables=["alerts"])
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 
@@ -26,14 +34,22 @@ async def lifespan(app: FastAPI):
     including connecting to RabbitMQ and Redis.
     """
     consumer_task = None
+    maintenance_task = None
+    rollup_task = None
+    window_task = None
     try:
         logger.info("Starting IoT Alert Service...")
 
-        # Connect to RabbitMQ
-        logger.info("Connecting to RabbitMQ...")
-        await consumer.connect()
-        consumer_task = asyncio.create_task(consumer.consume())
-        logger.info("RabbitMQ connected and consumer started.")
+        # Connect to RabbitMQ. With the in-process transport, the ingestion service consumes its own events
+        if config.BROKER_TRANSPORT == "memory":
+            logger.info("BROKER_TRANSPORT=memory, alerts are consumed by the ingestion service.")
+        elif not config.ALERTING_CONSUMER_ENABLED:
+            logger.info("ALERTING_CONSUMER_ENABLED is off, alerts are consumed by the consumer supervisor.")
+        else:
+            logger.info("Connecting to RabbitMQ...")
+            await consumer.connect()
+            consumer_task = asyncio.create_task(consumer.consume())
+            logger.info("RabbitMQ connected and consumer started.")
 
         # Connect to Redis
         logger.info("Connecting to Redis...")
@@ -44,14 +60,28 @@ async def lifespan(app: FastAPI):
         get_db()
         logger.info("Database initialized.")
 
+        # Write the alert rollups in the background
+        rollup_task = asyncio.create_task(rollup_aggregator.run_forever())
+
+        # Restore and snapshot the windows of the windowed alert rules
+        if consumer_task and consumer.snapshot_name:
+            window_task = asyncio.create_task(window_store.run_forever(redis_cache, consumer.snapshot_name))
+
+        # Keep the alerts partitions ahead of time and expire old ones
+        if partition_manager.enabled:
+            maintenance_task = asyncio.create_task(partition_manager.run_forever())
+            logger.info("Partition maintenance started.")
+
         yield
 
     except Exception as e:
-        logger.error(f"Error during application startup: {e}")
+        logger.error("Error during application startup: %s", e)
         raise
     finally:
         # Graceful shutdown
         logger.info("Shutting down IoT Alert Service...")
+        if maintenance_task:
+            maintenance_task.cancel()
         if consumer_task:
             consumer_task.cancel()
             try:
@@ -59,6 +89,12 @@ async def lifespan(app: FastAPI):
             except asyncio.CancelledError:
                 logger.info("RabbitMQ consumer task cancelled.")
         await consumer.close()
+        if window_task:
+            window_task.cancel()
+            await window_store.save(redis_cache, consumer.snapshot_name)
+        if rollup_task:
+            rollup_task.cancel()
+        await rollup_aggregator.flush()
         await redis_cache.disconnect()
         logger.info("Resources cleaned up. Shutdown complete.")
 
@@ -67,6 +103,7 @@ async def lifespan(app: FastAPI):
 alerting_service_app = FastAPI(
     title="IoT Alert Service",
     lifespan=lifespan,
+    default_response_class=APIResponse,
 )
 
 # Include the alerts router
@@ -76,6 +113,24 @@ alerting_service_app.include_router(
     tags=["Alerts"],
 )
 
+# Include the photos router
+alerting_service_app.include_router(
+    photos_router,
+    prefix="/photos",
+    tags=["Photos"],
+)
+
+
+# Include the statistics router
+alerting_service_app.include_router(
+    stats_router,
+    prefix="/stats",
+    tags=["Statistics"],
+)
+
+# Include the Prometheus metrics endpoint
+alerting_service_app.include_router(metrics_router)
+
 
 # Health check endpoint
 @alerting_service_app.get("/")
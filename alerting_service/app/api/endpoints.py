@@ -1,83 +1,138 @@
 from datetime import datetime
+from typing import Optional
 import base64
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import defer
 from ingestion_service.app.models import Photo
 from ..models import Alert
+from .photos import photo_response
 from services.db import get_db
 from services.cache import RedisCache
-from services.consumer import RabbitMQConsumer
+from services.codec import APIResponse
+from services.photo_store import get_photo_store
+from services.pagination import NDJSON_MEDIA_TYPE, apply_keyset, paginate, stream_ndjson, wants_ndjson
 
 alerts_router = APIRouter()
 common_fields = {"device_id", "timestamp", "event_type"}
 
 redis_cache = RedisCache()
-consumer = RabbitMQConsumer()
 
 
-# # Define the background RabbitMQ consumer task
-async def start_rabbitmq_consumer():
+def encode_photo(photo_store, photo: Photo) -> Optional[str]:
     """
-    Starts the RabbitMQ consumer to listen for messages.
+    Base64 of the bytes of a photo, or None if it is empty or missing from the photo store.
     """
-    await consumer.connect()  # Establish connection
-    await consumer.consume()  # Start consuming messages
-
+    if not photo.content_hash:
+        return base64.b64encode(photo.photo).decode("utf-8") if photo.photo else None
+    try:
+        with photo_store.read(photo.content_hash) as buffer:
+            return base64.b64encode(buffer).decode("utf-8") if len(buffer) else None
+    except FileNotFoundError:
+        return None
+
+
+def serialize_alert(alert) -> dict:
+    photo_uuid = alert.meta_data.get("uuid") if alert.meta_data else None
+    return {
+        "alert_id": alert.id,
+        "device_id": alert.device_id,
+        "event_type": alert.event_type,
+        "description": alert.description,
+        "meta_data": alert.meta_data,
+        "created_at": alert.created_at.isoformat(),
+        "occurrence_count": alert.occurrence_count,
+        "last_seen_at": alert.last_seen_at.isoformat() if alert.last_seen_at else None,
+        "photo_url": f"/alerts/{alert.id}/photo" if photo_uuid else None,
+        "thumbnail_url": f"/photos/{photo_uuid}/thumbnail" if photo_uuid else None,
+    }
 
 
 @alerts_router.get("/get_alerts")
 def get_alerts(
+    request: Request,
     db=Depends(get_db),
     start_time: datetime = Query(None, description="Start of the time range"),
     end_time: datetime = Query(None, description="End of the time range"),
     event_type: str = Query(None, description="Type of the Alert"),
+    device_id: str = Query(None, description="MAC address of the device"),
+    include_photos: bool = Query(False, description="Embed photos as base64 instead of returning only their URLs"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of alerts per page"),
+    cursor: str = Query(None, description="next_cursor of the previous page"),
 ):
-    query = db.query(Alert)
+    """
+    Retrieve alerts ordered by (created_at, id), paginated with an opaque cursor.
+    With "Accept: application/x-ndjson" all matching alerts are streamed instead, one per line, without photos.
+    """
+    ndjson = wants_ndjson(request)
+    columns = (
+        Alert.id, Alert.device_id, Alert.event_type, Alert.description, Alert.meta_data, Alert.created_at,
+        Alert.occurrence_count, Alert.last_seen_at,
+    )
+    query = select(*columns) if ndjson else select(Alert)
 
     if start_time:
-        query = query.filter(Alert.timestamp >= start_time)
+        query = query.where(Alert.created_at >= start_time)
     if end_time:
-        query = query.filter(Alert.timestamp <= end_time)
+        query = query.where(Alert.created_at <= end_time)
     if event_type:
-        query = query.filter(Alert.event_type == event_type)
-
-    alerts = query.all()
-
-    # Collect all UUIDs from meta_data
-    uuid_list = [
-        alert.meta_data["uuid"]
-        for alert in alerts
-        if alert.meta_data and "uuid" in alert.meta_data
-    ]
-
-    # Bulk query to fetch photos
-    photos = (
-        db.query(Photo)
-            .filter(Photo.uuid.in_(uuid_list))
-            .all()
-    )
+        query = query.where(Alert.event_type == event_type)
+    if device_id:
+        query = query.where(Alert.device_id == device_id)
+
+    query = apply_keyset(query, Alert.created_at, Alert.id, cursor)
+
+    if ndjson:
+        return StreamingResponse(stream_ndjson(query, serialize_alert), media_type=NDJSON_MEDIA_TYPE)
+
+    alerts, next_cursor = paginate(db, query, limit, lambda alert: (alert.created_at, alert.id))
+
+    uuid_to_photo = {}
+    if include_photos:
+        # Collect all UUIDs from meta_data
+        uuid_list = [
+            alert.meta_data["uuid"]
+            for alert in alerts
+            if alert.meta_data and "uuid" in alert.meta_data
+        ]
+
+        # Bulk query to fetch photo metadata, inline bytes are only loaded for legacy rows
+        photos = (
+            db.query(Photo)
+                .options(defer(Photo.photo))
+                .filter(Photo.uuid.in_(uuid_list))
+                .all()
+        )
 
-    # Create a mapping of UUID to photo
-    uuid_to_photo = {str(photo.uuid): photo.photo for photo in photos}
+        # Create a mapping of UUID to the base64 of the photo
+        photo_store = get_photo_store()
+        uuid_to_photo = {str(photo.uuid): encode_photo(photo_store, photo) for photo in photos}
 
     # Prepare the result
     result = []
     for alert in alerts:
-        photo_base64 = None
-        if alert.meta_data and "uuid" in alert.meta_data:
-            photo_uuid = alert.meta_data["uuid"]
-            if photo_uuid in uuid_to_photo and uuid_to_photo[photo_uuid]:
-                photo_base64 = base64.b64encode(uuid_to_photo[photo_uuid]).decode("utf-8")
-
-        result.append(
-            {
-                "alert_id": alert.id,
-                "event_type": alert.event_type,
-                "description": alert.description,
-                "meta_data": alert.meta_data,
-                "created_at": alert.created_at.isoformat(),
-                "photo": photo_base64,
-            }
-        )
+        item = serialize_alert(alert)
+        if include_photos:
+            photo_uuid = alert.meta_data.get("uuid") if alert.meta_data else None
+            item["photo"] = uuid_to_photo.get(photo_uuid)
+        result.append(item)
+
+    # The rows are already JSON types, so skip FastAPI's jsonable_encoder pass
+    return APIResponse({"alerts": result, "next_cursor": next_cursor})
 
-    return {"alerts": result}
 
+@alerts_router.get("/{alert_id}/photo")
+def get_alert_photo(alert_id: int, request: Request, db=Depends(get_db)):
+    """
+    Stream the photo attached to an alert.
+    """
+    alert = db.get(Alert, alert_id)
+    if not alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+
+    photo_uuid = alert.meta_data.get("uuid") if alert.meta_data else None
+    photo = db.query(Photo).filter(Photo.uuid == photo_uuid).first() if photo_uuid else None
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return photo_response(request, photo)
@@ -0,0 +1,181 @@
+import hashlib
+import re
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from ingestion_service.app.models import Photo
+from services.db import get_db
+from services.photo_store import get_photo_store
+from config import config
+
+photos_router = APIRouter()
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Leading bytes of the image formats cameras send, used to pick the Content-Type
+MEDIA_TYPE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp"),
+]
+
+
+def guess_media_type(head: bytes) -> str:
+    for signature, media_type in MEDIA_TYPE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    return "application/octet-stream"
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single-range Range header.
+
+    :param header: The Range header value, e.g. "bytes=0-1023".
+    :param size: The total size of the photo.
+    :return: An inclusive (start, end) tuple, None to serve the whole photo,
+             or raise HTTPException(416) if the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: ignore the header and send everything
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def iter_file(path: str, start: int, length: int, chunk_size: int):
+    with open(path, "rb") as photo_file:
+        photo_file.seek(start)
+        while length > 0:
+            chunk = photo_file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def iter_buffer(buffer, start: int, length: int, chunk_size: int):
+    view = memoryview(buffer)
+    try:
+        for offset in range(start, start + length, chunk_size):
+            yield bytes(view[offset:min(offset + chunk_size, start + length)])
+    finally:
+        view.release()
+
+
+def iter_stored(photo_store, content_hash: str, start: int, length: int, chunk_size: int):
+    with photo_store.read(content_hash) as buffer:
+        yield from iter_buffer(buffer, start, length, chunk_size)
+
+
+def photo_response(request: Request, photo: Photo, thumbnail: bool = False) -> Response:
+    """
+    Stream the bytes of a photo, or of its thumbnail, in chunks, with ETag and single Range support.
+    A whole photo with a local file is sent as a FileResponse, so the server can use sendfile.
+    """
+    chunk_size = config.PHOTO_STREAM_CHUNK_SIZE
+    photo_store = get_photo_store()
+
+    buffer = None
+    if thumbnail:
+        if not photo.thumbnail_hash:
+            raise HTTPException(status_code=404, detail="Thumbnail not found")
+        content_hash = photo.thumbnail_hash
+    elif photo.content_hash:
+        content_hash = photo.content_hash
+    elif photo.photo is not None:
+        # Legacy row that still holds the photo inline
+        buffer = photo.photo
+        content_hash = hashlib.sha256(buffer).hexdigest()
+    else:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    path = None
+    if buffer is None:
+        try:
+            size = photo_store.size(content_hash)
+        except FileNotFoundError:
+            # The row outlived its blob in the photo store
+            raise HTTPException(status_code=404, detail="Thumbnail not found" if thumbnail else "Photo not found")
+        path = photo_store.path(content_hash)
+    else:
+        size = len(buffer)
+
+    etag = f'"{content_hash}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Photos are content addressed, so a given URL never changes
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    if path:
+        with open(path, "rb") as photo_file:
+            head = photo_file.read(16)
+    elif buffer is None:
+        with photo_store.read(content_hash) as stored:
+            head = bytes(stored[:16])
+    else:
+        head = bytes(buffer[:16])
+    media_type = guess_media_type(head)
+
+    if path and "range" not in request.headers:
+        # FileResponse sets Content-Length and Last-Modified from the file and keeps our ETag
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    status_code = 200
+    start, length = 0, size
+    byte_range = parse_range(request.headers["range"], size) if "range" in request.headers and size else None
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+
+    if path:
+        chunks = iter_file(path, start, length, chunk_size)
+    elif buffer is None:
+        chunks = iter_stored(photo_store, content_hash, start, length, chunk_size)
+    else:
+        chunks = iter_buffer(buffer, start, length, chunk_size)
+    return StreamingResponse(chunks, status_code=status_code, media_type=media_type, headers=headers)
+
+
+@photos_router.get("/{photo_uuid}")
+def get_photo(photo_uuid: str, request: Request, db=Depends(get_db)):
+    """
+    Stream a photo by its UUID.
+    """
+    photo = db.query(Photo).filter(Photo.uuid == photo_uuid).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return photo_response(request, photo)
+
+
+@photos_router.get("/{photo_uuid}/thumbnail")
+def get_photo_thumbnail(photo_uuid: str, request: Request, db=Depends(get_db)):
+    """
+    Stream the thumbnail of a photo, small enough for dashboard lists.
+    """
+    photo = db.query(Photo).filter(Photo.uuid == photo_uuid).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return photo_response(request, photo, thumbnail=True)
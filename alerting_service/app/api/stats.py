@@ -0,0 +1,101 @@
+import re
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from services.codec import APIResponse
+from services.db import get_db
+from services.rollups import COUNT_METRIC, Rollup1h, Rollup1m, floor_bucket, merge_aggregate, to_utc_naive
+from config import config
+
+stats_router = APIRouter()
+
+BUCKET_PATTERN = re.compile(r"^(\d+)([mhd])$")
+BUCKET_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_bucket(bucket: str) -> int:
+    """
+    Convert a bucket width such as "5m", "1h" or "1d" into seconds.
+    """
+    match = BUCKET_PATTERN.match(bucket)
+    seconds = int(match.group(1)) * BUCKET_UNITS[match.group(2)] if match else 0
+    if seconds <= 0:
+        raise HTTPException(status_code=400, detail="Invalid bucket, use e.g. 1m, 15m, 1h or 1d")
+    return seconds
+
+
+def serialize_point(bucket: datetime, count, total, low, high) -> dict:
+    return {
+        "bucket": bucket.isoformat(),
+        "count": count,
+        "sum": total,
+        "min": low,
+        "max": high,
+        "avg": total / count if total is not None and count else None,
+    }
+
+
+@stats_router.get("/series")
+def get_series(
+    db=Depends(get_db),
+    source: str = Query("alerts", pattern="^(events|alerts)$", description="Count events or alerts"),
+    start_time: datetime = Query(None, description="Start of the time range, 24 hours before end_time by default"),
+    end_time: datetime = Query(None, description="End of the time range, now by default"),
+    bucket: str = Query("1h", description="Bucket width, e.g. 1m, 15m, 1h or 1d"),
+    event_type: str = Query(None, description="Type of the event"),
+    device_id: str = Query(None, description="MAC address of the device"),
+    metric: str = Query(COUNT_METRIC, description="Numeric meta_data field to aggregate, counts only when empty"),
+    group_by: str = Query(None, pattern="^(device_id|event_type)$", description="Return one series per value"),
+):
+    """
+    Serve a time series from the rollup tables.
+    Buckets that are whole hours are read from the hourly rollups, others from the per-minute rollups,
+    and merged into the requested width.
+    """
+    seconds = parse_bucket(bucket)
+    if seconds % 60:
+        raise HTTPException(status_code=400, detail="Bucket must be a whole number of minutes")
+    end_time = to_utc_naive(end_time) if end_time else datetime.utcnow()
+    start_time = to_utc_naive(start_time) if start_time else end_time - timedelta(days=1)
+    if (end_time - start_time).total_seconds() / seconds > config.STATS_MAX_POINTS:
+        raise HTTPException(status_code=400, detail="Too many buckets, use a wider bucket or a shorter range")
+
+    model = Rollup1h if seconds % 3600 == 0 else Rollup1m
+    group_column = getattr(model, group_by) if group_by else None
+    columns = [model.bucket] + ([group_column] if group_by else [])
+    query = (
+        select(
+            *columns,
+            func.sum(model.count),
+            func.sum(model.value_sum),
+            func.min(model.value_min),
+            func.max(model.value_max),
+        )
+        .where(
+            model.source == source,
+            model.metric == metric,
+            model.bucket >= floor_bucket(start_time, seconds),
+            model.bucket <= end_time,
+        )
+        .group_by(*columns)
+        .order_by(model.bucket)
+    )
+    if event_type:
+        query = query.where(model.event_type == event_type)
+    if device_id:
+        query = query.where(model.device_id == device_id)
+
+    # Re-bucket the stored buckets into the requested width
+    series = {}
+    for row in db.execute(query):
+        key = row[1] if group_by else None
+        count, total, low, high = row[-4:]
+        merge_aggregate(series.setdefault(key, {}), floor_bucket(row[0], seconds), count, total, low, high)
+
+    result = []
+    for key, points in series.items():
+        item = {group_by: key} if group_by else {}
+        item["points"] = [serialize_point(point_bucket, *values) for point_bucket, values in sorted(points.items())]
+        result.append(item)
+
+    return APIResponse({"source": source, "bucket": bucket, "metric": metric, "series": result})
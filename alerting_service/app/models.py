@@ -1,21 +1,36 @@
 from services.db import Base
-from sqlalchemy import Column, Integer, String, JSON, DateTime, LargeBinary
+from sqlalchemy import Column, Integer, String, JSON, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 
 class Alert(Base):
     __tablename__ = "alerts"
     id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String)
     event_type = Column(String, nullable=False)
     description = Column(String, nullable=False)
-    meta_data = Column(JSON)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    meta_data = Column(JSON().with_variant(JSONB(), "postgresql"))
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Occurrences collapsed into this alert during its cooldown window, and the time of the latest
+    occurrence_count = Column(Integer, default=1, server_default="1", nullable=False)
+    last_seen_at = Column(DateTime)
+
+    # Indexes follow the filters and the (created_at, id) keyset order used by get_alerts
+    __table_args__ = (
+        Index("ix_alerts_created_at_id", "created_at", "id"),
+        Index("ix_alerts_event_type_created_at_id", "event_type", "created_at", "id"),
+        Index("ix_alerts_device_id_created_at_id", "device_id", "created_at", "id"),
+    )
 
     def to_dict(self):
         return {
             "id": self.id,
             "device_id": self.device_id,
-            "timestamp": self.timestamp.isoformat() if self.timestamp else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
             "event_type": self.event_type,
+            "description": self.description,
             "meta_data": self.meta_data,
+            "occurrence_count": self.occurrence_count,
+            "last_seen_at": self.last_seen_at.isoformat() if self.last_seen_at else None,
         }
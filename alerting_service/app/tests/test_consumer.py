@@ -4,6 +4,9 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from alerting_service.app.models import Alert
 from services.consumer import RabbitMQConsumer  # Update to the correct import path
+from services.debounce import AlertDebouncer
+from services.dedup import DuplicateFilter
+from services.metrics import ALERTS_COLLAPSED_TOTAL, ALERTS_TOTAL
 from datetime import datetime
 
 
@@ -12,13 +15,19 @@ def mock_config():
     with patch("services.consumer.config") as mock_config:
         mock_config.RABBITMQ_URL = "mock_url"
         mock_config.RABBITMQ_QUEUE = "mock_queue"
+        mock_config.RABBITMQ_PREFETCH_COUNT = 10
+        mock_config.CONSUMER_BATCH_MODE = True
+        mock_config.CONSUMER_BATCH_SIZE = 3
+        mock_config.CONSUMER_FLUSH_INTERVAL_MS = 1000
         yield mock_config
 
 
 @pytest.fixture
 def mock_db_session():
-    with patch("services.consumer.SessionLocal") as mock_session_local:
-        session_mock = MagicMock()
+    with patch("services.consumer.AsyncSessionLocal") as mock_session_local:
+        session_mock = AsyncMock()
+        session_mock.add = MagicMock()
+        session_mock.add_all = MagicMock()
         mock_session_local.return_value = session_mock
         yield session_mock
 
@@ -45,6 +54,7 @@ async def test_consumer_connect(mock_config):
 async def test_consumer_process_event(mock_config, mock_db_session):
     consumer = RabbitMQConsumer()
     event = {
+        "device_id": "AA:BB:CC:DD:EE:FF",
         "event_type": "speed_violation",
         "meta_data": {"speed_kmh": 120}
     }
@@ -54,10 +64,76 @@ async def test_consumer_process_event(mock_config, mock_db_session):
     alert = mock_db_session.add.call_args[0][0]
     assert isinstance(alert, Alert)
     assert alert.event_type == "speed_violation"
+    assert alert.to_dict()["device_id"] == "AA:BB:CC:DD:EE:FF"
     assert "Speed violation detected" in alert.description
     mock_db_session.commit.assert_called_once()
 
 
+@pytest.mark.asyncio
+async def test_consumer_batch_flushes_with_multiple_ack(mock_config, mock_db_session):
+    consumer = RabbitMQConsumer()
+    events = [
+        {"event_type": "speed_violation", "meta_data": {"speed_kmh": 120}},
+        {"event_type": "speed_violation", "meta_data": {"speed_kmh": 50}},
+        {"event_type": "motion_detected", "meta_data": {"confidence": 0.95}},
+    ]
+    messages = [AsyncMock(body=json.dumps(event).encode()) for event in events]
+
+    for message in messages:
+        await consumer.batch_callback(message)
+
+    alerts = mock_db_session.add_all.call_args[0][0]
+    assert [alert.event_type for alert in alerts] == ["speed_violation", "motion_detected"]
+    mock_db_session.commit.assert_called_once()
+    messages[-1].ack.assert_called_once_with(multiple=True)
+    messages[0].ack.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_consumer_skips_redelivered_events(mock_config, mock_db_session):
+    consumer = RabbitMQConsumer()
+    events = [
+        {"event_type": "speed_violation", "meta_data": {"speed_kmh": 120}, "event_key": "k1"},
+        {"event_type": "speed_violation", "meta_data": {"speed_kmh": 120}, "event_key": "k1"},
+        {"event_type": "speed_violation", "meta_data": {"speed_kmh": 130}, "event_key": "k2"},
+    ]
+
+    with patch("services.consumer.event_filter", DuplicateFilter(stage="consumer", capacity=100, enabled=True)):
+        for event in events:
+            await consumer.batch_callback(AsyncMock(body=json.dumps(event).encode()))
+        assert len(mock_db_session.add_all.call_args[0][0]) == 2
+
+        redelivered = MagicMock(body=json.dumps(events[0]).encode(), content_type="application/json")
+        await consumer.callback(redelivered)
+
+    mock_db_session.add.assert_not_called()
+    mock_db_session.commit.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_consumer_collapses_alerts_in_cooldown(mock_config, mock_db_session):
+    consumer = RabbitMQConsumer()
+    debouncer = AlertDebouncer(cooldown=60, cooldowns={}, max_age=600)
+    events = [{"device_id": "AA:BB:CC:DD:EE:FF", "event_type": "speed_violation", "meta_data": {"speed_kmh": 120}}] * 3
+    mock_db_session.add_all.side_effect = lambda alerts: [setattr(alert, "id", 5) for alert in alerts]
+    stored = ALERTS_TOTAL.labels("speed_violation").value
+    collapsed = ALERTS_COLLAPSED_TOTAL.labels("speed_violation").value
+
+    with patch("services.consumer.alert_debouncer", debouncer), \
+            patch("services.consumer.redis_cache.open_alert_windows", AsyncMock(return_value=["new", "pending", "9"])), \
+            patch("services.consumer.redis_cache.attach_alerts", AsyncMock(return_value=[1])):
+        for event in events:
+            await consumer.batch_callback(AsyncMock(body=json.dumps(event).encode()))
+
+    assert len(mock_db_session.add_all.call_args[0][0]) == 1
+    updates = [call.args[1] for call in mock_db_session.execute.call_args_list]
+    assert [[(row["alert_id"], row["occurrences"]) for row in rows] for rows in updates] == [[(9, 1)], [(5, 1)]]
+    assert mock_db_session.commit.call_count == 2
+    # Only the stored alert is counted as stored, the other two as collapsed
+    assert ALERTS_TOTAL.labels("speed_violation").value - stored == 1
+    assert ALERTS_COLLAPSED_TOTAL.labels("speed_violation").value - collapsed == 2
+
+
 @pytest.mark.asyncio
 async def test_consumer_close(mock_config):
     consumer = RabbitMQConsumer()
@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from alerting_service.app.models import Alert
+from services.cache import RedisCache
+from services.db import Base
+from services.debounce import AlertDebouncer, collapse_alerts, parse_cooldowns
+
+
+def make_alert(event_type: str = "motion_detected", device_id: str = "AA:BB:CC:DD:EE:01", minute: int = 0) -> Alert:
+    created_at = datetime(2024, 1, 1, 12, minute)
+    return Alert(device_id=device_id, event_type=event_type, description="Motion detected", meta_data={},
+                 created_at=created_at, occurrence_count=1, last_seen_at=created_at)
+
+
+def test_parse_cooldowns():
+    assert parse_cooldowns("motion_detected=30, speed_violation=300") == {
+        "motion_detected": 30.0, "speed_violation": 300.0
+    }
+    assert parse_cooldowns("") == {}
+
+
+@pytest.mark.asyncio
+async def test_split_collapses_into_open_windows():
+    debouncer = AlertDebouncer(cooldown=60, cooldowns={"speed_violation": 0}, max_age=600)
+    cache = MagicMock()
+    cache.open_alert_windows = AsyncMock(return_value=["new", "pending", "7", "7"])
+    alerts = [make_alert(), make_alert(minute=1), make_alert(device_id="AA:BB:CC:DD:EE:02", minute=2),
+              make_alert(device_id="AA:BB:CC:DD:EE:02", minute=3), make_alert("speed_violation")]
+
+    new, collapsed = await debouncer.split(cache, alerts)
+
+    assert new == [alerts[0], alerts[4]]
+    assert collapsed == {7: (2, datetime(2024, 1, 1, 12, 3))}
+    cache.open_alert_windows.assert_called_once_with([
+        ("motion_detected:AA:BB:CC:DD:EE:01", 60000), ("motion_detected:AA:BB:CC:DD:EE:01", 60000),
+        ("motion_detected:AA:BB:CC:DD:EE:02", 60000), ("motion_detected:AA:BB:CC:DD:EE:02", 60000),
+    ], 600000)
+
+
+@pytest.mark.asyncio
+async def test_disabled_cooldown_skips_redis():
+    debouncer = AlertDebouncer(cooldown=0, cooldowns={})
+    cache = MagicMock()
+    alerts = [make_alert(), make_alert()]
+
+    assert await debouncer.split(cache, alerts) == (alerts, {})
+    cache.open_alert_windows.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_alert_window_scripts():
+    pytest.importorskip("lupa", reason="fakeredis runs Lua scripts with lupa")
+    from fakeredis.aioredis import FakeRedis
+
+    cache = RedisCache()
+    cache.redis = FakeRedis(decode_responses=True)
+    debouncer = AlertDebouncer(cooldown=60, cooldowns={})
+    first, repeat = make_alert(), make_alert(minute=1)
+
+    new, collapsed = await debouncer.split(cache, [first, repeat])
+    assert new == [first] and collapsed == {}
+
+    first.id = 42
+    pending = await debouncer.attach(cache, [first])
+    assert list(pending) == [42] and pending[42][0] == 1
+
+    new, collapsed = await debouncer.split(cache, [make_alert(minute=2)])
+    assert new == [] and collapsed == {42: (1, datetime(2024, 1, 1, 12, 2))}
+    assert 0 < await cache.redis.pttl("alert_window:motion_detected:AA:BB:CC:DD:EE:01") <= 60000
+
+    await debouncer.release(cache, [first])
+    new, _ = await debouncer.split(cache, [make_alert(minute=3)])
+    assert len(new) == 1
+
+
+@pytest.mark.asyncio
+async def test_alert_window_closes_at_max_age():
+    pytest.importorskip("lupa", reason="fakeredis runs Lua scripts with lupa")
+    from fakeredis.aioredis import FakeRedis
+
+    cache = RedisCache()
+    cache.redis = FakeRedis(decode_responses=True)
+    debouncer = AlertDebouncer(cooldown=0.05, cooldowns={}, max_age=0.05)
+    first = make_alert()
+    new, _ = await debouncer.split(cache, [first])
+    first.id = 1
+    await debouncer.attach(cache, new)
+
+    # Keeps firing more often than the cooldown, but the window still closes max_age after the first alert
+    results = []
+    for _ in range(6):
+        await asyncio.sleep(0.02)
+        new, collapsed = await debouncer.split(cache, [make_alert()])
+        results.append("new" if new else "collapsed")
+    assert results[0] == "collapsed" and "new" in results
+
+
+@pytest.mark.asyncio
+async def test_alert_windows_fail_open():
+    cache = RedisCache()
+    cache.redis = MagicMock()
+    cache.redis.register_script.side_effect = ConnectionError("redis is down")
+
+    assert await cache.open_alert_windows([("motion_detected:AA:BB:CC:DD:EE:01", 60000)], 600000) == ["new"]
+    assert await cache.attach_alerts([("motion_detected:AA:BB:CC:DD:EE:01", 1)]) == [0]
+
+
+@pytest.mark.asyncio
+async def test_collapse_alerts_updates_counts():
+    pytest.importorskip("aiosqlite")
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all, tables=[Alert.__table__])
+    session_local = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with session_local() as session:
+        alerts = [make_alert(), make_alert(device_id="AA:BB:CC:DD:EE:02")]
+        session.add_all(alerts)
+        await session.commit()
+        await collapse_alerts(session, {alerts[0].id: (3, datetime(2024, 1, 1, 12, 5))})
+        await session.commit()
+
+        rows = (await session.execute(
+            select(Alert.occurrence_count, Alert.last_seen_at).order_by(Alert.id)
+        )).all()
+    await engine.dispose()
+
+    assert rows == [(4, datetime(2024, 1, 1, 12, 5)), (1, datetime(2024, 1, 1, 12, 0))]
@@ -0,0 +1,69 @@
+import json
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from alerting_service.app.alert_service_main import alerting_service_app
+from alerting_service.app.models import Alert
+from services.db import Base, get_db
+from services.pagination import NDJSON_MEDIA_TYPE, decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def client(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'alerts.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_local = sessionmaker(bind=engine)
+    created_at = datetime(2024, 1, 1, 12, 0, 0)
+
+    with session_local() as session:
+        # Two alerts share a timestamp so the id has to break the tie
+        for index, offset in enumerate([0, 1, 1, 2, 3]):
+            session.add(Alert(
+                event_type="speed_violation",
+                description=f"alert {index}",
+                meta_data={"speed_kmh": 120},
+                created_at=created_at + timedelta(seconds=offset),
+            ))
+        session.commit()
+
+    def override_get_db():
+        with session_local() as db:
+            yield db
+
+    alerting_service_app.dependency_overrides[get_db] = override_get_db
+    with patch("services.pagination.SessionLocal", session_local):
+        yield TestClient(alerting_service_app)
+    alerting_service_app.dependency_overrides.clear()
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 1, 1, 12, 30)
+    assert decode_cursor(encode_cursor(timestamp, 42)) == (timestamp, 42)
+
+
+def test_get_alerts_keyset_pages(client):
+    descriptions = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/alerts/get_alerts", params=params).json()
+        descriptions += [alert["description"] for alert in page["alerts"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert descriptions == [f"alert {index}" for index in range(5)]
+    assert client.get("/alerts/get_alerts", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_get_alerts_ndjson_stream(client):
+    response = client.get("/alerts/get_alerts", headers={"Accept": NDJSON_MEDIA_TYPE})
+
+    assert response.headers["content-type"].startswith(NDJSON_MEDIA_TYPE)
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["description"] for line in lines] == [f"alert {index}" for index in range(5)]
@@ -0,0 +1,94 @@
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from alerting_service.app.alert_service_main import alerting_service_app
+from alerting_service.app.models import Alert
+from ingestion_service.app.models import Photo
+from services.db import Base, get_db
+from services.photo_store import LocalPhotoStore
+
+JPEG = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 4
+THUMBNAIL = b"\xff\xd8\xff\xe0" + bytes(64)
+
+
+@pytest.fixture
+def client(tmp_path):
+    """
+    Test client backed by a SQLite file and a local photo store with one alert photo.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'alerts.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session_local = sessionmaker(bind=engine)
+    store = LocalPhotoStore(str(tmp_path / "photos"))
+    content_hash = store.put(JPEG)
+    thumbnail_hash = store.put(THUMBNAIL)
+
+    with session_local() as session:
+        session.add(Photo(uuid="photo-1", content_hash=content_hash, size=len(JPEG), thumbnail_hash=thumbnail_hash))
+        session.add(Photo(uuid="photo-2", content_hash=content_hash, size=len(JPEG)))
+        session.add(Photo(uuid="photo-3", content_hash=LocalPhotoStore.content_hash(b"lost"), size=4))
+        session.add(Alert(event_type="motion_detected", description="Motion", meta_data={"uuid": "photo-1"}))
+        session.commit()
+
+    def override_get_db():
+        with session_local() as db:
+            yield db
+
+    alerting_service_app.dependency_overrides[get_db] = override_get_db
+    with patch("alerting_service.app.api.photos.get_photo_store", return_value=store), \
+            patch("alerting_service.app.api.endpoints.get_photo_store", return_value=store):
+        yield TestClient(alerting_service_app)
+    alerting_service_app.dependency_overrides.clear()
+
+
+def test_get_alerts_returns_photo_urls_by_default(client):
+    alert = client.get("/alerts/get_alerts").json()["alerts"][0]
+
+    assert alert["photo_url"] == f"/alerts/{alert['alert_id']}/photo"
+    assert alert["thumbnail_url"] == "/photos/photo-1/thumbnail"
+    assert "photo" not in alert
+
+    alert = client.get("/alerts/get_alerts", params={"include_photos": True}).json()["alerts"][0]
+    assert alert["photo"] is not None
+
+
+def test_alert_photo_streams_with_etag(client):
+    response = client.get("/alerts/1/photo")
+
+    assert response.status_code == 200
+    assert response.content == JPEG
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["content-length"] == str(len(JPEG))
+    assert response.headers["etag"] == f'"{LocalPhotoStore.content_hash(JPEG)}"'
+
+    cached = client.get("/photos/photo-1", headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+
+
+def test_photo_range_requests(client):
+    response = client.get("/photos/photo-1", headers={"Range": "bytes=4-13"})
+    assert response.status_code == 206
+    assert response.content == JPEG[4:14]
+    assert response.headers["content-range"] == f"bytes 4-13/{len(JPEG)}"
+
+    suffix = client.get("/photos/photo-1", headers={"Range": "bytes=-4"})
+    assert suffix.content == JPEG[-4:]
+
+    unsatisfiable = client.get("/photos/photo-1", headers={"Range": f"bytes={len(JPEG)}-"})
+    assert unsatisfiable.status_code == 416
+
+
+def test_photo_thumbnail(client):
+    response = client.get("/photos/photo-1/thumbnail")
+
+    assert response.status_code == 200
+    assert response.content == THUMBNAIL
+    assert response.headers["content-type"] == "image/jpeg"
+    assert client.get("/photos/photo-2/thumbnail").status_code == 404
+    assert client.get("/photos/missing/thumbnail").status_code == 404
+
+
+def test_photo_missing_from_store(client):
+    assert client.get("/photos/photo-3").status_code == 404
@@ -0,0 +1,92 @@
+import pytest
+from datetime import datetime
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from alerting_service.app.alert_service_main import alerting_service_app
+from services.db import Base, get_db
+from services.rollups import Rollup1h, Rollup1m, RollupAggregator, floor_bucket
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "rollups.db"
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    yield sessionmaker(bind=engine), async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def client(database):
+    session_local, _ = database
+
+    def override_get_db():
+        with session_local() as db:
+            yield db
+
+    alerting_service_app.dependency_overrides[get_db] = override_get_db
+    yield TestClient(alerting_service_app)
+    alerting_service_app.dependency_overrides.clear()
+
+
+def test_floor_bucket():
+    assert floor_bucket(datetime(2024, 1, 1, 12, 34, 56), 60) == datetime(2024, 1, 1, 12, 34)
+    assert floor_bucket(datetime(2024, 1, 1, 12, 34, 56), 900) == datetime(2024, 1, 1, 12, 30)
+    assert floor_bucket(datetime(2024, 1, 1, 12, 34, 56), 86400) == datetime(2024, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_aggregator_upserts_batches(database):
+    session_local, async_session_local = database
+    aggregator = RollupAggregator("events", session_factory=async_session_local)
+    aggregator.enabled = True
+
+    aggregator.add("AA:BB:CC:DD:EE:FF", "temperature_reading", datetime(2024, 1, 1, 12, 0, 10), {"temperature_c": 20})
+    aggregator.add("AA:BB:CC:DD:EE:FF", "temperature_reading", datetime(2024, 1, 1, 12, 0, 50), {"temperature_c": 30})
+    # Count row and temperature_c row, per minute and per hour
+    assert aggregator.pending == 4
+    assert await aggregator.flush() == 4
+
+    aggregator.add("AA:BB:CC:DD:EE:FF", "temperature_reading", datetime(2024, 1, 1, 12, 30), {"temperature_c": 10})
+    await aggregator.flush()
+
+    with session_local() as session:
+        hourly = session.scalars(select(Rollup1h).where(Rollup1h.metric == "temperature_c")).one()
+        minutes = session.scalars(select(Rollup1m).where(Rollup1m.metric == "").order_by(Rollup1m.bucket)).all()
+
+    assert (hourly.count, hourly.value_sum, hourly.value_min, hourly.value_max) == (3, 60, 10, 30)
+    assert [(row.bucket.minute, row.count) for row in minutes] == [(0, 2), (30, 1)]
+
+
+@pytest.mark.asyncio
+async def test_series_rebuckets_minutes(database, client):
+    _, async_session_local = database
+    aggregator = RollupAggregator("alerts", session_factory=async_session_local)
+    aggregator.enabled = True
+    for minute, device_id in [(1, "AA:00:00:00:00:01"), (4, "AA:00:00:00:00:01"), (7, "AA:00:00:00:00:02")]:
+        aggregator.add(device_id, "speed_violation", datetime(2024, 1, 1, 12, minute), {"speed_kmh": 100 + minute})
+    await aggregator.flush()
+
+    params = {"start_time": "2024-01-01T12:00:00", "end_time": "2024-01-01T13:00:00", "bucket": "5m"}
+    counts = client.get("/stats/series", params=params).json()
+    speeds = client.get("/stats/series", params={**params, "metric": "speed_kmh"}).json()
+    by_device = client.get("/stats/series", params={**params, "bucket": "1h", "group_by": "device_id"}).json()
+
+    assert [(point["bucket"], point["count"]) for point in counts["series"][0]["points"]] == [
+        ("2024-01-01T12:00:00", 2),
+        ("2024-01-01T12:05:00", 1),
+    ]
+    assert speeds["series"][0]["points"][0] == {
+        "bucket": "2024-01-01T12:00:00", "count": 2, "sum": 205.0, "min": 101.0, "max": 104.0, "avg": 102.5,
+    }
+    assert {series["device_id"]: series["points"][0]["count"] for series in by_device["series"]} == {
+        "AA:00:00:00:00:01": 2,
+        "AA:00:00:00:00:02": 1,
+    }
+
+
+def test_series_rejects_invalid_bucket(client):
+    assert client.get("/stats/series", params={"bucket": "5x"}).status_code == 400
+    assert client.get("/stats/series", params={"bucket": "1m", "start_time": "2000-01-01T00:00:00"}).status_code == 400
@@ -0,0 +1,103 @@
+import json
+import os
+import pytest
+from unittest.mock import AsyncMock, patch
+from services.rules import RuleEngine
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "rules": [
+            {"event_type": "access_attempt", "field": "user_id", "op": "not_authorized",
+             "description": "user is not authorized to access"},
+            {"event_type": "temperature_reading", "field": "temperature_c", "op": ">", "value": 60,
+             "description": "High temperature detected: {value} C"},
+            {"event_type": "temperature_reading", "field": "temperature_c", "op": "<", "value": -20,
+             "description": "Low temperature detected: {value} C"},
+        ]
+    }))
+    return path
+
+
+@pytest.fixture
+def mock_cache():
+    cache = AsyncMock()
+    cache.is_authorized_user = AsyncMock(side_effect=lambda user_id: user_id == "admin")
+    cache.are_authorized_users = AsyncMock(
+        side_effect=lambda user_ids: {user_id: user_id == "admin" for user_id in user_ids}
+    )
+    return cache
+
+
+@pytest.mark.asyncio
+async def test_evaluate_single_event(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+
+    hot = {"event_type": "temperature_reading", "meta_data": {"temperature_c": 75}}
+    normal = {"event_type": "temperature_reading", "meta_data": {"temperature_c": 20}}
+    intruder = {"event_type": "access_attempt", "meta_data": {"user_id": "guest"}}
+
+    assert await engine.evaluate(hot, mock_cache) == "High temperature detected: 75 C"
+    assert await engine.evaluate(normal, mock_cache) is None
+    assert await engine.evaluate(intruder, mock_cache) == "user is not authorized to access"
+    assert await engine.evaluate({"event_type": "touch_event", "meta_data": {}}, mock_cache) is None
+
+
+@pytest.mark.asyncio
+async def test_evaluate_batch_matches_single_evaluation(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    events = [
+        {"event_type": "temperature_reading", "meta_data": {"temperature_c": value}}
+        for value in [75, 20, -30, None, "broken"]
+    ]
+
+    descriptions = await engine.evaluate_batch("temperature_reading", events, mock_cache)
+
+    assert descriptions == [
+        "High temperature detected: 75 C",
+        None,
+        "Low temperature detected: -30 C",
+        None,
+        None,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rules_hot_reload(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    event = {"event_type": "temperature_reading", "meta_data": {"temperature_c": 45}}
+    assert await engine.evaluate(event, mock_cache) is None
+
+    rules_file.write_text(json.dumps({
+        "rules": [{"event_type": "temperature_reading", "field": "temperature_c", "op": ">", "value": 40,
+                   "description": "Warm: {value}"}]
+    }))
+    stat = os.stat(rules_file)
+    os.utime(rules_file, (stat.st_atime, stat.st_mtime + 1))
+
+    assert await engine.evaluate(event, mock_cache) == "Warm: 45"
+
+
+@pytest.mark.asyncio
+async def test_missing_rules_file_is_retried_once_per_interval(tmp_path, mock_cache):
+    engine = RuleEngine(rules_file=str(tmp_path / "missing.json"), reload_interval=60)
+    event = {"event_type": "temperature_reading", "meta_data": {"temperature_c": 70}}
+
+    with patch.object(engine, "load", wraps=engine.load) as load:
+        for _ in range(100):
+            assert await engine.evaluate(event, mock_cache) is None
+    assert load.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_evaluate_batch_resolves_users_in_one_lookup(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    events = [{"event_type": "access_attempt", "meta_data": {"user_id": user_id}} for user_id in ["admin", "guest"]]
+
+    descriptions = await engine.evaluate_batch("access_attempt", events, mock_cache)
+
+    assert descriptions == [None, "user is not authorized to access"]
+    mock_cache.are_authorized_users.assert_called_once()
+    mock_cache.is_authorized_user.assert_not_called()
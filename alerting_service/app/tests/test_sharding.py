@@ -0,0 +1,66 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from config import config
+from services.consumer import ConsumerGroup
+from services.publisher import AsyncRabbitMQPublisher
+from services.sharding import SHARD_QUEUE_ARGUMENTS, assign_queues, ordered_delivery, queue_for, queue_names
+
+
+def test_queue_names_and_routing():
+    assert queue_names("events", 1) == ["events"]
+    assert queue_names("events", 3) == ["events.0", "events.1", "events.2"]
+    assert queue_for("events", "AA:BB:CC:DD:EE:FF", 1) == "events"
+    # The same device always maps to the same shard
+    shard = queue_for("events", "AA:BB:CC:DD:EE:FF", 8)
+    assert shard in queue_names("events", 8)
+    assert all(queue_for("events", "AA:BB:CC:DD:EE:FF", 8) == shard for _ in range(10))
+
+
+def test_assign_queues_covers_every_shard_once():
+    queues = queue_names("events", 8)
+    assigned = [assign_queues(queues, slot, 3) for slot in range(3)]
+    assert sorted(sum(assigned, [])) == sorted(queues)
+    # An unsharded queue is shared by all consumers
+    assert assign_queues(["events"], 2, 3) == ["events"]
+
+
+def test_consumer_group_assigns_shards_per_worker():
+    with patch.object(config, "RABBITMQ_SHARDS", 4), patch.object(config, "RABBITMQ_QUEUE", "events"):
+        group = ConsumerGroup(concurrency=2, worker_index=1, workers=2)
+
+    assert [consumer.queue_names for consumer in group.consumers] == [["events.2"], ["events.3"]]
+    assert all(consumer.arguments == SHARD_QUEUE_ARGUMENTS for consumer in group.consumers)
+    # Windows are snapshotted per shard, so a restarted worker gets back the windows of its own devices
+    assert group.snapshot_name == "events.2,events.3"
+
+
+def test_ordered_delivery_needs_shards():
+    with patch.object(config, "BROKER_TRANSPORT", "amqp"):
+        with patch.object(config, "RABBITMQ_SHARDS", 1):
+            assert not ordered_delivery()
+        with patch.object(config, "RABBITMQ_SHARDS", 4):
+            assert ordered_delivery()
+    with patch.object(config, "BROKER_TRANSPORT", "memory"), patch.object(config, "RABBITMQ_SHARDS", 1):
+        assert ordered_delivery()
+
+
+@pytest.mark.asyncio
+async def test_publisher_routes_devices_to_shards():
+    channel = MagicMock()
+    channel.is_closed = False
+    channel.declare_queue = AsyncMock()
+    channel.default_exchange.publish = AsyncMock()
+    devices = ["AA:BB:CC:DD:EE:%02X" % index for index in range(20)]
+
+    with patch.object(config, "RABBITMQ_QUEUE", "events"), \
+            patch("services.publisher.aio_pika.connect_robust", new_callable=AsyncMock) as mock_connect:
+        mock_connect.return_value.channel = AsyncMock(return_value=channel)
+        publisher = AsyncRabbitMQPublisher(pool_size=1, shards=4)
+        await publisher.connect()
+        await publisher.publish_batch([{"device_id": device_id, "event_type": "test"} for device_id in devices])
+
+    declared = [call.args[0] for call in channel.declare_queue.call_args_list]
+    assert declared == queue_names("events", 4)
+    assert all(call.kwargs["arguments"] == SHARD_QUEUE_ARGUMENTS for call in channel.declare_queue.call_args_list)
+    routing_keys = [call.kwargs["routing_key"] for call in channel.default_exchange.publish.call_args_list]
+    assert routing_keys == [queue_for("events", device_id, 4) for device_id in devices]
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from alerting_service.app.models import Alert
+from services.consumer import RabbitMQConsumer
+from services.transport import MemoryTransport, decode_payload
+
+EVENT = {
+    "device_id": "AA:BB:CC:DD:EE:FF",
+    "event_type": "speed_violation",
+    "meta_data": {"speed_kmh": 120},
+}
+
+
+@pytest.mark.asyncio
+async def test_memory_transport_hands_off_the_same_dict():
+    transport = MemoryTransport(max_size=10, prefetch=10)
+    received = []
+
+    async def callback(message):
+        async with message.process():
+            received.append(decode_payload(message))
+
+    await transport.publish(EVENT)
+    assert await transport.publish_batch([EVENT, EVENT]) == [None, None]
+    consume_task = asyncio.create_task(transport.consume(callback))
+    await asyncio.wait_for(transport.join(), 1)
+    consume_task.cancel()
+
+    assert len(received) == 3
+    assert received[0] is EVENT
+    assert transport.unacked == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_transport_is_bounded_and_requeues():
+    transport = MemoryTransport(max_size=1, prefetch=1)
+    await transport.publish(EVENT)
+    # The queue is full, the second publish waits for the consumer
+    blocked = asyncio.create_task(transport.publish({"event_type": "second"}))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    attempts = []
+
+    async def callback(message):
+        attempts.append(message.payload.get("event_type"))
+        if len(attempts) == 1:
+            await message.nack(requeue=True)
+        else:
+            await message.ack()
+
+    consume_task = asyncio.create_task(transport.consume(callback))
+    await asyncio.wait_for(blocked, 1)
+    await asyncio.wait_for(transport.join(), 1)
+    consume_task.cancel()
+
+    # The rejected message went to the back of the queue and was delivered again
+    assert attempts == ["speed_violation", "second", "speed_violation"]
+
+
+@pytest.mark.asyncio
+async def test_consumer_over_memory_transport():
+    transport = MemoryTransport(max_size=10, prefetch=10)
+    consumer = RabbitMQConsumer(transport=transport)
+    consumer.batch_mode = False
+    session = AsyncMock()
+    session.add = MagicMock()
+
+    with patch("services.consumer.AsyncSessionLocal", return_value=session):
+        await consumer.connect()
+        consume_task = asyncio.create_task(consumer.consume())
+        await transport.publish(EVENT)
+        await asyncio.wait_for(transport.join(), 1)
+        consume_task.cancel()
+
+    alert = session.add.call_args[0][0]
+    assert isinstance(alert, Alert)
+    assert alert.device_id == "AA:BB:CC:DD:EE:FF"
+    assert consumer.connection is None
@@ -0,0 +1,219 @@
+import json
+import math
+import pytest
+import time
+from unittest.mock import AsyncMock, MagicMock
+from services.cache import RedisCache
+from services.rules import RuleEngine
+from services.windows import SLIDING, TUMBLING, Aggregate, RingBuffer, WindowStore, event_time
+
+
+def at(second: int) -> str:
+    return f"2024-01-01T12:{second // 60:02d}:{second % 60:02d}"
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({
+        "rules": [
+            {"name": "access_burst", "event_type": "access_attempt", "field": "user_id", "op": "not_authorized",
+             "window": {"seconds": 60, "aggregate": "count", "op": ">=", "value": 3},
+             "description": "{count} unauthorized access attempts within 60 s"},
+            {"event_type": "access_attempt", "field": "user_id", "op": "not_authorized",
+             "description": "user is not authorized to access"},
+            {"name": "hot_minute", "event_type": "temperature_reading", "field": "temperature_c",
+             "window": {"kind": "tumbling", "seconds": 60, "aggregate": "avg", "op": ">", "value": 50},
+             "description": "Average temperature {avg} C over {count} readings"},
+            {"name": "motion_after_speeding", "event_type": "motion_detected", "field": "zone", "op": "==",
+             "value": "gate", "after": {"event_type": "speed_violation", "field": "location", "op": "==",
+                                        "value": "entrance", "seconds": 30},
+             "description": "Motion at the gate after a speed violation at the entrance"},
+        ]
+    }))
+    return path
+
+
+@pytest.fixture
+def mock_cache():
+    cache = AsyncMock()
+    cache.is_authorized_user = AsyncMock(side_effect=lambda user_id: user_id == "admin")
+    cache.are_authorized_users = AsyncMock(
+        side_effect=lambda user_ids: {user_id: user_id == "admin" for user_id in user_ids}
+    )
+    return cache
+
+
+def test_ring_buffer_overwrites_oldest_and_evicts():
+    buffer = RingBuffer(4)
+    for second in range(6):
+        aggregate = buffer.add(second, float(second), 10)
+    assert aggregate == Aggregate(4, 14.0, 3.5, 2.0, 5.0)
+
+    assert buffer.add(14, math.nan, 10) == Aggregate(2, 5.0, 5.0, 5.0, 5.0)
+    assert buffer.after(4, 5) and not buffer.after(6, 13)
+
+
+def test_tumbling_window_restarts():
+    store = WindowStore(capacity=8, idle_seconds=0, max_keys=10, snapshot_interval=0)
+    assert store.add("rule", "a", TUMBLING, 60, 0, 1.0).count == 1
+    assert store.add("rule", "a", TUMBLING, 60, 59, 3.0) == Aggregate(2, 4.0, 2.0, 1.0, 3.0)
+    assert store.add("rule", "a", TUMBLING, 60, 60, 5.0) == Aggregate(1, 5.0, 5.0, 5.0, 5.0)
+    # A late event of the closed window is dropped, and the current window is unchanged
+    assert store.add("rule", "a", TUMBLING, 60, 30, 7.0) is None
+    assert store.add("rule", "a", TUMBLING, 60, 61, 1.0) == Aggregate(2, 6.0, 3.0, 1.0, 5.0)
+
+
+def test_window_restarts_when_rule_changes_kind():
+    store = WindowStore(capacity=8, idle_seconds=0, max_keys=10, snapshot_interval=0)
+    store.add("rule", "a", SLIDING, 60, 0, 1.0)
+    store.add("rule", "b", SLIDING, 60, 0, 1.0)
+    store.add("other", "a", SLIDING, 60, 0, 1.0)
+
+    assert store.add("rule", "a", TUMBLING, 60, 10, 2.0) == Aggregate(1, 2.0, 2.0, 2.0, 2.0)
+    assert len(store) == 2
+    store.retain({"rule": (TUMBLING, 60.0), "other": (SLIDING, 30.0)})
+    assert len(store) == 1
+
+
+def test_store_evicts_idle_and_least_recently_used_keys():
+    store = WindowStore(capacity=8, idle_seconds=60, max_keys=2, snapshot_interval=0)
+    for key in ["a", "b", "c"]:
+        store.add("rule", key, SLIDING, 10, 0)
+    assert len(store) == 2 and not store.seen("rule", "a", 0, 0)
+
+    assert store.evict(now=time.time() + 61) == 2
+    assert len(store) == 0
+
+
+def test_snapshot_round_trip():
+    store = WindowStore(capacity=8, idle_seconds=3600, max_keys=10, snapshot_interval=30)
+    for second in [0, 5, 20]:
+        store.add("burst", "dev-1", SLIDING, 10, second, 1.0)
+    store.add("hot", "dev-1", TUMBLING, 60, 30, 70.0)
+
+    restored = WindowStore(capacity=8, idle_seconds=3600, max_keys=10, snapshot_interval=30)
+    assert restored.restore(store.snapshot()) == 2
+    # Only the event still inside the sliding window was kept
+    assert restored.add("burst", "dev-1", SLIDING, 10, 21, 1.0).count == 2
+    assert restored.add("hot", "dev-1", TUMBLING, 60, 40, 30.0) == Aggregate(2, 100.0, 50.0, 30.0, 70.0)
+
+
+@pytest.mark.asyncio
+async def test_snapshot_saved_to_redis():
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+
+    cache = RedisCache()
+    cache.redis = fakeredis.FakeRedis(decode_responses=True)
+    store = WindowStore(capacity=8, idle_seconds=3600, max_keys=10, snapshot_interval=30)
+    store.add("burst", "dev-1", SLIDING, 10, 0)
+    await store.save(cache, "3")
+
+    restored = WindowStore(capacity=8, idle_seconds=3600, max_keys=10, snapshot_interval=30)
+    await restored.load(cache, "3")
+    assert restored.seen("burst", "dev-1", 0, 0)
+    assert 0 < await cache.redis.ttl("window_snapshot:3") <= 3600
+
+
+@pytest.mark.asyncio
+async def test_snapshot_load_fails_open():
+    cache = RedisCache()
+    cache.redis = MagicMock()
+    cache.redis.get = AsyncMock(side_effect=ConnectionError("redis is down"))
+    store = WindowStore(capacity=8, idle_seconds=3600, max_keys=10, snapshot_interval=30)
+
+    await store.load(cache, "0")
+    assert len(store) == 0
+
+
+@pytest.mark.asyncio
+async def test_reload_resets_windows_of_changed_rules(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    reading = {"device_id": "dev-1", "event_type": "temperature_reading", "timestamp": at(10),
+               "meta_data": {"temperature_c": 70}}
+    assert await engine.evaluate(reading, mock_cache) == "Average temperature 70 C over 1 readings"
+
+    rules = json.loads(rules_file.read_text())
+    rules["rules"][2]["window"]["kind"] = "sliding"
+    rules_file.write_text(json.dumps(rules))
+    engine.load()
+    assert len(engine.windows) == 0
+    assert await engine.evaluate(reading, mock_cache) == "Average temperature 70 C over 1 readings"
+
+
+@pytest.mark.asyncio
+async def test_windowed_rules_skipped_without_ordered_delivery(rules_file, mock_cache, caplog):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0, ordered=False)
+    attempts = [
+        {"device_id": "door-1", "event_type": "access_attempt", "timestamp": at(second), "meta_data": {"user_id": "guest"}}
+        for second in [0, 10, 20]
+    ]
+    motion = {"device_id": "cam-1", "event_type": "motion_detected", "timestamp": at(5),
+              "meta_data": {"zone": "gate", "confidence": 0.5}}
+
+    # The plain rule keeps firing, the windowed and sequence rules are left out
+    assert [await engine.evaluate(event, mock_cache) for event in attempts] == ["user is not authorized to access"] * 3
+    assert await engine.evaluate(motion, mock_cache) is None
+    assert len(engine.windows) == 0
+    assert "RABBITMQ_SHARDS" in caplog.text
+
+
+def test_event_time():
+    assert event_time({"timestamp": "1970-01-01T00:01:00"}) == 60
+    assert event_time({"timestamp": "1970-01-01T01:01:00+01:00"}) == 60
+
+
+@pytest.mark.asyncio
+async def test_windowed_rule_counts_every_match(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    attempts = [
+        {"device_id": "door-1", "event_type": "access_attempt", "timestamp": at(second), "meta_data": {"user_id": user}}
+        for second, user in [(0, "guest"), (10, "admin"), (20, "guest"), (30, "guest"), (100, "guest")]
+    ]
+
+    descriptions = [await engine.evaluate(event, mock_cache) for event in attempts]
+
+    assert descriptions == [
+        "user is not authorized to access",
+        None,
+        "user is not authorized to access",
+        "3 unauthorized access attempts within 60 s",
+        "user is not authorized to access",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_windowed_rule_in_batch(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+    readings = [
+        {"device_id": "dev-1", "event_type": "temperature_reading", "timestamp": at(second),
+         "meta_data": {"temperature_c": value}}
+        for second, value in [(0, 40), (10, 70), (20, 60), (60, 20)]
+    ]
+
+    descriptions = await engine.evaluate_batch("temperature_reading", readings, mock_cache)
+
+    assert descriptions == [None, "Average temperature 55 C over 2 readings",
+                            "Average temperature 56.6667 C over 3 readings", None]
+
+
+@pytest.mark.asyncio
+async def test_sequence_rule(rules_file, mock_cache):
+    engine = RuleEngine(rules_file=str(rules_file), reload_interval=0)
+
+    def motion(second: int, zone: str = "gate") -> dict:
+        return {"device_id": "cam-1", "event_type": "motion_detected", "timestamp": at(second),
+                "meta_data": {"zone": zone, "confidence": 0.5}}
+
+    speeding = [{"device_id": "cam-2", "event_type": "speed_violation", "timestamp": at(second),
+                 "meta_data": {"speed_kmh": 80, "location": location}}
+                for second, location in [(10, "entrance"), (100, "exit")]]
+
+    # The speed violation is in the same batch but evaluated after the motion, as the consumer groups by type
+    engine.observe("speed_violation", speeding)
+    descriptions = await engine.evaluate_batch(
+        "motion_detected", [motion(5), motion(20), motion(25, "yard"), motion(45), motion(110)], mock_cache,
+        observed=True
+    )
+
+    assert descriptions == [None, "Motion at the gate after a speed violation at the entrance", None, None, None]
@@ -0,0 +1,73 @@
+"""
+Compare single-key RedisCache lookups against the bulk API at several batch sizes.
+
+Usage:
+    python -m benchmarks.bench_cache_batch --rounds 20
+    python -m benchmarks.bench_cache_batch --fake   # use fakeredis instead of REDIS_URL
+
+With --fake no network is involved, so the numbers only show client-side overhead.
+"""
+import argparse
+import asyncio
+import time
+from services.cache import RedisCache
+
+BATCH_SIZES = [1, 10, 100, 1000]
+
+
+def device_ids(count: int) -> list:
+    return ["AA:BB:CC:%02X:%02X:%02X" % (index >> 16 & 255, index >> 8 & 255, index & 255) for index in range(count)]
+
+
+async def timed(coroutine_factory, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await coroutine_factory()
+    return (time.perf_counter() - started) / rounds
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--fake", action="store_true", help="Use fakeredis as the Redis stand-in")
+    args = parser.parse_args()
+
+    cache = RedisCache()
+    cache.local_cache = None  # measure Redis round trips, not the in-process tier
+    if args.fake:
+        from fakeredis.aioredis import FakeRedis
+
+        cache.redis = FakeRedis(decode_responses=True)
+    else:
+        await cache.connect()
+
+    all_devices = device_ids(max(BATCH_SIZES))
+    await cache.add_sensors_if_absent({device_id: {"device_type": "speed_camera"} for device_id in all_devices})
+    for index in range(0, len(all_devices), 2):
+        await cache.add_authorized_user(f"user-{index}")
+
+    print(f"{'batch':>6}{'op':>12}{'single ms':>12}{'bulk ms':>10}{'speedup':>9}")
+    for size in BATCH_SIZES:
+        devices = all_devices[:size]
+        users = [f"user-{index}" for index in range(size)]
+
+        async def single_sensors():
+            for device_id in devices:
+                await cache.get_sensor(device_id)
+
+        async def single_users():
+            for user_id in users:
+                await cache.is_authorized_user(user_id)
+
+        rows = [
+            ("sensors", await timed(single_sensors, args.rounds), await timed(lambda: cache.get_sensors(devices), args.rounds)),
+            ("users", await timed(single_users, args.rounds), await timed(lambda: cache.are_authorized_users(users), args.rounds)),
+        ]
+        for op, single, bulk in rows:
+            print(f"{size:>6}{op:>12}{single * 1000:>12.3f}{bulk * 1000:>10.3f}{single / bulk:>8.1f}x")
+
+    await cache.disconnect()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
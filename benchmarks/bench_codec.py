@@ -0,0 +1,87 @@
+"""
+Compare the installed codecs on realistic event payloads, and the API response classes on a page of events.
+
+Usage:
+    python -m benchmarks.bench_codec --rounds 2000 --page-size 1000
+
+Runs in-process, no services needed.
+"""
+import argparse
+import base64
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from services.codec import CODECS, APIResponse
+
+
+def sample_events(count: int) -> list:
+    """
+    Broker messages shaped like the ones the ingestion service publishes.
+    """
+    rng = random.Random(42)
+    started = datetime(2024, 1, 1)
+    events = []
+    for index in range(count):
+        device_id = "AA:BB:CC:%02X:%02X:%02X" % (index >> 16 & 255, index >> 8 & 255, index & 255)
+        kind = index % 4
+        if kind == 0:
+            event_type, meta_data = "access_attempt", {"user_id": f"user-{rng.randint(1, 5000)}"}
+        elif kind == 1:
+            event_type = "speed_violation"
+            meta_data = {"speed_kmh": round(rng.uniform(40, 180), 1), "location": "Highway 1, km 42"}
+        elif kind == 2:
+            event_type = "motion_detected"
+            meta_data = {"zone": f"zone-{rng.randint(1, 20)}", "confidence": rng.random(),
+                         "uuid": "3f2b8c1e-6d3a-4b9e-9f7a-0c1d2e3f4a5b"}
+        else:
+            event_type = "temperature_reading"
+            meta_data = {"temperature_c": round(rng.uniform(-10, 60), 2), "unit": "C"}
+        events.append({
+            "device_id": device_id,
+            "timestamp": (started + timedelta(seconds=index)).isoformat(),
+            "event_type": event_type,
+            "meta_data": meta_data,
+        })
+    return events
+
+
+def timed(function, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - started) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=2000, help="Repetitions per single-message measurement")
+    parser.add_argument("--page-size", type=int, default=1000, help="Events per API response")
+    args = parser.parse_args()
+
+    events = sample_events(args.page_size)
+    # A motion event with a 200 KB photo, as received by the ingestion API
+    photo_event = dict(events[2], photo_base64=base64.b64encode(os.urandom(200 * 1024)).decode())
+
+    print(f"{'codec':>8}{'payload':>10}{'bytes':>9}{'encode us':>11}{'decode us':>11}")
+    for name, codec in CODECS.items():
+        for label, payload in [("event", events[1]), ("photo", photo_event)]:
+            body = codec.encode(payload)
+            rounds = args.rounds if label == "event" else max(1, args.rounds // 20)
+            encode = timed(lambda: codec.encode(payload), rounds)
+            decode = timed(lambda: codec.decode(body), rounds)
+            print(f"{name:>8}{label:>10}{len(body):>9}{encode:>11.2f}{decode:>11.2f}")
+
+    page = {"events": events, "next_cursor": None}
+    rounds = max(1, args.rounds // 100)
+    default = timed(lambda: JSONResponse(jsonable_encoder(page)), rounds)
+    direct = timed(lambda: APIResponse(page), rounds)
+    print(f"\nresponse with {args.page_size} events:")
+    print(f"  JSONResponse + jsonable_encoder: {default / 1000:8.2f} ms")
+    print(f"  {APIResponse.__name__} without encoder: {direct / 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure event-loop lag while alerts are committed concurrently, once through the
+blocking SessionLocal (the old code path) and once through AsyncSessionLocal.
+
+Usage:
+    python -m benchmarks.bench_event_loop_lag --writes 2000 --concurrency 50
+
+Runs against DATABASE_URL and creates the tables if they are missing.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+from alerting_service.app.models import Alert
+from services.db import SessionLocal, AsyncSessionLocal, init_db
+
+
+class LagMonitor:
+    def __init__(self, interval: float = 0.005):
+        """
+        Sample how late a periodic timer fires while the loop is busy.
+
+        :param interval: Sleep interval of the probe in seconds.
+        """
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _probe(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(time.perf_counter() - started - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._probe())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def summary(self) -> dict:
+        samples = sorted(self.samples) or [0.0]
+        return {
+            "mean_ms": statistics.mean(samples) * 1000,
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+def new_alert(index: int) -> Alert:
+    return Alert(
+        event_type="speed_violation",
+        description=f"Speed violation detected: {100 + index % 50} km/h",
+        meta_data={"speed_kmh": 100 + index % 50, "location": "Highway 1"},
+        created_at=datetime.now(),
+    )
+
+
+async def run_sync_sessions(total: int, concurrency: int):
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            session = SessionLocal()
+            try:
+                session.add(new_alert(index))
+                session.commit()
+            finally:
+                session.close()
+            await asyncio.sleep(0)
+
+    return await measure(worker, total, concurrency)
+
+
+async def run_async_sessions(total: int, concurrency: int):
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            async with AsyncSessionLocal() as session:
+                session.add(new_alert(index))
+                await session.commit()
+
+    return await measure(worker, total, concurrency)
+
+
+async def measure(worker, total: int, concurrency: int):
+    monitor = LagMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    return total / elapsed, monitor.summary()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    init_db()
+    results = {
+        "sync session (before)": await run_sync_sessions(args.writes, args.concurrency),
+        "async session (after)": await run_async_sessions(args.writes, args.concurrency),
+    }
+
+    print(f"{'mode':<24}{'commits/sec':>12}{'lag mean ms':>14}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for mode, (rate, lag) in results.items():
+        print(f"{mode:<24}{rate:>12.1f}{lag['mean_ms']:>14.2f}{lag['p99_ms']:>12.2f}{lag['max_ms']:>12.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
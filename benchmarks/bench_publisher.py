@@ -0,0 +1,81 @@
+"""
+Compare publish throughput of a per-request RabbitMQ connection against the pooled async publisher.
+
+Usage:
+    python -m benchmarks.bench_publisher --requests 2000 --concurrency 50
+
+Requires a reachable broker at RABBITMQ_URL and a RABBITMQ_QUEUE name.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from services.publisher import RabbitMQPublisher, AsyncRabbitMQPublisher
+
+
+def sample_event(index: int) -> dict:
+    return {
+        "device_id": "AA:BB:CC:DD:EE:%02X" % (index % 256),
+        "event_type": "speed_violation",
+        "meta_data": {"speed_kmh": 80 + index % 60, "location": "Highway 1"},
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+async def run_per_request(total: int, concurrency: int) -> float:
+    """
+    Mimic the old handler: connect, publish and close inside the coroutine for every request.
+    """
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            publisher = RabbitMQPublisher()
+            publisher.connect()
+            try:
+                publisher.publish(sample_event(index))
+            finally:
+                publisher.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+async def run_pooled(total: int, concurrency: int) -> float:
+    """
+    Publish through one long-lived pool, the way the ingestion lifespan sets it up.
+    """
+    publisher = AsyncRabbitMQPublisher()
+    await publisher.connect()
+    counter = iter(range(total))
+
+    async def worker():
+        for index in counter:
+            await publisher.publish(sample_event(index))
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+    finally:
+        await publisher.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    per_request = await run_per_request(args.requests, args.concurrency)
+    pooled = await run_pooled(args.requests, args.concurrency)
+
+    print(f"{'mode':<24}{'requests/sec':>14}")
+    print(f"{'connect per request':<24}{per_request:>14.1f}")
+    print(f"{'pooled + batch confirms':<24}{pooled:>14.1f}")
+    print(f"speedup: {pooled / per_request:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
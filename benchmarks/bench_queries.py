@@ -0,0 +1,138 @@
+"""
+Show how the get_events/get_alerts queries are planned with and without the indexes from migration 0002.
+
+Usage:
+    python -m benchmarks.bench_queries --rows 10000000
+
+Needs a PostgreSQL database at DATABASE_URL that is migrated to head (alembic upgrade head).
+The generated rows stay in the tables unless --cleanup is passed, so use a scratch database.
+"""
+import argparse
+import json
+import time
+from sqlalchemy import text
+from alerting_service.app.models import Alert
+from ingestion_service.app.models import Event
+from services.db import engine
+
+GENERATE_EVENTS = text("""
+    INSERT INTO events (device_id, timestamp, event_type, meta_data)
+    SELECT
+        'AA:BB:CC:' || lpad(to_hex(n % 65536 / 256), 2, '0') || ':' || lpad(to_hex(n % 256), 2, '0') || ':00',
+        TIMESTAMP '2024-01-01' + (n * INTERVAL '3 seconds'),
+        (ARRAY['access_attempt', 'speed_violation', 'motion_detected', 'temperature_reading', 'gas_leak_detected'])[n % 5 + 1],
+        jsonb_build_object('device_type', (ARRAY['access_controller', 'speed_camera', 'motion_sensor'])[n % 3 + 1],
+                           'value', n % 1000)
+    FROM generate_series(:first, :last) AS n
+""")
+
+GENERATE_ALERTS = text("""
+    INSERT INTO alerts (device_id, event_type, description, meta_data, created_at)
+    SELECT
+        'AA:BB:CC:' || lpad(to_hex(n % 65536 / 256), 2, '0') || ':' || lpad(to_hex(n % 256), 2, '0') || ':00',
+        (ARRAY['access_attempt', 'speed_violation', 'motion_detected', 'temperature_reading', 'gas_leak_detected'])[n % 5 + 1],
+        'generated alert',
+        jsonb_build_object('value', n % 1000),
+        TIMESTAMP '2024-01-01' + (n * INTERVAL '30 seconds')
+    FROM generate_series(:first, :last) AS n
+""")
+
+# The statements the endpoints send for a typical dashboard request (first page, limit 100)
+QUERIES = {
+    "events by time range": (
+        "SELECT * FROM events WHERE timestamp >= :start AND timestamp <= :end ORDER BY timestamp, id LIMIT 101",
+        {"start": "2024-06-01", "end": "2024-06-08"},
+    ),
+    "events by type + time": (
+        "SELECT * FROM events WHERE event_type = :event_type AND timestamp >= :start "
+        "ORDER BY timestamp, id LIMIT 101",
+        {"event_type": "gas_leak_detected", "start": "2024-06-01"},
+    ),
+    "events by device": (
+        "SELECT * FROM events WHERE device_id = :device_id ORDER BY timestamp, id LIMIT 101",
+        {"device_id": "AA:BB:CC:01:02:00"},
+    ),
+    "events by device_type": (
+        "SELECT * FROM events WHERE meta_data @> CAST(:predicate AS jsonb) ORDER BY timestamp, id LIMIT 101",
+        {"predicate": json.dumps({"device_type": "speed_camera"})},
+    ),
+    "alerts by type + time": (
+        "SELECT * FROM alerts WHERE event_type = :event_type AND created_at >= :start "
+        "ORDER BY created_at, id LIMIT 101",
+        {"event_type": "speed_violation", "start": "2024-03-01"},
+    ),
+    "alerts by device": (
+        "SELECT * FROM alerts WHERE device_id = :device_id ORDER BY created_at, id LIMIT 101",
+        {"device_id": "AA:BB:CC:01:02:00"},
+    ),
+}
+
+
+def generate(rows: int, chunk: int = 1_000_000):
+    with engine.begin() as connection:
+        existing = connection.execute(text("SELECT count(*) FROM events")).scalar()
+    for first in range(existing + 1, rows + 1, chunk):
+        last = min(first + chunk - 1, rows)
+        with engine.begin() as connection:
+            connection.execute(GENERATE_EVENTS, {"first": first, "last": last})
+            # One alert for every ten events
+            connection.execute(GENERATE_ALERTS, {"first": first // 10 + 1, "last": last // 10})
+        print(f"generated events up to {last}")
+
+
+def plan_nodes(plan: dict) -> list:
+    nodes = [plan["Node Type"] + (f" ({plan['Index Name']})" if "Index Name" in plan else "")]
+    for child in plan.get("Plans", []):
+        nodes += plan_nodes(child)
+    return nodes
+
+
+def explain_all() -> dict:
+    results = {}
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE events"))
+        connection.execute(text("ANALYZE alerts"))
+        for name, (sql, params) in QUERIES.items():
+            plan = connection.execute(text("EXPLAIN (ANALYZE, FORMAT JSON) " + sql), params).scalar()[0]
+            results[name] = (plan["Execution Time"], " > ".join(plan_nodes(plan["Plan"])))
+    return results
+
+
+def set_indexes(create: bool):
+    with engine.begin() as connection:
+        for index in list(Event.__table__.indexes) + list(Alert.__table__.indexes):
+            if index.name == "ix_events_id":
+                continue
+            if create:
+                index.create(connection, checkfirst=True)
+            else:
+                index.drop(connection, checkfirst=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--cleanup", action="store_true", help="Truncate events and alerts afterwards")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    generate(args.rows)
+    print(f"dataset ready in {time.perf_counter() - started:.0f}s")
+
+    set_indexes(create=False)
+    before = explain_all()
+    set_indexes(create=True)
+    after = explain_all()
+
+    for name in QUERIES:
+        print(f"\n{name}")
+        print(f"  before: {before[name][0]:>10.2f} ms  {before[name][1]}")
+        print(f"  after:  {after[name][0]:>10.2f} ms  {after[name][1]}")
+
+    if args.cleanup:
+        with engine.begin() as connection:
+            connection.execute(text("TRUNCATE events, alerts"))
+
+
+if __name__ == "__main__":
+    main()
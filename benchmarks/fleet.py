@@ -0,0 +1,150 @@
+"""
+Device fleet load generator: request bodies for /api/events/ shaped like real traffic.
+
+Used by bench_end_to_end, and usable on its own to dump sample payloads:
+    python -m benchmarks.fleet --devices 1000 --events 5
+"""
+import argparse
+import base64
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Sequence, Tuple
+from ingestion_service.app.api.event_schemas import EVENT_SCHEMAS, BaseEvent
+
+# Share of each event type in the traffic of a typical site
+DEFAULT_MIX = {"access_attempt": 0.5, "speed_violation": 0.35, "motion_detected": 0.15}
+
+# Photo sizes in bytes with their weights: thumbnails, camera snapshots and the odd full frame
+DEFAULT_PHOTO_SIZES = ((20 * 1024, 0.6), (200 * 1024, 0.3), (1024 * 1024, 0.1))
+
+
+def parse_weights(value: str, cast=str) -> Dict:
+    """
+    Parse "access_attempt=0.5,speed_violation=0.5" into a mapping of key to weight.
+    """
+    weights = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, weight = item.split("=", 1)
+            weights[cast(key.strip())] = float(weight)
+    return weights
+
+
+class DeviceFleet:
+    def __init__(self, devices: int = 1000, mix: Dict[str, float] = None,
+                 photo_sizes: Sequence[Tuple[int, float]] = DEFAULT_PHOTO_SIZES,
+                 users: int = 5000, unauthorized_share: float = 0.05, speeding_share: float = 0.2,
+                 seed: int = 42):
+        """
+        A fleet of devices, each bound to the event type its sensor produces, sending events in a
+        fixed mix. Photos are random bytes, so they do not compress and the store sees real sizes.
+
+        :param devices: Number of distinct MAC addresses.
+        :param mix: Event type to share of the traffic, DEFAULT_MIX if omitted.
+        :param photo_sizes: (size in bytes, weight) pairs of motion photos.
+        :param users: Number of distinct user ids in access attempts.
+        :param unauthorized_share: Share of access attempts by users that are not authorized.
+        :param speeding_share: Share of speed readings above the alert threshold.
+        :param seed: Seed of the generator, the same seed produces the same traffic.
+        """
+        self.mix = mix or DEFAULT_MIX
+        self.rng = random.Random(seed)
+        self.users = users
+        self.unauthorized_share = unauthorized_share
+        self.speeding_share = speeding_share
+        self.photo_sizes = [size for size, _ in photo_sizes]
+        self.photo_weights = [weight for _, weight in photo_sizes]
+        self.started = datetime(2024, 1, 1)
+        self.sent = 0
+
+        event_types = list(self.mix)
+        weights = [self.mix[event_type] for event_type in event_types]
+        self.devices: List[Tuple[str, str]] = [
+            ("AA:BB:%02X:%02X:%02X:%02X" % (index >> 24 & 255, index >> 16 & 255, index >> 8 & 255, index & 255),
+             event_type)
+            for index, event_type in enumerate(self.rng.choices(event_types, weights, k=devices))
+        ]
+        self.devices_by_type: Dict[str, List[str]] = {}
+        for device_id, event_type in self.devices:
+            self.devices_by_type.setdefault(event_type, []).append(device_id)
+        # A few photos are generated once and reused, random bytes are slow to produce
+        self._photos = {size: [base64.b64encode(os.urandom(size)).decode() for _ in range(4)]
+                        for size in self.photo_sizes}
+
+    def authorized_users(self) -> List[str]:
+        """
+        The users to register as authorized, the rest of the user ids trigger alerts.
+        """
+        return [f"user-{index}" for index in range(int(self.users * (1 - self.unauthorized_share)))]
+
+    def next_event(self) -> dict:
+        """
+        Build the JSON body of the next event.
+        """
+        rng = self.rng
+        event_type = rng.choices(list(self.devices_by_type), [self.mix[name] for name in self.devices_by_type])[0]
+        event = {
+            "device_id": rng.choice(self.devices_by_type[event_type]),
+            "timestamp": (self.started + timedelta(milliseconds=self.sent * 10)).isoformat(),
+            "event_type": event_type,
+        }
+        self.sent += 1
+
+        if event_type == "access_attempt":
+            event["user_id"] = f"user-{rng.randrange(self.users)}"
+        elif event_type == "speed_violation":
+            speeding = rng.random() < self.speeding_share
+            event["speed_kmh"] = rng.randint(101, 180) if speeding else rng.randint(30, 100)
+            event["location"] = f"Highway {rng.randint(1, 20)}, km {rng.randint(1, 300)}"
+        elif event_type == "motion_detected":
+            size = rng.choices(self.photo_sizes, self.photo_weights)[0]
+            event["zone"] = f"zone-{rng.randint(1, 50)}"
+            event["confidence"] = round(rng.random(), 3)
+            event["photo_base64"] = rng.choice(self._photos[size])
+        else:
+            self.fill_readings(event)
+        return event
+
+    def fill_readings(self, event: dict):
+        """
+        Random values for the required fields of the other sensor types, taken from their schema.
+        """
+        rng = self.rng
+        schema = EVENT_SCHEMAS.get(event["event_type"])
+        if schema is None:
+            return
+        for name, field in schema.model_fields.items():
+            if name in BaseEvent.model_fields or not field.is_required():
+                continue
+            if name == "photo_base64":
+                event[name] = rng.choice(self._photos[rng.choices(self.photo_sizes, self.photo_weights)[0]])
+            elif field.annotation is float:
+                event[name] = round(rng.uniform(0, 100), 2)
+            elif field.annotation is int:
+                event[name] = rng.randint(0, 100)
+            else:
+                event[name] = f"{name}-{rng.randint(1, 50)}"
+
+    def events(self, count: int) -> Iterator[dict]:
+        for _ in range(count):
+            yield self.next_event()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    fleet = DeviceFleet(args.devices, seed=args.seed)
+    for event in fleet.events(args.events):
+        if "photo_base64" in event:
+            event["photo_base64"] = f"<{len(event['photo_base64'])} base64 characters>"
+        print(json.dumps(event))
+
+
+if __name__ == "__main__":
+    main()
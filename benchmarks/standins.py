@@ -0,0 +1,197 @@
+"""
+Local replacements for RabbitMQ and Redis, so the services can be benchmarked in one process.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from services.codec import broker_codec
+from services.metrics import PUBLISHED_AT_HEADER
+from services.transport import MemoryTransport
+
+
+class BrokerMessage:
+    __slots__ = ("broker", "body", "content_type", "headers", "delivery_tag", "published")
+
+    def __init__(self, broker, body: bytes, content_type: str, delivery_tag: int):
+        """
+        The parts of aio_pika.IncomingMessage the consumer uses.
+        """
+        self.broker = broker
+        self.body = body
+        self.content_type = content_type
+        self.headers = {PUBLISHED_AT_HEADER: time.time()}
+        self.delivery_tag = delivery_tag
+        self.published = time.perf_counter()
+
+    @asynccontextmanager
+    async def process(self):
+        try:
+            yield self
+        except Exception:
+            await self.reject()
+            raise
+        await self.ack()
+
+    async def ack(self, multiple: bool = False):
+        self.broker.settle(self, multiple, requeue=False)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.broker.settle(self, multiple, requeue=requeue, failed=True)
+
+    async def reject(self, requeue: bool = False):
+        self.broker.settle(self, False, requeue=requeue, failed=True)
+
+
+class InProcessBroker:
+    def __init__(self, codec=None):
+        """
+        A single unbounded queue with the publish API of AsyncRabbitMQPublisher and
+        acknowledgements like a RabbitMQ channel. Messages are encoded with the broker codec,
+        so serialization costs the same as with a real broker.
+        Acknowledged messages record their end-to-end latency in `latencies`.
+        """
+        self.codec = codec or broker_codec
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.latencies: List[float] = []
+        self.published = 0
+        self.failed = 0
+        self._unacked: Dict[int, BrokerMessage] = {}
+        self._next_tag = 1
+        self._settled = asyncio.Event()
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def _put(self, message: dict):
+        body = BrokerMessage(self, self.codec.encode(message), self.codec.content_type, self._next_tag)
+        self._next_tag += 1
+        self.published += 1
+        self.queue.put_nowait(body)
+
+    async def publish(self, message: dict):
+        self._put(message)
+
+    async def publish_batch(self, messages: list):
+        for message in messages:
+            self._put(message)
+        return [None] * len(messages)
+
+    async def get(self, prefetch: int = 0) -> BrokerMessage:
+        """
+        Take the next message, waiting while `prefetch` messages are unacknowledged like basic.qos does.
+        """
+        while prefetch and len(self._unacked) >= prefetch:
+            self._settled.clear()
+            await self._settled.wait()
+        message = await self.queue.get()
+        self._unacked[message.delivery_tag] = message
+        return message
+
+    def settle(self, message: BrokerMessage, multiple: bool, requeue: bool, failed: bool = False):
+        tags = [tag for tag in self._unacked if tag <= message.delivery_tag] if multiple else [message.delivery_tag]
+        now = time.perf_counter()
+        for tag in tags:
+            settled = self._unacked.pop(tag, None)
+            if settled is None:
+                continue
+            self.queue.task_done()
+            if failed and requeue:
+                settled.delivery_tag = self._next_tag
+                self._next_tag += 1
+                self.queue.put_nowait(settled)
+            elif failed:
+                self.failed += 1
+            else:
+                self.latencies.append(now - settled.published)
+        self._settled.set()
+
+    @property
+    def unacked(self) -> int:
+        return len(self._unacked)
+
+
+class TimedMemoryTransport(MemoryTransport):
+    """
+    The in-process transport of the services, recording end-to-end latencies like InProcessBroker.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies: List[float] = []
+        self.published = 0
+        self.failed = 0
+
+    async def publish(self, message: dict):
+        self.published += 1
+        await super().publish(message)
+
+    async def publish_batch(self, messages: list):
+        self.published += len(messages)
+        return await super().publish_batch(messages)
+
+    def settle(self, message, multiple: bool, failed: bool = False, requeue: bool = False):
+        tags = [tag for tag in self._unacked if tag <= message.delivery_tag] if multiple else [message.delivery_tag]
+        now = time.time()
+        for tag in tags:
+            settled = self._unacked.get(tag)
+            if settled is None:
+                continue
+            if not failed:
+                self.latencies.append(now - settled.headers[PUBLISHED_AT_HEADER])
+            elif not requeue:
+                self.failed += 1
+        super().settle(message, multiple, failed, requeue)
+
+
+async def consume(broker: InProcessBroker, callback, prefetch: int = 0):
+    """
+    Deliver messages to a RabbitMQConsumer callback until cancelled.
+    Callbacks are started as tasks like aio_pika does, so batch mode sees several messages at once.
+    """
+    tasks = set()
+    try:
+        while True:
+            message = await broker.get(prefetch)
+            task = asyncio.create_task(callback(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def use_fake_redis(*caches):
+    """
+    Point RedisCache instances at one shared fakeredis server instead of REDIS_URL.
+    """
+    from fakeredis import FakeServer
+    from fakeredis.aioredis import FakeRedis
+
+    server = FakeServer()
+    for cache in caches:
+        cache.redis = FakeRedis(server=server, decode_responses=True)
+    return caches[0].redis
+
+
+def tune_sqlite(*engines):
+    """
+    Use WAL and a longer busy timeout on SQLite, so concurrent writers wait for each other instead of
+    failing with "database is locked". Other databases are left alone.
+    """
+    from sqlalchemy import event
+
+    for engine in engines:
+        if engine.url.get_backend_name() != "sqlite":
+            continue
+
+        @event.listens_for(engine, "connect")
+        def set_pragmas(connection, _):
+            cursor = connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout=30000")
+            cursor.close()
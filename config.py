@@ -6,10 +6,75 @@ load_dotenv()
 
 class Config:
     DATABASE_URL = os.getenv("DATABASE_URL")
+    ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_PARTITION_INTERVAL = os.getenv("DB_PARTITION_INTERVAL", "")  # "", "day" or "week"
+    DB_PARTITION_PRECREATE = int(os.getenv("DB_PARTITION_PRECREATE", "7"))
+    DB_RETENTION_DAYS = int(os.getenv("DB_RETENTION_DAYS", "0"))  # 0 keeps every partition
+    DB_RETENTION_MODE = os.getenv("DB_RETENTION_MODE", "drop")  # "drop" or "detach"
+    DB_PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("DB_PARTITION_MAINTENANCE_INTERVAL", "3600"))
     REDIS_URL = os.getenv("REDIS_URL")
+    CACHE_L1_ENABLED = os.getenv("CACHE_L1_ENABLED", "False").lower() in ["true", "1", "yes"]
+    CACHE_L1_MAX_SIZE = int(os.getenv("CACHE_L1_MAX_SIZE", "10000"))
+    CACHE_L1_TTL_SECONDS = float(os.getenv("CACHE_L1_TTL_SECONDS", "300"))
+    CACHE_L1_NEGATIVE_TTL_SECONDS = float(os.getenv("CACHE_L1_NEGATIVE_TTL_SECONDS", "30"))
     RABBITMQ_URL = os.getenv("RABBITMQ_URL")
     RABBITMQ_QUEUE = os.getenv("RABBITMQ_QUEUE")
+    RABBITMQ_PUBLISHER_CONNECTIONS = int(os.getenv("RABBITMQ_PUBLISHER_CONNECTIONS", "1"))
+    RABBITMQ_PUBLISHER_POOL_SIZE = int(os.getenv("RABBITMQ_PUBLISHER_POOL_SIZE", "4"))
+    RABBITMQ_CONFIRM_BATCH_SIZE = int(os.getenv("RABBITMQ_CONFIRM_BATCH_SIZE", "100"))
+    RABBITMQ_CONFIRM_FLUSH_MS = int(os.getenv("RABBITMQ_CONFIRM_FLUSH_MS", "5"))
+    BROKER_CODEC = os.getenv("BROKER_CODEC", "orjson")  # "json", "orjson" or "msgpack"
+    CACHE_CODEC = os.getenv("CACHE_CODEC", "orjson")  # "json" or "orjson"
+    RABBITMQ_PREFETCH_COUNT = int(os.getenv("RABBITMQ_PREFETCH_COUNT", "200"))
+    BROKER_TRANSPORT = os.getenv("BROKER_TRANSPORT", "amqp")  # "amqp" or "memory"
+    MEMORY_TRANSPORT_MAX_SIZE = int(os.getenv("MEMORY_TRANSPORT_MAX_SIZE", "10000"))
+    EMBED_CONSUMER = os.getenv("EMBED_CONSUMER", "False").lower() in ["true", "1", "yes"]
+    CONSUMER_BATCH_MODE = os.getenv("CONSUMER_BATCH_MODE", "False").lower() in ["true", "1", "yes"]
+    CONSUMER_BATCH_SIZE = int(os.getenv("CONSUMER_BATCH_SIZE", "100"))
+    CONSUMER_FLUSH_INTERVAL_MS = int(os.getenv("CONSUMER_FLUSH_INTERVAL_MS", "50"))
+    CONSUMER_CONCURRENCY = int(os.getenv("CONSUMER_CONCURRENCY", "1"))
+    CONSUMER_WORKERS = int(os.getenv("CONSUMER_WORKERS", "1"))
+    ALERTING_CONSUMER_ENABLED = os.getenv("ALERTING_CONSUMER_ENABLED", "True").lower() in ["true", "1", "yes"]
+    RABBITMQ_SHARDS = int(os.getenv("RABBITMQ_SHARDS", "1"))
+    ALERT_RULES_FILE = os.getenv("ALERT_RULES_FILE")
+    ALERT_RULES_RELOAD_INTERVAL = float(os.getenv("ALERT_RULES_RELOAD_INTERVAL", "5"))
+    ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "60"))  # 0 stores every alert
+    ALERT_COOLDOWNS = os.getenv("ALERT_COOLDOWNS", "")  # per event type, e.g. "motion_detected=30,speed_violation=300"
+    ALERT_COOLDOWN_MAX_SECONDS = float(os.getenv("ALERT_COOLDOWN_MAX_SECONDS", "600"))
+    WINDOW_BUFFER_SIZE = int(os.getenv("WINDOW_BUFFER_SIZE", "1024"))  # events per sliding window and key
+    WINDOW_IDLE_SECONDS = float(os.getenv("WINDOW_IDLE_SECONDS", "3600"))
+    WINDOW_MAX_KEYS = int(os.getenv("WINDOW_MAX_KEYS", "100000"))
+    WINDOW_SNAPSHOT_INTERVAL = float(os.getenv("WINDOW_SNAPSHOT_INTERVAL", "30"))  # 0 disables snapshots
+    PHOTO_STORE_BACKEND = os.getenv("PHOTO_STORE_BACKEND", "local")
+    PHOTO_STORE_PATH = os.getenv("PHOTO_STORE_PATH", "photo_store")
+    PHOTO_STREAM_CHUNK_SIZE = int(os.getenv("PHOTO_STREAM_CHUNK_SIZE", str(64 * 1024)))
+    PHOTO_POOL_KIND = os.getenv("PHOTO_POOL_KIND", "thread")  # "thread" or "process"
+    PHOTO_POOL_WORKERS = int(os.getenv("PHOTO_POOL_WORKERS", "0"))  # 0 uses one worker per CPU
+    PHOTO_MAX_BYTES = int(os.getenv("PHOTO_MAX_BYTES", str(10 * 1024 * 1024)))
+    PHOTO_THUMBNAIL_SIZE = int(os.getenv("PHOTO_THUMBNAIL_SIZE", "160"))
+    INGESTION_MAX_BATCH_SIZE = int(os.getenv("INGESTION_MAX_BATCH_SIZE", "1000"))
+    ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "200"))  # 0 disables the limit
+    ADMISSION_LATENCY_TARGET_MS = float(os.getenv("ADMISSION_LATENCY_TARGET_MS", "250"))
+    ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "5000"))
+    ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+    DEVICE_RATE_LIMIT = float(os.getenv("DEVICE_RATE_LIMIT", "0"))  # events per second, 0 disables it
+    DEVICE_RATE_BURST = int(os.getenv("DEVICE_RATE_BURST", "20"))
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "True").lower() in ["true", "1", "yes"]
+    DEDUP_TTL = int(os.getenv("DEDUP_TTL", "3600"))
+    DEDUP_FILTER_CAPACITY = int(os.getenv("DEDUP_FILTER_CAPACITY", "1000000"))
+    DEDUP_ERROR_RATE = float(os.getenv("DEDUP_ERROR_RATE", "0.000001"))
+    ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "True").lower() in ["true", "1", "yes"]
+    ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "5"))
+    ROLLUP_MAX_PENDING = int(os.getenv("ROLLUP_MAX_PENDING", "10000"))
+    STATS_MAX_POINTS = int(os.getenv("STATS_MAX_POINTS", "10000"))
     DEBUG = os.getenv("DEBUG", "False").lower() in ["true", "1", "yes"]
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # per module, e.g. "services.cache=WARNING,aio_pika=ERROR"
+    LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "20"))  # records per second per log line, 0 disables
+    LOG_MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "2000"))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
     ALERT_LOG_FILE = os.getenv("ALERT_LOG_FILE")
 
 
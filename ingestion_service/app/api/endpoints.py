@@ -1,21 +1,49 @@
 import logging
 from datetime import datetime
 import uuid
-import base64
-from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import Union
-from .event_schemas import AccessAttempEvent, SpeedViolationEvent, MotionDetectedEvent
+from fastapi import APIRouter, Body, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, select, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from pydantic import TypeAdapter, ValidationError
+from typing import Any, List
+from .event_schemas import AnyEvent, PhotoEvent
 from .validation import validate_mac
 from ..models import Event, Photo
-from services.db import get_db
+from services.admission import AdmissionController, DeviceRateLimiter
+from services.db import get_db, get_async_db
+from services.dedup import DuplicateFilter, event_key
 from services.cache import RedisCache
-from services.publisher import RabbitMQPublisher
+from services.codec import APIResponse
+from services.metrics import (
+    ADMISSION_LIMIT, ADMISSION_REJECTED_TOTAL, CACHE_L1_STATS, EVENTS_TOTAL, INFLIGHT, PHOTO_POOL_TASKS,
+    PHOTO_POOL_WORKERS, REDIS_POOL_CONNECTIONS, StageTimer
+)
+from services.photo_processing import InvalidPhoto, PhotoProcessor
+from services.photo_store import get_photo_store
+from services.rollups import RollupAggregator
+from services.transport import create_publisher
+from services.pagination import NDJSON_MEDIA_TYPE, apply_keyset, paginate, stream_ndjson, wants_ndjson
+from config import config
 
 # Initialize router, services, and logging
 events_router = APIRouter()
 redis_cache = RedisCache()
+rabbitmq_publisher = create_publisher()
+rollup_aggregator = RollupAggregator("events")
+admission_controller = AdmissionController(queue_depth=lambda: rabbitmq_publisher.backlog)
+device_rate_limiter = DeviceRateLimiter()
+photo_processor = PhotoProcessor()
+duplicate_filter = DuplicateFilter()
+REDIS_POOL_CONNECTIONS.set_function(redis_cache.pool_connections)
+CACHE_L1_STATS.set_function(redis_cache.cache_metrics)
+ADMISSION_LIMIT.set_function(lambda: {(): admission_controller.limit})
+PHOTO_POOL_TASKS.set_function(photo_processor.pool_tasks)
+PHOTO_POOL_WORKERS.set(photo_processor.workers)
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+# Validates one batch item against the schema of its event type
+event_adapter = TypeAdapter(AnyEvent)
 
 # Mapping event types to sensor types
 event_to_sensor_type = {
@@ -42,17 +70,38 @@ event_to_sensor_type = {
     "ultrasonic_distance_measured": "ultrasonic_sensor",
 }
 
-@events_router.post("/")
+@events_router.post("/", dependencies=[Depends(admission_controller.admit)])
 async def create_event(
-    event: Union[AccessAttempEvent, SpeedViolationEvent, MotionDetectedEvent],
-    db=Depends(get_db),
+    event: AnyEvent,
+    db=Depends(get_async_db),
 ):
     """
     Create a new event and publish it to RabbitMQ.
+    A retry of an event that was already stored and published is answered with "duplicate": true and not
+    stored again. An event that fails to be published is removed again, so a retry after the 500 goes through.
     """
+    if device_rate_limiter.enabled:
+        granted, retry_after = (await device_rate_limiter.acquire(redis_cache, {event.device_id: 1}))[event.device_id]
+        if not granted:
+            raise admission_controller.reject("device_rate", retry_after)
+    if isinstance(event, PhotoEvent) and photo_processor.too_large(event.photo_base64):
+        raise HTTPException(status_code=413, detail=f"Photo too large, at most {photo_processor.max_bytes} bytes")
+
+    timer = StageTimer("create_event")
+    inflight = INFLIGHT.labels("create_event")
+    inflight.inc()
+    key = event_key(event.device_id, event.event_type, event.timestamp, event.event_id)
+    claimed = stored = published = False
+    photo_uuid = None
     try:
         if not validate_mac(event.device_id):
             raise HTTPException(status_code=400, detail="Invalid MAC address")
+        timer.lap("validate")
+
+        claimed = (await duplicate_filter.claim(redis_cache, [key]))[0]
+        timer.lap("dedup")
+        if not claimed:
+            return {"message": "Duplicate event ignored", "duplicate": True}
 
         # Check or add sensor details in Redis
         sensor = await redis_cache.get_sensor(event.device_id)
@@ -60,22 +109,26 @@ async def create_event(
             sensor_type = event_to_sensor_type.get(event.event_type, "unknown_sensor")
             sensor_details = {"device_type": sensor_type}
             await redis_cache.add_sensor(event.device_id, sensor_details)
-            logger.info(f"Sensor {event.device_id} added to Redis with type {sensor_type}.")
+            logger.info("Sensor %s added to Redis with type %s.", event.device_id, sensor_type)
+        timer.lap("redis")
 
         # Prepare metadata
-        meta_data = event.dict(exclude={"device_id", "timestamp", "event_type", "photo_base64"})
+        meta_data = event.model_dump(exclude={"device_id", "timestamp", "event_type", "photo_base64", "event_id"})
+        if event.event_id:
+            meta_data["event_id"] = event.event_id
 
-        # Handle photo upload for motion detected events
-        if isinstance(event, MotionDetectedEvent):
+        # Decode, store and thumbnail the photo in the photo pool
+        if isinstance(event, PhotoEvent):
             photo_uuid = str(uuid.uuid4())
-            photo_binary = base64.b64decode(event.photo_base64)
-            new_photo = Photo(uuid=photo_uuid, photo=photo_binary)
+            photo = await photo_processor.process(event.photo_base64, get_photo_store())
+            new_photo = Photo(
+                uuid=photo_uuid, content_hash=photo.content_hash, size=photo.size, thumbnail_hash=photo.thumbnail_hash
+            )
             db.add(new_photo)
-            db.commit()
-            db.refresh(new_photo)
             meta_data["uuid"] = photo_uuid
+            timer.lap("photo")
 
-        # Store the event in the database
+        # Store the event (and its photo) in the database in one transaction
         new_event = Event(
             device_id=event.device_id,
             timestamp=event.timestamp,
@@ -83,73 +136,369 @@ async def create_event(
             meta_data=meta_data,
         )
         db.add(new_event)
-        db.commit()
-        db.refresh(new_event)
+        await db.commit()
+        stored = True
+        admission_controller.observe_commit(timer.lap("commit"))
 
         # Publish the event to RabbitMQ
         process_event = {
             "device_id": event.device_id,
+            "timestamp": event.timestamp,
             "event_type": event.event_type,
             "meta_data": meta_data,
+            "event_key": key,
         }
 
-        rabbitmq_publisher = RabbitMQPublisher()
-        rabbitmq_publisher.connect()
-        try:
-            rabbitmq_publisher.publish(process_event)
-            logger.info(f"Event {new_event.id} published to RabbitMQ.")
-        finally:
-            rabbitmq_publisher.close()
+        await rabbitmq_publisher.publish(process_event)
+        published = True
+        timer.lap("publish")
+        logger.debug("Event %s published to RabbitMQ.", new_event.id)
+        # Only events that reach the broker are remembered, so every other failure can be retried
+        duplicate_filter.remember([key])
+        EVENTS_TOTAL.labels(event.event_type).inc()
+        rollup_aggregator.add(event.device_id, event.event_type, event.timestamp, meta_data)
+        timer.finish()
 
         return {"message": "Event created successfully", "event_id": new_event.id}
 
+    except InvalidPhoto as e:
+        await duplicate_filter.release(redis_cache, [key])
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        logger.error(f"Failed to create event: {e}")
+        logger.error("Failed to create event: %s", e)
+        if stored and not published:
+            await discard_events(db, [new_event.id], [photo_uuid] if photo_uuid else [])
+        if claimed and not published:
+            await duplicate_filter.release(redis_cache, [key])
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        inflight.dec()
+
+
+@events_router.post("/batch", dependencies=[Depends(admission_controller.admit)])
+async def create_events_batch(
+    events: List[Any] = Body(...),
+    db=Depends(get_async_db),
+):
+    """
+    Create a batch of events with multi-row inserts and publish them to RabbitMQ together.
+    Every item is validated on its own and gets its own status, so one malformed item does not reject
+    the batch and a gateway can retry only what failed. Events that fail to be published
+    are removed again and get the status "failed", like events that could not be stored.
+    Events beyond the rate limit of their device get the status "rate_limited" with a retry_after in seconds,
+    and retries of events stored before the status "duplicate".
+    """
+    if len(events) > config.INGESTION_MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large, at most {config.INGESTION_MAX_BATCH_SIZE} events are accepted",
+        )
+
+    timer = StageTimer("create_events_batch")
+    inflight = INFLIGHT.labels("create_events_batch")
+    inflight.inc()
+    try:
+        return await store_events_batch(events, db, timer)
+    finally:
+        inflight.dec()
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        ".".join(str(part) for part in detail["loc"]) + ": " + detail["msg"] if detail["loc"] else detail["msg"]
+        for detail in error.errors()
+    )
+
+
+async def store_events_batch(items: list, db, timer: StageTimer) -> dict:
+    results = [None] * len(items)
+    events = [None] * len(items)
+    accepted = []
+    for index, item in enumerate(items):
+        try:
+            event = events[index] = event_adapter.validate_python(item)
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "rejected", "detail": format_validation_error(e)}
+            continue
+        if not validate_mac(event.device_id):
+            results[index] = {"index": index, "status": "rejected", "detail": "Invalid MAC address"}
+        elif isinstance(event, PhotoEvent) and photo_processor.too_large(event.photo_base64):
+            results[index] = {"index": index, "status": "rejected", "detail": "Photo too large"}
+        else:
+            accepted.append(index)
+    rejected = len(events) - len(accepted)
+    timer.lap("validate")
+    if accepted and device_rate_limiter.enabled:
+        accepted = await apply_device_rate_limit(events, accepted, results)
+    if accepted:
+        accepted, keys = await drop_duplicates(events, accepted, results)
+        timer.lap("dedup")
+    if accepted:
+        # Write the photos to the photo store from the photo pool, a bad photo only fails its own event
+        accepted, keys, photos = await process_batch_photos(events, accepted, keys, results)
+        rejected = sum(1 for result in results if result is not None and result["status"] == "rejected")
+        timer.lap("photo")
+    if not accepted:
+        return {"message": "No events created", "created": 0, "rejected": rejected, "results": results}
+
+    try:
+        # Register unknown sensors, one round trip for the lookup and one for the inserts
+        devices = {}
+        for index in accepted:
+            devices.setdefault(events[index].device_id, events[index].event_type)
+        sensors = await redis_cache.get_sensors(devices)
+        unknown_sensors = {
+            device_id: {"device_type": event_to_sensor_type.get(devices[device_id], "unknown_sensor")}
+            for device_id, details in sensors.items()
+            if not details
+        }
+        await redis_cache.add_sensors_if_absent(unknown_sensors)
+        timer.lap("redis")
+
+        # Prepare event and photo rows
+        photo_rows = []
+        event_rows = []
+        for index in accepted:
+            event = events[index]
+            meta_data = event.model_dump(exclude={"device_id", "timestamp", "event_type", "photo_base64", "event_id"})
+            if event.event_id:
+                meta_data["event_id"] = event.event_id
+            if isinstance(event, PhotoEvent):
+                photo_uuid = str(uuid.uuid4())
+                photo = photos[index]
+                photo_rows.append({
+                    "uuid": photo_uuid, "content_hash": photo.content_hash, "size": photo.size,
+                    "thumbnail_hash": photo.thumbnail_hash,
+                })
+                meta_data["uuid"] = photo_uuid
+            event_rows.append(
+                {
+                    "device_id": event.device_id,
+                    "timestamp": event.timestamp,
+                    "event_type": event.event_type,
+                    "meta_data": meta_data,
+                }
+            )
+
+        # Insert everything with multi-row inserts
+        if photo_rows:
+            await db.execute(insert(Photo), photo_rows)
+        event_ids = (
+            await db.scalars(
+                insert(Event).returning(Event.id, sort_by_parameter_order=True),
+                event_rows,
+            )
+        ).all()
+        await db.commit()
+        admission_controller.observe_commit(timer.lap("commit"))
+    except Exception as e:
+        await db.rollback()
+        logger.error("Failed to store event batch: %s", e)
+        await duplicate_filter.release(redis_cache, keys)
+        for index in accepted:
+            results[index] = {"index": index, "status": "failed", "detail": "Internal server error"}
+        return {"message": "No events created", "created": 0, "rejected": rejected, "results": results}
+
+    # Publish the whole batch to RabbitMQ
+    messages = [
+        {
+            "device_id": row["device_id"],
+            "timestamp": row["timestamp"],
+            "event_type": row["event_type"],
+            "meta_data": row["meta_data"],
+            "event_key": key,
+        }
+        for row, key in zip(event_rows, keys)
+    ]
+    try:
+        publish_errors = await rabbitmq_publisher.publish_batch(messages)
+    except Exception as e:
+        logger.error("Failed to publish event batch: %s", e)
+        publish_errors = [e] * len(messages)
+    timer.lap("publish")
+
+    # Remove what did not reach the broker and release its keys, so the gateway can retry it
+    unpublished = [position for position, error in enumerate(publish_errors) if error is not None]
+    if unpublished:
+        await discard_events(
+            db,
+            [event_ids[position] for position in unpublished],
+            [event_rows[position]["meta_data"]["uuid"] for position in unpublished
+             if "uuid" in event_rows[position]["meta_data"]],
+        )
+        await duplicate_filter.release(redis_cache, [keys[position] for position in unpublished])
+
+    created = 0
+    for position, (index, event_id, error) in enumerate(zip(accepted, event_ids, publish_errors)):
+        if error is not None:
+            results[index] = {"index": index, "status": "failed", "detail": "Event could not be published"}
+            continue
+        row = event_rows[position]
+        results[index] = {"index": index, "status": "created", "event_id": event_id, "published": True}
+        duplicate_filter.remember([keys[position]])
+        EVENTS_TOTAL.labels(row["event_type"]).inc()
+        rollup_aggregator.add(row["device_id"], row["event_type"], row["timestamp"], row["meta_data"])
+        created += 1
+    logger.info("Stored %s events from batch of %s.", created, len(events))
+    timer.finish()
+
+    return {
+        "message": "Events created successfully" if created else "No events created",
+        "created": created,
+        "rejected": rejected,
+        "results": results,
+    }
+
+
+async def discard_events(db, event_ids: List[int], photo_uuids: List[str]):
+    """
+    Delete stored events that could not be published, so a retry stores and publishes them again.
+    Their photo blobs stay in the content-addressed photo store and are reused by the retry.
+    """
+    try:
+        await db.execute(delete(Event).where(Event.id.in_(event_ids)))
+        if photo_uuids:
+            await db.execute(delete(Photo).where(Photo.uuid.in_(photo_uuids)))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.error("Failed to remove %s unpublished events: %s", len(event_ids), e)
+
+
+async def drop_duplicates(events: list, accepted: List[int], results: list):
+    """
+    Claim the idempotency keys of the accepted events, and mark retries of stored events as duplicates.
+
+    :return: The indexes of the new events and their keys.
+    """
+    keys = [
+        event_key(events[index].device_id, events[index].event_type, events[index].timestamp, events[index].event_id)
+        for index in accepted
+    ]
+    claims = await duplicate_filter.claim(redis_cache, keys)
+    for index, claimed in zip(accepted, claims):
+        if not claimed:
+            results[index] = {"index": index, "status": "duplicate"}
+    new = [(index, key) for index, key, claimed in zip(accepted, keys, claims) if claimed]
+    return [index for index, _ in new], [key for _, key in new]
+
+
+async def process_batch_photos(events: list, accepted: List[int], keys: List[str], results: list):
+    """
+    Decode and store the photos of the accepted events in the photo pool. Events whose photo is not valid
+    base64 are rejected, events whose photo could not be stored fail, and both release their keys.
+
+    :return: The indexes of the events that are still accepted, their keys, and their photos by index.
+    """
+    indexes = [index for index in accepted if isinstance(events[index], PhotoEvent)]
+    if not indexes:
+        return accepted, keys, {}
+    processed = await photo_processor.process_many([events[index].photo_base64 for index in indexes], get_photo_store())
+
+    photos = {}
+    for index, photo in zip(indexes, processed):
+        if isinstance(photo, InvalidPhoto):
+            results[index] = {"index": index, "status": "rejected", "detail": str(photo)}
+        elif isinstance(photo, Exception):
+            logger.error("Failed to process the photo of batch item %s: %s", index, photo)
+            results[index] = {"index": index, "status": "failed", "detail": "Internal server error"}
+        else:
+            photos[index] = photo
+    released = [key for index, key in zip(accepted, keys) if results[index] is not None]
+    if released:
+        await duplicate_filter.release(redis_cache, released)
+    kept = [(index, key) for index, key in zip(accepted, keys) if results[index] is None]
+    return [index for index, _ in kept], [key for _, key in kept], photos
+
+
+async def apply_device_rate_limit(events: list, accepted: List[int], results: list) -> List[int]:
+    """
+    Take tokens for the accepted events of every device, and mark the events beyond the grant as rate limited.
+
+    :return: The indexes of the events that are still accepted, the earliest of every device first.
+    """
+    costs = {}
+    for index in accepted:
+        costs[events[index].device_id] = costs.get(events[index].device_id, 0) + 1
+    grants = await device_rate_limiter.acquire(redis_cache, costs)
+
+    admitted = []
+    for index in accepted:
+        granted, retry_after = grants[events[index].device_id]
+        if granted > 0:
+            grants[events[index].device_id] = (granted - 1, retry_after)
+            admitted.append(index)
+        else:
+            results[index] = {"index": index, "status": "rate_limited", "retry_after": retry_after}
+    if len(admitted) < len(accepted):
+        ADMISSION_REJECTED_TOTAL.labels("device_rate").inc(len(accepted) - len(admitted))
+    return admitted
+
+
+def serialize_event(event) -> dict:
+    return {
+        "device_id": event.device_id,
+        "timestamp": event.timestamp.isoformat(),
+        "event_type": event.event_type,
+        "meta_data": event.meta_data,
+    }
 
 
 @events_router.get("/get_events")
 def get_events(
+    request: Request,
     db=Depends(get_db),
     start_time: datetime = Query(None, description="Start of the time range"),
     end_time: datetime = Query(None, description="End of the time range"),
     event_type: str = Query(None, description="Type of the event"),
     device_type: str = Query(None, description="Type of the device"),
+    device_id: str = Query(None, description="MAC address of the device"),
+    limit: int = Query(100, ge=1, le=1000, description="Maximum number of events per page"),
+    cursor: str = Query(None, description="next_cursor of the previous page"),
 ):
     """
     Retrieve events from the database, filtered by optional parameters.
+    Results are ordered by (timestamp, id) and paginated with an opaque cursor.
+    With "Accept: application/x-ndjson" all matching events are streamed instead, one per line.
     """
     try:
-        query = db.query(Event)
+        ndjson = wants_ndjson(request)
+        columns = (Event.id, Event.device_id, Event.timestamp, Event.event_type, Event.meta_data)
+        query = select(*columns) if ndjson else select(Event)
 
         if start_time:
-            query = query.filter(Event.timestamp >= start_time)
+            query = query.where(Event.timestamp >= start_time)
         if end_time:
-            query = query.filter(Event.timestamp <= end_time)
+            query = query.where(Event.timestamp <= end_time)
         if event_type:
-            query = query.filter(Event.event_type == event_type)
+            query = query.where(Event.event_type == event_type)
+        if device_id:
+            query = query.where(Event.device_id == device_id)
         if device_type:
-            query = query.filter(Event.meta_data.contains(f'"device_type": "{device_type}"'))
+            if db.get_bind().dialect.name == "postgresql":
+                # JSONB containment (@>) is answered by the GIN index on meta_data
+                query = query.where(type_coerce(Event.meta_data, JSONB).contains({"device_type": device_type}))
+            else:
+                query = query.where(Event.meta_data["device_type"].as_string() == device_type)
+
+        query = apply_keyset(query, Event.timestamp, Event.id, cursor)
 
-        events = query.all()
+        if ndjson:
+            return StreamingResponse(stream_ndjson(query, serialize_event), media_type=NDJSON_MEDIA_TYPE)
 
-        result = [
-            {
-                "device_id": event.device_id,
-                "timestamp": event.timestamp.isoformat(),
-                "event_type": event.event_type,
-                "meta_data": event.meta_data,
-            }
-            for event in events
-        ]
+        events, next_cursor = paginate(db, query, limit, lambda event: (event.timestamp, event.id))
+        result = [serialize_event(event) for event in events]
 
         if not result:
             logger.info("No events found for the given filters.")
         else:
-            logger.info(f"Retrieved {len(result)} events.")
+            logger.info("Retrieved %s events.", len(result))
 
-        return {"events": result}
+        # The rows are already JSON types, so skip FastAPI's jsonable_encoder pass
+        return APIResponse({"events": result, "next_cursor": next_cursor})
 
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Failed to retrieve events: {e}")
+        logger.error("Failed to retrieve events: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
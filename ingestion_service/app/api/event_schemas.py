@@ -1,24 +1,173 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Annotated, Dict, Literal, Optional, Type, Union, get_args
 
 
 class BaseEvent(BaseModel):
     device_id: str = Field(..., description="MAC Address of the device")
     timestamp: datetime
     event_type: str
+    event_id: Optional[str] = Field(None, max_length=128, description="Idempotency key, unique per device")
+
+
+class PhotoEvent(BaseEvent):
+    """
+    An event with a photo, which is moved to the photo store when the event is ingested.
+    """
+    photo_base64: str
 
 
 class AccessAttempEvent(BaseEvent):
+    event_type: Literal["access_attempt"]
     user_id: str
 
 
 class SpeedViolationEvent(BaseEvent):
+    event_type: Literal["speed_violation"]
     speed_kmh: int
     location: str
 
 
+class MotionDetectedEvent(PhotoEvent):
+    event_type: Literal["motion_detected"]
+    zone: str
+    confidence: float
+
+
+class TemperatureReadingEvent(BaseEvent):
+    event_type: Literal["temperature_reading"]
+    temperature_c: float
+
+
+class HumidityReadingEvent(BaseEvent):
+    event_type: Literal["humidity_reading"]
+    humidity_percent: float
+
+
+class PressureChangeEvent(BaseEvent):
+    event_type: Literal["pressure_change"]
+    pressure_hpa: float
+
+
+class ProximityAlertEvent(BaseEvent):
+    event_type: Literal["proximity_alert"]
+    distance_cm: float
 
-class MotionDetectedEvent(BaseEvent):
+
+class LightLevelChangeEvent(BaseEvent):
+    event_type: Literal["light_level_change"]
+    lux: float
+
+
+class GasLeakDetectedEvent(BaseEvent):
+    event_type: Literal["gas_leak_detected"]
+    gas_ppm: float
+    gas_type: Optional[str] = None
+
+
+class SmokeDetectedEvent(BaseEvent):
+    event_type: Literal["smoke_detected"]
+    smoke_density: float
+
+
+class WaterQualityAlertEvent(BaseEvent):
+    event_type: Literal["water_quality_alert"]
+    ph: float
+    turbidity_ntu: Optional[float] = None
+
+
+class ChemicalSpillDetectedEvent(BaseEvent):
+    event_type: Literal["chemical_spill_detected"]
+    concentration_ppm: float
+    chemical: Optional[str] = None
+
+
+class InfraredMotionDetectedEvent(BaseEvent):
+    event_type: Literal["infrared_motion_detected"]
     zone: str
     confidence: float
-    photo_base64: str
+
+
+class AccelerationEvent(BaseEvent):
+    event_type: Literal["acceleration_event"]
+    acceleration_g: float
+
+
+class GyroscopeDataEvent(BaseEvent):
+    event_type: Literal["gyroscope_data"]
+    x_dps: float
+    y_dps: float
+    z_dps: float
+
+
+class MagneticFieldChangeEvent(BaseEvent):
+    event_type: Literal["magnetic_field_change"]
+    field_strength_ut: float
+
+
+class SoundDetectedEvent(BaseEvent):
+    event_type: Literal["sound_detected"]
+    sound_level_db: float
+
+
+class LiquidLevelChangeEvent(BaseEvent):
+    event_type: Literal["liquid_level_change"]
+    level_percent: float
+
+
+class RadiationAlertEvent(BaseEvent):
+    event_type: Literal["radiation_alert"]
+    radiation_usv_h: float
+
+
+class ImageCapturedEvent(PhotoEvent):
+    event_type: Literal["image_captured"]
+    resolution: Optional[str] = None
+
+
+class TouchEvent(BaseEvent):
+    event_type: Literal["touch_event"]
+    zone: str
+    pressure: Optional[float] = None
+
+
+class UltrasonicDistanceMeasuredEvent(BaseEvent):
+    event_type: Literal["ultrasonic_distance_measured"]
+    distance_cm: float
+
+
+def schema_event_type(model: Type[BaseEvent]) -> str:
+    return get_args(model.model_fields["event_type"].annotation)[0]
+
+
+# One schema per event type. The event_type field selects the schema, so every payload is validated
+# by exactly one model instead of trying the models of the union in turn
+EVENT_SCHEMAS: Dict[str, Type[BaseEvent]] = {
+    schema_event_type(model): model
+    for model in (
+        AccessAttempEvent,
+        SpeedViolationEvent,
+        MotionDetectedEvent,
+        TemperatureReadingEvent,
+        HumidityReadingEvent,
+        PressureChangeEvent,
+        ProximityAlertEvent,
+        LightLevelChangeEvent,
+        GasLeakDetectedEvent,
+        SmokeDetectedEvent,
+        WaterQualityAlertEvent,
+        ChemicalSpillDetectedEvent,
+        InfraredMotionDetectedEvent,
+        AccelerationEvent,
+        GyroscopeDataEvent,
+        MagneticFieldChangeEvent,
+        SoundDetectedEvent,
+        LiquidLevelChangeEvent,
+        RadiationAlertEvent,
+        ImageCapturedEvent,
+        TouchEvent,
+        UltrasonicDistanceMeasuredEvent,
+    )
+}
+
+AnyEvent = Annotated[Union[tuple(EVENT_SCHEMAS.values())], Field(discriminator="event_type")]
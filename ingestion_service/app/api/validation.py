@@ -1,3 +1,7 @@
+import re
+
+MAC_ADDRESS = re.compile(r"([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}")
+
+
 def validate_mac(mac: str) -> bool:
-    import re
-    return bool(re.match(r"^([0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2}$", mac))
+    return MAC_ADDRESS.fullmatch(mac) is not None
@@ -1,11 +1,66 @@
+import asyncio
+import logging
 from fastapi import FastAPI
-from ingestion_service.app.api.endpoints import events_router
+from ingestion_service.app.api.endpoints import events_router, photo_processor, rabbitmq_publisher, rollup_aggregator
 
 from services.db import get_db
+from services.logging_setup import setup_logging
+from services.metrics import metrics_router
 from services.cache import RedisCache
+from services.codec import APIResponse
+from services.partitions import PartitionManager
 from contextlib import asynccontextmanager
+from config import config
 
+setup_logging()
+logger = logging.getLogger(__name__)
 redis_cache = RedisCache()
+partition_manager = PartitionManager(tables=["events"])
+
+# Longest time the embedded consumer may take on shutdown to drain the in-process queue
+EMBEDDED_DRAIN_SECONDS = 10
+
+
+async def start_embedded_consumer():
+    """
+    Run the alert consumer in this process, for single-node deployments with BROKER_TRANSPORT=memory.
+
+    :return: The consumer, its consuming task, its rollup task and its window snapshot task.
+    """
+    from services import consumer as consumer_module
+
+    consumer = consumer_module.RabbitMQConsumer()
+    await consumer_module.redis_cache.connect()
+    await consumer.connect()
+    consumer_task = asyncio.create_task(consumer.consume())
+    rollup_task = asyncio.create_task(consumer_module.rollup_aggregator.run_forever())
+    window_task = asyncio.create_task(
+        consumer_module.window_store.run_forever(consumer_module.redis_cache, consumer.snapshot_name)
+    )
+    logger.info("Alert consumer embedded in the ingestion service.")
+    return consumer, consumer_task, rollup_task, window_task
+
+
+async def stop_embedded_consumer(consumer, consumer_task, rollup_task, window_task):
+    from services import consumer as consumer_module
+
+    join = getattr(consumer.transport, "join", None)
+    if join is not None:
+        try:
+            await asyncio.wait_for(join(), EMBEDDED_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping the embedded consumer before the in-process queue was drained.")
+    consumer_task.cancel()
+    try:
+        await consumer_task
+    except asyncio.CancelledError:
+        pass
+    await consumer.close()
+    window_task.cancel()
+    await consumer_module.window_store.save(consumer_module.redis_cache, consumer.snapshot_name)
+    rollup_task.cancel()
+    await consumer_module.rollup_aggregator.flush()
+    await consumer_module.redis_cache.disconnect()
 
 
 @asynccontextmanager
@@ -13,20 +68,39 @@ async def lifespan(app: FastAPI):
     # Startup actions
     get_db()
     await redis_cache.connect()
+    await rabbitmq_publisher.connect()
+    embedded = await start_embedded_consumer() if config.EMBED_CONSUMER else None
+    if config.BROKER_TRANSPORT == "memory" and not embedded:
+        logger.warning("BROKER_TRANSPORT=memory without EMBED_CONSUMER, published events are never consumed.")
+    maintenance_task = asyncio.create_task(partition_manager.run_forever()) if partition_manager.enabled else None
+    rollup_task = asyncio.create_task(rollup_aggregator.run_forever())
 
     yield
 
     # Shutdown actions
+    if maintenance_task:
+        maintenance_task.cancel()
+    if embedded:
+        await stop_embedded_consumer(*embedded)
+    rollup_task.cancel()
+    await rollup_aggregator.flush()
+    await rabbitmq_publisher.close()
     await redis_cache.disconnect()
+    photo_processor.shutdown()
 
 
 ingestion_service_app = FastAPI(
-    title="IoT Ingestion Service"
+    title="IoT Ingestion Service",
+    lifespan=lifespan,
+    default_response_class=APIResponse,
 )
 
 # Pass RedisCache instance to the router
 ingestion_service_app.include_router(events_router, prefix="/api/events", tags=["Events"])
 
+# Prometheus metrics
+ingestion_service_app.include_router(metrics_router)
+
 
 @ingestion_service_app.get("/")
 async def health_check():
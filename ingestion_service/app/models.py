@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime, Integer, JSON, LargeBinary
+from sqlalchemy import Column, String, DateTime, Index, Integer, JSON, LargeBinary
+from sqlalchemy.dialects.postgresql import JSONB
 from services.db import Base
 
 
@@ -9,7 +10,20 @@ class Event(Base):
     device_id = Column(String, nullable=False)
     timestamp = Column(DateTime, nullable=False)
     event_type = Column(String, nullable=False)
-    meta_data = Column(JSON)
+    meta_data = Column(JSON().with_variant(JSONB(), "postgresql"))
+
+    # Indexes follow the filters and the (timestamp, id) keyset order used by get_events
+    __table_args__ = (
+        Index("ix_events_timestamp_id", "timestamp", "id"),
+        Index("ix_events_event_type_timestamp_id", "event_type", "timestamp", "id"),
+        Index("ix_events_device_id_timestamp_id", "device_id", "timestamp", "id"),
+        Index(
+            "ix_events_meta_data",
+            "meta_data",
+            postgresql_using="gin",
+            postgresql_ops={"meta_data": "jsonb_path_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     def to_dict(self):
         return {
@@ -25,5 +39,12 @@ class Photo(Base):
     __tablename__ = "photos"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    uuid = Column(String, nullable=False)
-    photo = Column(LargeBinary, nullable=False)
+    # Photos are looked up by uuid from the alerts that reference them
+    uuid = Column(String, nullable=False, unique=True, index=True)
+    # SHA-256 of the photo in the photo store; None for rows not yet moved out of the table
+    content_hash = Column(String(64), index=True)
+    size = Column(Integer)
+    # Content hash of the JPEG thumbnail in the photo store; None if none could be made
+    thumbnail_hash = Column(String(64))
+    # Legacy inline photo bytes, emptied by services.migrate_photos
+    photo = Column(LargeBinary, nullable=True)
@@ -1,6 +1,13 @@
 import pytest
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from services.cache import RedisCache
+from services.db import Base, get_async_db
+from services.dedup import DuplicateFilter
+from services.photo_store import LocalPhotoStore
 
 
 @pytest.fixture
@@ -26,4 +33,60 @@ def mock_redis():
     redis_cache.is_authorized_user = AsyncMock(return_value=True)
     redis_cache.add_sensor = AsyncMock()
     redis_cache.add_authorized_user = AsyncMock()
+    redis_cache.get_sensors = AsyncMock(side_effect=lambda device_ids: {device_id: None for device_id in device_ids})
+    redis_cache.are_authorized_users = AsyncMock(side_effect=lambda user_ids: {user_id: True for user_id in user_ids})
+    redis_cache.add_sensors_if_absent = AsyncMock(side_effect=lambda sensors: list(sensors))
+    redis_cache.claim_keys = AsyncMock(side_effect=lambda keys, ttl: [True] * len(keys))
+    redis_cache.release_keys = AsyncMock()
     return redis_cache
+
+
+@pytest.fixture(autouse=True)
+def duplicate_filter():
+    """
+    A fresh duplicate filter for every test, so events posted by earlier tests are not dropped as retries.
+    """
+    duplicate_filter = DuplicateFilter(capacity=1000, enabled=True)
+    with patch("ingestion_service.app.api.endpoints.duplicate_filter", duplicate_filter):
+        yield duplicate_filter
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    """
+    SQLite database file written by the endpoints through an async session
+    and inspected by the test through a regular session.
+    """
+    from ingestion_service.app.ingestion_service_main import ingestion_service_app
+
+    database_path = tmp_path / "events.db"
+    engine = create_engine(f"sqlite:///{database_path}")
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}", poolclass=NullPool)
+    async_session_local = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_async_db():
+        async with async_session_local() as db:
+            yield db
+
+    ingestion_service_app.dependency_overrides[get_async_db] = override_get_async_db
+    session = sessionmaker(bind=engine)()
+    yield session
+    ingestion_service_app.dependency_overrides.clear()
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def mock_publisher():
+    with patch("ingestion_service.app.api.endpoints.rabbitmq_publisher") as publisher:
+        publisher.publish = AsyncMock()
+        publisher.publish_batch = AsyncMock(side_effect=lambda messages: [None] * len(messages))
+        yield publisher
+
+
+@pytest.fixture
+def photo_store(tmp_path):
+    store = LocalPhotoStore(str(tmp_path / "photos"))
+    with patch("ingestion_service.app.api.endpoints.get_photo_store", return_value=store):
+        yield store
@@ -0,0 +1,114 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from ingestion_service.app.api import endpoints
+from ingestion_service.app.ingestion_service_main import ingestion_service_app
+from services.admission import AdmissionController, DeviceRateLimiter
+from services.cache import RedisCache
+from services.metrics import ADMISSION_REJECTED_TOTAL
+
+
+def access_event(device_id: str, second: int = 0) -> dict:
+    return {"device_id": device_id, "timestamp": f"2024-01-01T12:00:{second:02d}", "event_type": "access_attempt",
+            "user_id": "user-1"}
+
+
+def test_limit_shrinks_with_commit_latency():
+    controller = AdmissionController(max_inflight=100, latency_target_ms=100, max_queue_depth=0, retry_after=1)
+    assert controller.limit == 100
+    for _ in range(50):
+        controller.observe_commit(0.4)
+    assert controller.limit == 25
+
+    controller.inflight = 25
+    assert controller.check() == "latency"
+    controller.inflight = 24
+    assert controller.check() is None
+
+
+def test_check_queue_depth_and_reject():
+    depth = {"value": 0}
+    controller = AdmissionController(max_inflight=2, latency_target_ms=0, max_queue_depth=10, retry_after=0.2,
+                                     queue_depth=lambda: depth["value"])
+    assert controller.check() is None
+    depth["value"] = 11
+    assert controller.check() == "queue_depth"
+    depth["value"] = 0
+    controller.inflight = 2
+    assert controller.check() == "inflight"
+
+    rejected = ADMISSION_REJECTED_TOTAL.labels("inflight").value
+    error = controller.reject("inflight")
+    assert error.status_code == 429
+    assert error.headers == {"Retry-After": "1"}
+    assert ADMISSION_REJECTED_TOTAL.labels("inflight").value == rejected + 1
+
+
+def test_create_event_shed_while_queue_is_deep(mock_redis, mock_publisher):
+    with patch.object(endpoints.admission_controller, "queue_depth", lambda: 10 ** 9), \
+            patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/", json=access_event("AA:BB:CC:DD:EE:01"))
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    mock_publisher.publish.assert_not_called()
+    assert endpoints.admission_controller.inflight == 0
+    body = TestClient(ingestion_service_app).get("/metrics").text
+    assert f"iot_admission_inflight_limit {endpoints.admission_controller.limit}" in body
+    assert 'iot_admission_rejected_total{reason="queue_depth"}' in body
+
+
+def test_create_event_device_rate_limited(mock_redis, mock_publisher):
+    mock_redis.take_tokens = AsyncMock(return_value={"AA:BB:CC:DD:EE:01": (0, 2.5)})
+    with patch("ingestion_service.app.api.endpoints.device_rate_limiter", DeviceRateLimiter(rate=1, burst=1)), \
+            patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/", json=access_event("AA:BB:CC:DD:EE:01"))
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+    mock_redis.take_tokens.assert_awaited_once_with({"AA:BB:CC:DD:EE:01": 1}, 1, 1)
+
+
+def test_batch_marks_events_beyond_the_device_limit(db_session, mock_redis, mock_publisher, photo_store):
+    payload = [access_event("AA:BB:CC:DD:EE:01", second) for second in range(3)] + [
+        access_event("AA:BB:CC:DD:EE:02", 3),
+        access_event("not-a-mac", 4),
+    ]
+    mock_redis.take_tokens = AsyncMock(return_value={"AA:BB:CC:DD:EE:01": (2, 0.5), "AA:BB:CC:DD:EE:02": (1, 0.0)})
+    limited = ADMISSION_REJECTED_TOTAL.labels("device_rate").value
+
+    with patch("ingestion_service.app.api.endpoints.device_rate_limiter", DeviceRateLimiter(rate=1, burst=2)), \
+            patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/batch", json=payload)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["status"] for item in body["results"]] == ["created", "created", "rate_limited", "created", "rejected"]
+    assert body["results"][2]["retry_after"] == 0.5
+    assert body["created"] == 3
+    assert body["rejected"] == 1
+    mock_redis.take_tokens.assert_awaited_once_with({"AA:BB:CC:DD:EE:01": 3, "AA:BB:CC:DD:EE:02": 1}, 1, 2)
+    assert ADMISSION_REJECTED_TOTAL.labels("device_rate").value == limited + 1
+
+
+@pytest.mark.asyncio
+async def test_take_tokens_fails_open():
+    cache = RedisCache()
+    cache.redis = MagicMock()
+    cache.redis.register_script.side_effect = ConnectionError("redis is down")
+
+    assert await cache.take_tokens({"AA:BB:CC:DD:EE:01": 5}, 1, 2) == {"AA:BB:CC:DD:EE:01": (5, 0.0)}
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_script():
+    pytest.importorskip("lupa", reason="fakeredis runs Lua scripts with lupa")
+    from fakeredis.aioredis import FakeRedis
+
+    cache = RedisCache()
+    cache.redis = FakeRedis(decode_responses=True)
+    grants = await cache.take_tokens({"AA:BB:CC:DD:EE:01": 3, "AA:BB:CC:DD:EE:02": 1}, 1, 2)
+    assert grants == {"AA:BB:CC:DD:EE:01": (2, 1.0), "AA:BB:CC:DD:EE:02": (1, 0.0)}
+    granted, retry_after = (await cache.take_tokens({"AA:BB:CC:DD:EE:01": 1}, 1, 2))["AA:BB:CC:DD:EE:01"]
+    assert granted == 0
+    assert 0 < retry_after <= 1
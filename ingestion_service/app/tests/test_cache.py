@@ -0,0 +1,85 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from services.cache import LocalCache, RedisCache, MISSING, REDIS_INVALIDATION_CHANNEL
+
+
+@pytest.fixture
+def l1_config():
+    with patch("services.cache.config") as mock_config:
+        mock_config.REDIS_URL = "redis://mock"
+        mock_config.CACHE_L1_ENABLED = True
+        mock_config.CACHE_L1_MAX_SIZE = 2
+        mock_config.CACHE_L1_TTL_SECONDS = 60
+        mock_config.CACHE_L1_NEGATIVE_TTL_SECONDS = 5
+        yield mock_config
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_size=2, ttl=60, negative_ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_local_cache_expires_negative_entries_first():
+    cache = LocalCache(max_size=10, ttl=60, negative_ttl=5)
+    with patch("services.cache.time.monotonic", return_value=100.0):
+        cache.set("sensor:known", {"device_type": "radar"})
+        cache.set("user:unknown", False, negative=True)
+
+    with patch("services.cache.time.monotonic", return_value=110.0):
+        assert cache.get("sensor:known") == {"device_type": "radar"}
+        assert cache.get("user:unknown") is MISSING
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["expirations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_serves_repeated_lookups_locally(l1_config):
+    redis_cache = RedisCache()
+    redis_cache.redis = AsyncMock()
+    redis_cache.redis.hget.return_value = '{"device_type": "radar"}'
+    redis_cache.redis.sismember.return_value = False
+
+    for _ in range(3):
+        assert await redis_cache.get_sensor("AA:BB:CC:DD:EE:FF") == {"device_type": "radar"}
+        assert await redis_cache.is_authorized_user("intruder") is False
+
+    redis_cache.redis.hget.assert_called_once()
+    redis_cache.redis.sismember.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_redis_cache_publishes_invalidation_on_write(l1_config):
+    redis_cache = RedisCache()
+    redis_cache.redis = AsyncMock()
+    redis_cache.local_cache.set("user:new_user", False, negative=True)
+
+    await redis_cache.add_authorized_user("new_user")
+
+    assert redis_cache.local_cache.get("user:new_user") is MISSING
+    redis_cache.redis.publish.assert_called_once_with(REDIS_INVALIDATION_CHANNEL, "user:new_user")
+
+
+@pytest.mark.asyncio
+async def test_bulk_lookups_use_one_round_trip(l1_config):
+    l1_config.CACHE_L1_ENABLED = False
+    redis_cache = RedisCache()
+    redis_cache.redis = AsyncMock()
+    redis_cache.redis.hmget.return_value = ['{"device_type": "radar"}', None]
+    redis_cache.redis.execute_command.return_value = [1, 0]
+
+    sensors = await redis_cache.get_sensors(["AA:BB:CC:DD:EE:01", "AA:BB:CC:DD:EE:02", "AA:BB:CC:DD:EE:01"])
+    statuses = await redis_cache.are_authorized_users(["admin", "guest"])
+
+    assert sensors == {"AA:BB:CC:DD:EE:01": {"device_type": "radar"}, "AA:BB:CC:DD:EE:02": None}
+    assert statuses == {"admin": True, "guest": False}
+    redis_cache.redis.hmget.assert_called_once()
+    redis_cache.redis.execute_command.assert_called_once_with("SMISMEMBER", "authorized_users", "admin", "guest")
@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.codec import (
+    CODECS,
+    JSON_CONTENT_TYPE,
+    Codec,
+    MSGPACK_CONTENT_TYPE,
+    codec_for,
+    decode_message,
+    get_codec,
+    json_codec,
+)
+from services.publisher import AsyncRabbitMQPublisher
+
+EVENT = {
+    "device_id": "AA:BB:CC:DD:EE:FF",
+    "event_type": "speed_violation",
+    "meta_data": {"speed_kmh": 120.5, "location": "Highway 1", "plate": None, "flags": [1, 2]},
+}
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_codec_round_trip(name):
+    codec = get_codec(name)
+
+    assert codec.decode(codec.encode(EVENT)) == EVENT
+    # Datetimes are encoded as ISO 8601 strings by every codec
+    assert codec.decode(codec.encode({"at": datetime(2024, 1, 1, 12, 0)}))["at"].startswith("2024-01-01T12:00:00")
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec("xml")
+
+
+def test_incomplete_codec_cannot_be_created():
+    class EncodeOnly(Codec):
+        def encode(self, value) -> bytes:
+            return b""
+
+    with pytest.raises(TypeError):
+        EncodeOnly()
+
+
+def test_decode_by_content_type():
+    assert codec_for(None) is json_codec
+    assert codec_for(JSON_CONTENT_TYPE) is json_codec
+    assert decode_message(b'{"event_type": "legacy"}') == {"event_type": "legacy"}
+    if "msgpack" in CODECS:
+        body = get_codec("msgpack").encode(EVENT)
+        assert decode_message(body, MSGPACK_CONTENT_TYPE) == EVENT
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_tags_content_type():
+    codec = get_codec("msgpack" if "msgpack" in CODECS else "json")
+    channel = MagicMock()
+    channel.is_closed = False
+    channel.default_exchange.publish = AsyncMock()
+    publisher = AsyncRabbitMQPublisher(pool_size=1, codec=codec)
+
+    with patch("services.publisher.aio_pika.connect_robust", new_callable=AsyncMock) as mock_connect:
+        mock_connect.return_value.channel = AsyncMock(return_value=channel)
+        channel.declare_queue = AsyncMock()
+        await publisher.connect()
+        await publisher.publish_batch([EVENT])
+
+    message = channel.default_exchange.publish.call_args.args[0]
+    assert message.content_type == codec.content_type
+    assert decode_message(message.body, message.content_type) == EVENT
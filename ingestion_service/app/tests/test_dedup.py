@@ -0,0 +1,112 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from ingestion_service.app.ingestion_service_main import ingestion_service_app
+from ingestion_service.app.models import Event
+from services.dedup import BloomFilter, DuplicateFilter, RotatingBloomFilter, event_key
+
+
+def access_event(second: int = 0, event_id: str = None) -> dict:
+    event = {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": f"2024-01-01T12:00:{second:02d}",
+             "event_type": "access_attempt", "user_id": "user-1"}
+    if event_id:
+        event["event_id"] = event_id
+    return event
+
+
+def test_event_key():
+    timestamp = datetime(2024, 1, 1, 12)
+    assert event_key("AA", "access_attempt", timestamp) == event_key("AA", "access_attempt", timestamp)
+    assert event_key("AA", "access_attempt", timestamp) != event_key("AB", "access_attempt", timestamp)
+    assert event_key("AA", "access_attempt", timestamp, "retry-1") == "id:AA:retry-1"
+
+
+def test_bloom_filter_error_rate():
+    bloom = BloomFilter(10000, 0.01)
+    for index in range(10000):
+        bloom.add(f"seen-{index}")
+
+    assert all(f"seen-{index}" in bloom for index in range(10000))
+    false_positives = sum(f"unseen-{index}" in bloom for index in range(20000))
+    assert false_positives < 20000 * 0.02
+
+
+def test_rotating_filter_keeps_memory_bounded():
+    rotating = RotatingBloomFilter(100, 0.001)
+    memory = len(rotating.current.array)
+    for index in range(1000):
+        rotating.add(f"key-{index}")
+
+    assert rotating.memory == 2 * memory
+    assert all(f"key-{index}" in rotating for index in range(900, 1000))
+    assert "key-0" not in rotating
+
+
+@pytest.mark.asyncio
+async def test_claim_checks_the_local_filter_before_redis():
+    duplicates = DuplicateFilter(capacity=100, enabled=True)
+    cache = AsyncMock()
+    cache.claim_keys.side_effect = lambda keys, ttl: [key != "claimed-elsewhere" for key in keys]
+    duplicates.remember(["stored"])
+
+    claims = await duplicates.claim(cache, ["new", "stored", "new", "claimed-elsewhere"])
+
+    assert claims == [True, False, False, False]
+    cache.claim_keys.assert_awaited_once_with(["new", "claimed-elsewhere"], duplicates.ttl)
+
+
+def test_retried_event_is_stored_once(db_session, mock_redis, mock_publisher, duplicate_filter):
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        client = TestClient(ingestion_service_app)
+        first = client.post("/api/events/", json=access_event(event_id="e-1"))
+        retry = client.post("/api/events/", json=access_event(second=5, event_id="e-1"))
+        batch = client.post("/api/events/batch", json=[access_event(event_id="e-1"), access_event(second=1)]).json()
+
+    assert first.json()["event_id"] == 1
+    assert retry.json() == {"message": "Duplicate event ignored", "duplicate": True}
+    assert [item["status"] for item in batch["results"]] == ["duplicate", "created"]
+    assert db_session.query(Event).count() == 2
+    assert db_session.query(Event).first().meta_data["event_id"] == "e-1"
+    assert mock_publisher.publish.call_args[0][0]["event_key"] == "id:AA:BB:CC:DD:EE:01:e-1"
+    # Only the first post of e-1 reached Redis, the retries were caught by the local filter
+    assert mock_redis.claim_keys.await_count == 2
+
+
+def test_failed_event_releases_its_key(db_session, mock_redis, mock_publisher):
+    mock_redis.get_sensor.side_effect = ConnectionError("redis is down")
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/", json=access_event(event_id="e-2"))
+
+    assert response.status_code == 500
+    mock_redis.release_keys.assert_awaited_once_with(["id:AA:BB:CC:DD:EE:01:e-2"])
+
+
+def test_unpublished_event_can_be_retried(db_session, mock_redis, mock_publisher):
+    mock_publisher.publish.side_effect = [ConnectionError("broker is down"), None]
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        client = TestClient(ingestion_service_app)
+        failed = client.post("/api/events/", json=access_event(event_id="e-3"))
+        assert db_session.query(Event).count() == 0
+        retry = client.post("/api/events/", json=access_event(event_id="e-3"))
+
+    assert failed.status_code == 500
+    mock_redis.release_keys.assert_awaited_once_with(["id:AA:BB:CC:DD:EE:01:e-3"])
+    assert retry.status_code == 200 and "duplicate" not in retry.json()
+    assert mock_publisher.publish.await_count == 2
+    assert db_session.query(Event).count() == 1
+
+
+def test_unpublished_batch_items_can_be_retried(db_session, mock_redis, mock_publisher):
+    mock_publisher.publish_batch.side_effect = [[None, ConnectionError("message returned")], [None]]
+    payload = [access_event(event_id="b-1"), access_event(event_id="b-2")]
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        client = TestClient(ingestion_service_app)
+        first = client.post("/api/events/batch", json=payload).json()
+        retry = client.post("/api/events/batch", json=payload).json()
+
+    assert [item["status"] for item in first["results"]] == ["created", "failed"]
+    assert first["created"] == 1
+    mock_redis.release_keys.assert_awaited_once_with(["id:AA:BB:CC:DD:EE:01:b-2"])
+    assert [item["status"] for item in retry["results"]] == ["duplicate", "created"]
+    assert db_session.query(Event).count() == 2
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from ingestion_service.app.ingestion_service_main import ingestion_service_app
+from ingestion_service.app.models import Event, Photo
+
+
+def test_create_events_batch(db_session, mock_redis, mock_publisher, photo_store):
+    payload = [
+        {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:00", "event_type": "access_attempt",
+         "user_id": "user-1"},
+        {"device_id": "not-a-mac", "timestamp": "2024-01-01T12:00:01", "event_type": "access_attempt",
+         "user_id": "user-2"},
+        {"device_id": "AA:BB:CC:DD:EE:02", "timestamp": "2024-01-01T12:00:02", "event_type": "motion_detected",
+         "zone": "A", "confidence": 0.95, "photo_base64": "aGVsbG8="},
+    ]
+
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/batch", json=payload)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 2
+    assert body["rejected"] == 1
+    assert [item["status"] for item in body["results"]] == ["created", "rejected", "created"]
+    assert db_session.query(Event).count() == 2
+    photo = db_session.query(Photo).one()
+    assert photo.photo is None
+    assert photo.size == 5
+    with photo_store.read(photo.content_hash) as buffer:
+        assert bytes(buffer) == b"hello"
+    mock_publisher.publish_batch.assert_called_once()
+    assert len(mock_publisher.publish_batch.call_args[0][0]) == 2
+
+
+def test_batch_rejects_invalid_items_only(db_session, mock_redis, mock_publisher):
+    payload = [
+        {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:00", "event_type": "speed_violation",
+         "speed_kmh": 120, "location": "entrance"},
+        {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:01", "event_type": "speed_violation",
+         "speed_kmh": "fast", "location": "entrance"},
+        "not an event",
+    ]
+
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        response = TestClient(ingestion_service_app).post("/api/events/batch", json=payload)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [item["status"] for item in results] == ["created", "rejected", "rejected"]
+    assert "speed_violation.speed_kmh" in results[1]["detail"]
+    assert db_session.query(Event).count() == 1
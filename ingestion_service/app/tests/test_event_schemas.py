@@ -0,0 +1,58 @@
+import pytest
+from pydantic import TypeAdapter, ValidationError
+from ingestion_service.app.api.endpoints import event_to_sensor_type
+from ingestion_service.app.api.event_schemas import (
+    EVENT_SCHEMAS, AnyEvent, ImageCapturedEvent, MotionDetectedEvent, PhotoEvent, TemperatureReadingEvent
+)
+from ingestion_service.app.api.validation import validate_mac
+from services.rules import DEFAULT_RULES_FILE, RuleEngine
+
+event_adapter = TypeAdapter(AnyEvent)
+
+
+def test_every_sensor_type_has_a_schema():
+    assert set(event_to_sensor_type) <= set(EVENT_SCHEMAS)
+    assert "speed_violation" in EVENT_SCHEMAS
+
+
+def test_alert_rule_fields_are_in_the_schemas():
+    engine = RuleEngine(DEFAULT_RULES_FILE)
+    engine.load()
+    for rule in (rule for rules in engine.dispatch.values() for rule in rules):
+        assert rule.field in EVENT_SCHEMAS[rule.event_type].model_fields, rule.name
+
+
+def test_event_type_selects_the_schema():
+    event = event_adapter.validate_python(
+        {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:00", "event_type": "temperature_reading",
+         "temperature_c": "21.5"}
+    )
+    assert isinstance(event, TemperatureReadingEvent)
+    assert event.temperature_c == 21.5
+    assert issubclass(MotionDetectedEvent, PhotoEvent) and issubclass(ImageCapturedEvent, PhotoEvent)
+
+
+def test_errors_name_only_the_selected_schema():
+    with pytest.raises(ValidationError) as error:
+        event_adapter.validate_python(
+            {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:00", "event_type": "speed_violation",
+             "speed_kmh": "fast", "location": "Highway 1"}
+        )
+    assert [item["loc"] for item in error.value.errors()] == [("speed_violation", "speed_kmh")]
+
+    with pytest.raises(ValidationError) as error:
+        event_adapter.validate_python(
+            {"device_id": "AA:BB:CC:DD:EE:01", "timestamp": "2024-01-01T12:00:00", "event_type": "unknown"}
+        )
+    assert error.value.errors()[0]["type"] == "union_tag_invalid"
+
+
+@pytest.mark.parametrize("mac, valid", [
+    ("AA:BB:CC:DD:EE:01", True),
+    ("aa:bb:cc:dd:ee:0f", True),
+    ("AA:BB:CC:DD:EE:01\n", False),
+    ("AA:BB:CC:DD:EE", False),
+    ("AA-BB-CC-DD-EE-01", False),
+])
+def test_validate_mac(mac, valid):
+    assert validate_mac(mac) is valid
@@ -0,0 +1,73 @@
+import logging
+import queue
+import sys
+from unittest.mock import patch
+from services.logging_setup import DeferredQueueHandler, RateLimitFilter, TruncatingFormatter, parse_levels
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("services.consumer", level, __file__, 1, msg, args, None)
+
+
+def test_rate_limit_filter_samples_repeated_lines():
+    rate_limit = RateLimitFilter(rate=2)
+    with patch("services.logging_setup.time.monotonic", return_value=100.0):
+        passed = [rate_limit.filter(make_record("Received event: %s", index)) for index in range(5)]
+        # Other lines and warnings have their own budget
+        assert rate_limit.filter(make_record("Connected."))
+        assert rate_limit.filter(make_record("Failed: %s", "x", level=logging.ERROR))
+
+    assert passed == [True, True, False, False, False]
+
+    with patch("services.logging_setup.time.monotonic", return_value=101.0):
+        record = make_record("Received event: %s", 5)
+        assert rate_limit.filter(record)
+    assert record.getMessage() == "Received event: 5 [3 similar messages suppressed]"
+
+
+def test_truncating_formatter_cuts_payloads():
+    formatter = TruncatingFormatter(fmt="%(message)s", max_length=10)
+
+    assert formatter.format(make_record("short")) == "short"
+    message = "Received event: %s" % {"meta": "x" * 100}
+    assert formatter.format(make_record("Received event: %s", {"meta": "x" * 100})) == (
+        f"Received e... [{len(message) - 10} more characters]"
+    )
+
+
+def test_deferred_queue_handler_renders_the_message_and_drops_when_full():
+    log_queue = queue.Queue(maxsize=1)
+    handler = DeferredQueueHandler(log_queue)
+    event = {"event_type": "motion_detected"}
+    first = make_record("Received event: %s", event)
+
+    handler.handle(first)
+    handler.handle(make_record("Received event: %s", {}))
+    event["event_type"] = "changed after logging"
+
+    queued = log_queue.get_nowait()
+    # Rendered with the values at the time of the call, the listener thread only writes the line
+    assert queued.msg == "Received event: {'event_type': 'motion_detected'}" and queued.args is None
+    assert first.msg == "Received event: %s"
+    assert handler.dropped == 1
+
+
+def test_deferred_queue_handler_renders_exceptions():
+    handler = DeferredQueueHandler(queue.Queue())
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = logging.LogRecord("test", logging.ERROR, __file__, 1, "Failed", None, sys.exc_info())
+
+    handler.handle(record)
+
+    queued = handler.queue.get_nowait()
+    assert queued.exc_info is None and "ValueError: broken" in queued.exc_text
+    assert "ValueError: broken" in TruncatingFormatter(max_length=0).format(queued)
+
+
+def test_parse_levels():
+    assert parse_levels("services.cache=warning, aio_pika=ERROR,,bad") == {
+        "services.cache": "WARNING",
+        "aio_pika": "ERROR",
+    }
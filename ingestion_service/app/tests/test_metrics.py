@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from alerting_service.app.alert_service_main import alerting_service_app
+from ingestion_service.app.ingestion_service_main import ingestion_service_app
+from services.cache import LocalCache, RedisCache
+from services.metrics import CONSUMER_LAG_SECONDS, PUBLISHED_AT_HEADER, Counter, Gauge, Histogram, Registry, StageTimer, observe_lag
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = Counter("test_requests_total", "Requests.", ["path"], registry=registry)
+    latency = Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+    pool = Gauge("test_pool", "Pool.", ["state"], registry=registry)
+    pool.set_function(lambda: {("idle",): 3})
+
+    requests.labels('/a"b').inc()
+    requests.labels('/a"b').inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE test_requests_total counter" in lines
+    assert 'test_requests_total{path="/a\\"b"} 3' in lines
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_latency_seconds_count 3" in lines
+    assert 'test_pool{state="idle"} 3' in lines
+
+
+def test_stage_timer_and_lag():
+    timer = StageTimer("test_operation")
+    timer.lap("first")
+    timer.finish()
+    lag_count = CONSUMER_LAG_SECONDS.labels().count
+    observe_lag({PUBLISHED_AT_HEADER: 0.0})
+    observe_lag({PUBLISHED_AT_HEADER: "not a time"})
+    observe_lag(None)
+
+    body = TestClient(ingestion_service_app).get("/metrics").text
+    assert 'iot_stage_duration_seconds_count{operation="test_operation",stage="first"} 1' in body
+    assert 'iot_stage_duration_seconds_count{operation="test_operation",stage="total"} 1' in body
+    # Only the message with a numeric publish time is observed
+    assert CONSUMER_LAG_SECONDS.labels().count == lag_count + 1
+
+
+def test_metrics_endpoint_on_both_services():
+    for app in (ingestion_service_app, alerting_service_app):
+        response = TestClient(app).get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "# TYPE iot_stage_duration_seconds histogram" in response.text
+        assert "# TYPE iot_db_pool_connections gauge" in response.text
+        assert "# TYPE iot_cache_l1_stats gauge" in response.text
+
+
+def test_local_cache_stats_on_metrics():
+    cache = RedisCache()
+    cache.local_cache = LocalCache(max_size=1, ttl=60, negative_ttl=60)
+    cache.local_cache.get("sensor:a")
+    cache.local_cache.set("sensor:a", {})
+    cache.local_cache.get("sensor:a")
+    cache.local_cache.set("sensor:b", {})
+    registry = Registry()
+    Gauge("test_cache", "Cache.", ["stat"], registry=registry).set_function(cache.cache_metrics)
+
+    lines = registry.render().splitlines()
+    assert {'test_cache{stat="hits"} 1', 'test_cache{stat="misses"} 1', 'test_cache{stat="evictions"} 1'} <= set(lines)
+
+    cache.local_cache = None
+    assert cache.cache_metrics() == {}
@@ -0,0 +1,88 @@
+import pytest
+from datetime import date, datetime
+from unittest.mock import MagicMock
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from ingestion_service.app.models import Event
+from services.partitions import PartitionManager, partition_name, partition_start, partitioned_table
+
+
+def fake_connection(partitions):
+    """
+    A connection whose pg_inherits query returns the given (name, bound) rows and that records every statement.
+    """
+    connection = MagicMock()
+    connection.statements = []
+
+    def execute(statement, params=None):
+        sql = str(statement)
+        connection.statements.append(sql)
+        return partitions if "pg_inherits" in sql else MagicMock()
+
+    connection.execute.side_effect = execute
+    return connection
+
+
+def test_partition_start_and_name():
+    # 2024-01-03 is a Wednesday
+    assert partition_start(date(2024, 1, 3), "day") == date(2024, 1, 3)
+    assert partition_start(date(2024, 1, 3), "week") == date(2024, 1, 1)
+    assert partition_name("events", date(2024, 1, 1)) == "events_p20240101"
+
+
+def test_partitioned_table_includes_partition_key():
+    ddl = str(CreateTable(partitioned_table(Event.__table__, "timestamp")).compile(dialect=postgresql.dialect()))
+
+    assert "id SERIAL NOT NULL" in ddl
+    assert "PRIMARY KEY (id, timestamp)" in ddl
+    assert "PARTITION BY RANGE (timestamp)" in ddl
+    # The model keeps its single-column primary key
+    assert list(Event.__table__.primary_key.columns.keys()) == ["id"]
+
+
+def test_manager_disabled_on_sqlite():
+    manager = PartitionManager(interval="day", bind=create_engine("sqlite://"))
+
+    assert not manager.enabled
+    assert manager.run_maintenance() == ([], [])
+
+
+def test_manager_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        PartitionManager(interval="month")
+    with pytest.raises(ValueError):
+        PartitionManager(interval="day", retention_mode="truncate")
+
+
+def test_ensure_partitions_creates_missing_ranges():
+    manager = PartitionManager(tables=["events"], interval="day", precreate=2)
+    connection = fake_connection([
+        ("events_default", "DEFAULT"),
+        ("events_p20240110", "FOR VALUES FROM ('2024-01-10 00:00:00') TO ('2024-01-11 00:00:00')"),
+    ])
+
+    created = manager.ensure_partitions(connection, today=date(2024, 1, 10))
+
+    assert created == ["events_p20240111", "events_p20240112"]
+    assert ("CREATE TABLE events_p20240111 PARTITION OF events "
+            "FOR VALUES FROM ('2024-01-11') TO ('2024-01-12')") in connection.statements
+
+
+@pytest.mark.parametrize("mode, statement", [
+    ("drop", "DROP TABLE events_p20240101"),
+    ("detach", "ALTER TABLE events DETACH PARTITION events_p20240101"),
+])
+def test_expire_partitions_past_retention(mode, statement):
+    manager = PartitionManager(tables=["events"], interval="week", retention_days=7, retention_mode=mode)
+    connection = fake_connection([
+        ("events_default", "DEFAULT"),
+        ("events_p20240101", "FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-01-08 00:00:00')"),
+        ("events_p20240108", "FOR VALUES FROM ('2024-01-08 00:00:00') TO ('2024-01-15 00:00:00')"),
+    ])
+
+    expired = manager.expire_partitions(connection, today=date(2024, 1, 16))
+
+    assert expired == ["events_p20240101"]
+    assert statement in connection.statements
+    assert manager.list_partitions(connection, "events")["events_p20240108"] == datetime(2024, 1, 15)
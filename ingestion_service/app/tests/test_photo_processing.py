@@ -0,0 +1,94 @@
+import base64
+import io
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from ingestion_service.app.api import endpoints
+from ingestion_service.app.ingestion_service_main import ingestion_service_app
+from ingestion_service.app.models import Photo
+from services.photo_processing import InvalidPhoto, PhotoProcessor, PhotoTooLarge, decoded_size, process_photo
+from services.photo_store import LocalPhotoStore
+
+
+def motion_event(photo: bytes) -> dict:
+    return {"device_id": "AA:BB:CC:DD:EE:02", "timestamp": "2024-01-01T12:00:02", "event_type": "motion_detected",
+            "zone": "A", "confidence": 0.95, "photo_base64": base64.b64encode(photo).decode()}
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 100, 101])
+def test_decoded_size(size):
+    assert decoded_size(base64.b64encode(bytes(size)).decode()) == size
+
+
+def test_process_photo_stores_the_photo(tmp_path):
+    store = LocalPhotoStore(str(tmp_path))
+    photo = process_photo(base64.b64encode(b"not an image").decode(), store, 100, 160)
+
+    assert photo.size == 12
+    assert photo.thumbnail_hash is None
+    with store.read(photo.content_hash) as buffer:
+        assert bytes(buffer) == b"not an image"
+    with pytest.raises(PhotoTooLarge):
+        process_photo(base64.b64encode(b"not an image").decode(), store, 10, 160)
+
+
+def test_process_photo_makes_a_thumbnail(tmp_path):
+    image_module = pytest.importorskip("PIL.Image")
+    output = io.BytesIO()
+    image_module.new("RGB", (1200, 800), (200, 30, 30)).save(output, format="PNG")
+    store = LocalPhotoStore(str(tmp_path))
+
+    photo = process_photo(base64.b64encode(output.getvalue()).decode(), store, 0, 160)
+
+    with store.read(photo.thumbnail_hash) as buffer, image_module.open(io.BytesIO(bytes(buffer))) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert thumbnail.size == (160, 107)
+
+
+@pytest.mark.asyncio
+async def test_processor_runs_photos_in_the_pool(tmp_path):
+    store = LocalPhotoStore(str(tmp_path))
+    processor = PhotoProcessor(workers=2, kind="thread", max_bytes=100, thumbnail_size=0)
+    try:
+        photos = await processor.process_many([base64.b64encode(bytes([index])).decode() for index in range(5)], store)
+        assert len({photo.content_hash for photo in photos}) == 5
+        assert processor.pool_tasks() == {("running",): 0, ("waiting",): 0}
+        with pytest.raises(PhotoTooLarge):
+            await processor.process(base64.b64encode(bytes(101)).decode(), store)
+
+        # A bad photo only fails itself
+        good, bad = await processor.process_many([base64.b64encode(b"frame").decode(), "abc"], store)
+        assert good.size == 5 and isinstance(bad, InvalidPhoto)
+    finally:
+        processor.shutdown()
+
+
+def test_oversized_photos_are_refused(db_session, mock_redis, mock_publisher, photo_store):
+    with patch.object(endpoints.photo_processor, "max_bytes", 4), \
+            patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        client = TestClient(ingestion_service_app)
+        response = client.post("/api/events/", json=motion_event(b"hello"))
+        batch = client.post("/api/events/batch", json=[motion_event(b"hell"), motion_event(b"hello")]).json()
+
+    assert response.status_code == 413
+    assert [item["status"] for item in batch["results"]] == ["created", "rejected"]
+    assert batch["results"][1]["detail"] == "Photo too large"
+    assert db_session.query(Photo).one().size == 4
+
+
+def test_invalid_photos_are_rejected(db_session, mock_redis, mock_publisher, photo_store):
+    invalid = dict(motion_event(b"hello"), timestamp="2024-01-01T12:00:03", photo_base64="abc")
+    access = {"device_id": "AA:BB:CC:DD:EE:03", "timestamp": "2024-01-01T12:00:04", "event_type": "access_attempt",
+              "user_id": "user-1"}
+    with patch("ingestion_service.app.api.endpoints.redis_cache", mock_redis):
+        client = TestClient(ingestion_service_app)
+        response = client.post("/api/events/", json=invalid)
+        batch = client.post("/api/events/batch", json=[motion_event(b"hello"), invalid, access]).json()
+
+    assert response.status_code == 422
+    assert "not valid base64" in response.json()["detail"]
+    assert [item["status"] for item in batch["results"]] == ["created", "rejected", "created"]
+    assert batch["created"] == 2 and batch["rejected"] == 1
+    assert db_session.query(Photo).count() == 1
+    # The keys of the refused events are released, so a corrected retry goes through
+    assert mock_redis.release_keys.await_count == 2
@@ -0,0 +1,65 @@
+import os
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from ingestion_service.app.models import Photo
+from services.db import Base
+from services.migrate_photos import ensure_photo_columns, migrate_photos
+from services.photo_store import LocalPhotoStore, PhotoStore
+
+
+@pytest.fixture
+def photo_store(tmp_path):
+    return LocalPhotoStore(str(tmp_path / "photos"))
+
+
+def test_local_store_deduplicates_and_shards(photo_store):
+    first = photo_store.put(b"frame")
+    second = photo_store.put(b"frame")
+
+    assert first == second == LocalPhotoStore.content_hash(b"frame")
+    assert photo_store.path(first).endswith(os.path.join(first[:2], first[2:4], first))
+    with photo_store.read(first) as buffer:
+        assert bytes(buffer) == b"frame"
+    assert photo_store.size(first) == 5
+
+
+def test_incomplete_photo_store_cannot_be_created():
+    class WriteOnlyStore(PhotoStore):
+        def put(self, data: bytes, content_hash: str = None) -> str:
+            return self.content_hash(data)
+
+    with pytest.raises(TypeError):
+        WriteOnlyStore()
+
+
+def test_migrate_photos_moves_blobs_out_of_table(tmp_path, photo_store):
+    engine = create_engine(f"sqlite:///{tmp_path / 'photos.db'}")
+    Base.metadata.create_all(bind=engine)
+    session_local = sessionmaker(bind=engine)
+    with session_local() as session:
+        session.add_all([Photo(uuid=f"uuid-{index}", photo=b"same frame") for index in range(5)])
+        session.commit()
+
+    with patch("services.migrate_photos.SessionLocal", session_local):
+        assert migrate_photos(batch_size=2, store=photo_store) == 5
+
+    with session_local() as session:
+        photos = session.query(Photo).all()
+        assert {photo.content_hash for photo in photos} == {LocalPhotoStore.content_hash(b"same frame")}
+        assert all(photo.photo is None and photo.size == 10 for photo in photos)
+
+
+def test_ensure_photo_columns_adds_missing_columns(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'photos.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE photos (id INTEGER PRIMARY KEY, uuid VARCHAR NOT NULL, photo BLOB)"))
+
+    with patch("services.migrate_photos.engine", engine):
+        ensure_photo_columns()
+        # Columns that exist are left alone on a second run
+        ensure_photo_columns()
+
+    columns = {column["name"] for column in inspect(engine).get_columns("photos")}
+    assert {"content_hash", "size", "thumbnail_hash"} <= columns
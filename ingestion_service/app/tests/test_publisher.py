@@ -1,6 +1,7 @@
 import pytest
-from unittest.mock import MagicMock, patch
-from services.publisher import RabbitMQPublisher
+from unittest.mock import AsyncMock, MagicMock, patch
+from services.publisher import RabbitMQPublisher, AsyncRabbitMQPublisher
+import asyncio
 import json
 import pika
 
@@ -11,6 +12,10 @@ def mock_config():
     with patch("services.publisher.config") as mock_config:
         mock_config.RABBITMQ_URL = "mock_url"
         mock_config.RABBITMQ_QUEUE = "mock_queue"
+        mock_config.RABBITMQ_PUBLISHER_CONNECTIONS = 1
+        mock_config.RABBITMQ_PUBLISHER_POOL_SIZE = 2
+        mock_config.RABBITMQ_CONFIRM_BATCH_SIZE = 10
+        mock_config.RABBITMQ_CONFIRM_FLUSH_MS = 5
         yield mock_config
 
 
@@ -61,3 +66,55 @@ def test_publisher_close(mock_config, mock_pika):
 
     # Verify that close was called on the connection
     publisher.connection.close.assert_called_once()
+
+
+@pytest.fixture
+def mock_aio_pika():
+    # Mock aio_pika.connect_robust and the pooled channels
+    with patch("services.publisher.aio_pika.connect_robust", new_callable=AsyncMock) as mock_connect:
+        mock_channel = MagicMock()
+        mock_channel.is_closed = False
+        mock_channel.declare_queue = AsyncMock()
+        mock_channel.default_exchange.publish = AsyncMock()
+        mock_connect.return_value.channel = AsyncMock(return_value=mock_channel)
+        mock_connect.return_value.close = AsyncMock()
+        yield mock_connect, mock_channel
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_connect_opens_pool(mock_config, mock_aio_pika):
+    mock_connect, mock_channel = mock_aio_pika
+    publisher = AsyncRabbitMQPublisher()
+
+    await publisher.connect()
+
+    mock_connect.assert_called_once_with("mock_url")
+    assert publisher.channels.qsize() == 2
+    mock_channel.declare_queue.assert_called_once_with("mock_queue", durable=True)
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_batches_concurrent_publishes(mock_config, mock_aio_pika):
+    _, mock_channel = mock_aio_pika
+    publisher = AsyncRabbitMQPublisher()
+    await publisher.connect()
+
+    messages = [{"event_type": "test_event", "meta_data": {"index": index}} for index in range(3)]
+    await asyncio.gather(*(publisher.publish(message) for message in messages))
+
+    assert mock_channel.default_exchange.publish.call_count == 3
+    routing_keys = {call.kwargs["routing_key"] for call in mock_channel.default_exchange.publish.call_args_list}
+    assert routing_keys == {"mock_queue"}
+    await publisher.close()
+    assert publisher.channels is None
+
+
+@pytest.mark.asyncio
+async def test_async_publisher_reports_unconfirmed_message(mock_config, mock_aio_pika):
+    _, mock_channel = mock_aio_pika
+    mock_channel.default_exchange.publish.side_effect = Exception("nack")
+    publisher = AsyncRabbitMQPublisher()
+    await publisher.connect()
+
+    with pytest.raises(RuntimeError):
+        await publisher.publish({"event_type": "test_event"})
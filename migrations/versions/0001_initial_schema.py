@@ -0,0 +1,51 @@
+"""Initial schema: events, photos and alerts
+
+Matches the tables created by init_db before versioned migrations were introduced.
+Existing databases are adopted with `alembic stamp 0001`.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-01-10
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("device_id", sa.String(), nullable=False),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("meta_data", sa.JSON()),
+    )
+    op.create_index("ix_events_id", "events", ["id"])
+
+    op.create_table(
+        "photos",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("uuid", sa.String(), nullable=False),
+        sa.Column("photo", sa.LargeBinary(), nullable=False),
+    )
+
+    op.create_table(
+        "alerts",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("description", sa.String(), nullable=False),
+        sa.Column("meta_data", sa.JSON()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+
+
+def downgrade():
+    op.drop_table("alerts")
+    op.drop_table("photos")
+    op.drop_index("ix_events_id", table_name="events")
+    op.drop_table("events")
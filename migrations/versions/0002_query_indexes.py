@@ -0,0 +1,64 @@
+"""Query indexes, JSONB metadata and alerts.device_id
+
+- composite (filter, time, id) indexes matching the keyset order of get_events/get_alerts
+- meta_data as JSONB with a GIN index on PostgreSQL
+- indexed alerts.device_id, and a NOT NULL alerts.created_at
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-01-12
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    is_postgresql = op.get_bind().dialect.name == "postgresql"
+
+    op.create_index("ix_events_timestamp_id", "events", ["timestamp", "id"])
+    op.create_index("ix_events_event_type_timestamp_id", "events", ["event_type", "timestamp", "id"])
+    op.create_index("ix_events_device_id_timestamp_id", "events", ["device_id", "timestamp", "id"])
+
+    op.add_column("alerts", sa.Column("device_id", sa.String()))
+    op.execute("UPDATE alerts SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    with op.batch_alter_table("alerts") as batch_op:
+        batch_op.alter_column("created_at", existing_type=sa.DateTime(), nullable=False)
+    op.create_index("ix_alerts_created_at_id", "alerts", ["created_at", "id"])
+    op.create_index("ix_alerts_event_type_created_at_id", "alerts", ["event_type", "created_at", "id"])
+    op.create_index("ix_alerts_device_id_created_at_id", "alerts", ["device_id", "created_at", "id"])
+
+    if is_postgresql:
+        op.execute("ALTER TABLE events ALTER COLUMN meta_data TYPE JSONB USING meta_data::jsonb")
+        op.execute("ALTER TABLE alerts ALTER COLUMN meta_data TYPE JSONB USING meta_data::jsonb")
+        op.create_index(
+            "ix_events_meta_data",
+            "events",
+            ["meta_data"],
+            postgresql_using="gin",
+            postgresql_ops={"meta_data": "jsonb_path_ops"},
+        )
+
+
+def downgrade():
+    is_postgresql = op.get_bind().dialect.name == "postgresql"
+
+    if is_postgresql:
+        op.drop_index("ix_events_meta_data", table_name="events")
+        op.execute("ALTER TABLE alerts ALTER COLUMN meta_data TYPE JSON USING meta_data::json")
+        op.execute("ALTER TABLE events ALTER COLUMN meta_data TYPE JSON USING meta_data::json")
+
+    op.drop_index("ix_alerts_device_id_created_at_id", table_name="alerts")
+    op.drop_index("ix_alerts_event_type_created_at_id", table_name="alerts")
+    op.drop_index("ix_alerts_created_at_id", table_name="alerts")
+    with op.batch_alter_table("alerts") as batch_op:
+        batch_op.alter_column("created_at", existing_type=sa.DateTime(), nullable=True)
+        batch_op.drop_column("device_id")
+
+    op.drop_index("ix_events_device_id_timestamp_id", table_name="events")
+    op.drop_index("ix_events_event_type_timestamp_id", table_name="events")
+    op.drop_index("ix_events_timestamp_id", table_name="events")
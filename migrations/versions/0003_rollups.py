@@ -0,0 +1,40 @@
+"""Rollup tables for the statistics API
+
+- rollups_1m and rollups_1h: count, sum, min and max per (source, event_type, bucket, device_id, metric)
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-01-14
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ["rollups_1m", "rollups_1h"]
+
+
+def upgrade():
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column("source", sa.String(), primary_key=True),
+            sa.Column("event_type", sa.String(), primary_key=True),
+            sa.Column("bucket", sa.DateTime(), primary_key=True),
+            sa.Column("device_id", sa.String(), primary_key=True),
+            sa.Column("metric", sa.String(), primary_key=True),
+            sa.Column("count", sa.BigInteger(), nullable=False),
+            sa.Column("value_sum", sa.Float()),
+            sa.Column("value_min", sa.Float()),
+            sa.Column("value_max", sa.Float()),
+        )
+        op.create_index(f"ix_{table}_source_device_id_bucket", table, ["source", "device_id", "bucket"])
+
+
+def downgrade():
+    for table in reversed(ROLLUP_TABLES):
+        op.drop_index(f"ix_{table}_source_device_id_bucket", table_name=table)
+        op.drop_table(table)
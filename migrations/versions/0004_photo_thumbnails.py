@@ -0,0 +1,24 @@
+"""Photo thumbnails
+
+- photos.thumbnail_hash: content hash of the thumbnail in the photo store
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-01-16
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("photos", sa.Column("thumbnail_hash", sa.String(64)))
+
+
+def downgrade():
+    with op.batch_alter_table("photos") as batch_op:
+        batch_op.drop_column("thumbnail_hash")
@@ -0,0 +1,27 @@
+"""Collapsed alert occurrences
+
+- alerts.occurrence_count: occurrences collapsed into the alert during its cooldown window
+- alerts.last_seen_at: time of the latest occurrence
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2025-01-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("alerts", sa.Column("occurrence_count", sa.Integer(), nullable=False, server_default="1"))
+    op.add_column("alerts", sa.Column("last_seen_at", sa.DateTime()))
+
+
+def downgrade():
+    with op.batch_alter_table("alerts") as batch_op:
+        batch_op.drop_column("last_seen_at")
+        batch_op.drop_column("occurrence_count")
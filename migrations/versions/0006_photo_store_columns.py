@@ -0,0 +1,34 @@
+"""Photo store columns
+
+- photos.content_hash and photos.size: the photo bytes live in the photo store, keyed by their hash
+- photos.photo may be empty once the bytes were moved out with services.migrate_photos
+
+Downgrading needs the photo bytes back in photos.photo.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2025-01-20
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("photos", sa.Column("content_hash", sa.String(64)))
+    op.add_column("photos", sa.Column("size", sa.Integer()))
+    op.create_index("ix_photos_content_hash", "photos", ["content_hash"])
+    with op.batch_alter_table("photos") as batch_op:
+        batch_op.alter_column("photo", existing_type=sa.LargeBinary(), nullable=True)
+
+
+def downgrade():
+    op.drop_index("ix_photos_content_hash", table_name="photos")
+    with op.batch_alter_table("photos") as batch_op:
+        batch_op.alter_column("photo", existing_type=sa.LargeBinary(), nullable=False)
+        batch_op.drop_column("size")
+        batch_op.drop_column("content_hash")
@@ -0,0 +1,22 @@
+"""Photo uuid index
+
+- unique ix_photos_uuid: photos are looked up by the uuid in the metadata of their event and alerts
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2025-01-22
+"""
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_photos_uuid", "photos", ["uuid"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_photos_uuid", table_name="photos")
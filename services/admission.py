@@ -0,0 +1,118 @@
+import logging
+import math
+from typing import Callable, Optional
+from fastapi import HTTPException
+from services.metrics import ADMISSION_REJECTED_TOTAL
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest commit duration in the moving average
+LATENCY_SMOOTHING = 0.2
+
+
+class AdmissionController:
+    def __init__(self, max_inflight: int = None, latency_target_ms: float = None, max_queue_depth: int = None,
+                 retry_after: float = None, queue_depth: Callable[[], int] = None):
+        """
+        Bound the requests the ingestion service works on at once, and shed load before it times out.
+        The in-flight limit shrinks in proportion while the average commit takes longer than the target,
+        and requests are refused while the outgoing queue is deeper than max_queue_depth.
+        Refused requests get a 429 with Retry-After, so well-behaved clients back off.
+
+        :param max_inflight: Requests processed at once, ADMISSION_MAX_INFLIGHT by default. 0 disables the limit.
+        :param latency_target_ms: Commit latency above which the limit shrinks, 0 disables it.
+        :param max_queue_depth: Outgoing messages above which requests are refused, 0 disables it.
+        :param retry_after: Seconds suggested to refused clients.
+        :param queue_depth: Returns the current number of messages waiting to be published or consumed.
+        """
+        self.max_inflight = config.ADMISSION_MAX_INFLIGHT if max_inflight is None else max_inflight
+        self.latency_target = (
+            config.ADMISSION_LATENCY_TARGET_MS if latency_target_ms is None else latency_target_ms
+        ) / 1000
+        self.max_queue_depth = config.ADMISSION_MAX_QUEUE_DEPTH if max_queue_depth is None else max_queue_depth
+        self.retry_after = config.ADMISSION_RETRY_AFTER if retry_after is None else retry_after
+        self.queue_depth = queue_depth
+        self.inflight = 0
+        self.commit_latency = 0.0
+
+    @property
+    def limit(self) -> int:
+        """
+        The in-flight limit, shrunk while commits are slower than the target.
+        """
+        if not self.max_inflight:
+            return 0
+        if self.latency_target and self.commit_latency > self.latency_target:
+            return max(1, int(self.max_inflight * self.latency_target / self.commit_latency))
+        return self.max_inflight
+
+    def observe_commit(self, seconds: float):
+        self.commit_latency += LATENCY_SMOOTHING * (seconds - self.commit_latency)
+
+    def check(self) -> Optional[str]:
+        """
+        :return: The reason a new request has to be refused, or None to admit it.
+        """
+        limit = self.limit
+        if limit and self.inflight >= limit:
+            return "inflight" if limit == self.max_inflight else "latency"
+        if self.max_queue_depth and self.queue_depth is not None:
+            try:
+                depth = int(self.queue_depth())
+            except Exception:
+                depth = 0
+            if depth > self.max_queue_depth:
+                return "queue_depth"
+        return None
+
+    def reject(self, reason: str, retry_after: float = None) -> HTTPException:
+        """
+        Count a refused request and build its 429 response.
+        """
+        ADMISSION_REJECTED_TOTAL.labels(reason).inc()
+        seconds = max(1, math.ceil(self.retry_after if retry_after is None else retry_after))
+        return HTTPException(
+            status_code=429,
+            detail=f"Too many requests ({reason}), retry later",
+            headers={"Retry-After": str(seconds)},
+        )
+
+    async def admit(self):
+        """
+        FastAPI dependency that holds an in-flight slot for the duration of the request.
+        """
+        reason = self.check()
+        if reason:
+            raise self.reject(reason)
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+
+
+class DeviceRateLimiter:
+    def __init__(self, rate: float = None, burst: int = None):
+        """
+        Per-device token buckets in Redis, shared by all ingestion replicas.
+
+        :param rate: Events per second a device may send on average, DEVICE_RATE_LIMIT by default. 0 disables it.
+        :param burst: Events a device may send at once, DEVICE_RATE_BURST by default.
+        """
+        self.rate = config.DEVICE_RATE_LIMIT if rate is None else rate
+        self.burst = config.DEVICE_RATE_BURST if burst is None else burst
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    async def acquire(self, cache, costs: dict) -> dict:
+        """
+        :param cache: The RedisCache holding the buckets.
+        :param costs: A dictionary mapping device_id to the number of events it sends.
+        :return: A dictionary mapping device_id to the events granted and the seconds until the rest would be.
+        """
+        if not self.enabled:
+            return {device_id: (cost, 0.0) for device_id, cost in costs.items()}
+        return await cache.take_tokens(costs, self.rate, self.burst)
@@ -1,80 +1,410 @@
 import aioredis
-import json
+import asyncio
 import logging
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from services.codec import cache_codec
 from config import config
 
+logger = logging.getLogger(__name__)
+
 # Redis keys for storing data
 REDIS_SENSOR_KEY = "registered_sensors"
 REDIS_AUTHORIZED_USERS_KEY = "authorized_users"
 
+# Pub/sub channel used to invalidate the in-process cache of every service instance
+REDIS_INVALIDATION_CHANNEL = "cache_invalidation"
+
+# Marker for keys that are not in the local cache (None is a valid cached value)
+MISSING = object()
+
+# Prefix of the per-device token buckets of the ingestion rate limit
+REDIS_RATE_LIMIT_PREFIX = "rate_limit:"
+
+# Prefix of the idempotency keys of ingested events
+REDIS_DEDUP_PREFIX = "dedup:"
+
+# Prefix of the alert cooldown windows, one hash per (event_type, device_id)
+REDIS_ALERT_WINDOW_PREFIX = "alert_window:"
+
+# Prefix of the snapshots of the windowed alert rules, one per consumer process
+REDIS_WINDOW_SNAPSHOT_PREFIX = "window_snapshot:"
+
+# Opens or extends the cooldown window KEYS[i] by ARGV[i + 1] milliseconds, but never beyond ARGV[1]
+# milliseconds (or the cooldown, if longer) after the window was opened. Time comes from the Redis server,
+# so replicas with skewed clocks agree. Returns per window "new" if it was closed (the caller inserts
+# the alert), "pending" while the alert of the window is being inserted (counted in the window), or the
+# id of the window's alert to collapse into.
+ALERT_WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local max_age = tonumber(ARGV[1])
+local result = {}
+for i, key in ipairs(KEYS) do
+    local cooldown = tonumber(ARGV[i + 1])
+    local limit = math.max(max_age, cooldown)
+    local window = redis.call('HMGET', key, 'id', 'opened')
+    local id = window[1]
+    local opened = tonumber(window[2] or now)
+    if (not id) or now - opened >= limit then
+        opened = now
+        redis.call('HSET', key, 'id', '', 'pending', 0, 'opened', opened)
+        table.insert(result, 'new')
+    elseif id == '' then
+        redis.call('HINCRBY', key, 'pending', 1)
+        table.insert(result, 'pending')
+    else
+        table.insert(result, id)
+    end
+    redis.call('PEXPIRE', key, math.max(1, math.min(cooldown, opened + limit - now)))
+end
+return result
+"""
+
+# Stores alert id ARGV[i] in the window KEYS[i] opened for it, and returns the occurrences counted
+# as pending in the meantime
+ALERT_ATTACH_SCRIPT = """
+local result = {}
+for i, key in ipairs(KEYS) do
+    local pending = tonumber(redis.call('HGET', key, 'pending') or '0')
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('HSET', key, 'id', ARGV[i], 'pending', 0)
+    end
+    table.insert(result, pending)
+end
+return result
+"""
+
+# Token buckets refilled at ARGV[1] tokens per second up to ARGV[2]. Takes up to ARGV[2 + i] tokens
+# from bucket KEYS[i] and returns, per bucket, the tokens granted and the milliseconds until the rest
+# would be available. Runs atomically on the Redis server clock, so replicas share the buckets even
+# when their own clocks are skewed.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local ttl = math.ceil(burst / rate * 1000) + 1000
+local result = {}
+for i, key in ipairs(KEYS) do
+    local cost = tonumber(ARGV[2 + i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local granted = math.min(cost, math.floor(tokens))
+    tokens = tokens - granted
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, ttl)
+    table.insert(result, granted)
+    table.insert(result, math.ceil((cost - granted - tokens) / rate * 1000))
+end
+return result
+"""
+
+
+class LocalCache:
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        """
+        Bounded in-process LRU cache with a TTL per entry.
+
+        :param max_size: Maximum number of entries before the least recently used one is evicted.
+        :param ttl: Seconds a positive entry stays valid.
+        :param negative_ttl: Seconds a negative entry (unknown sensor, unauthorized user) stays valid.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: str):
+        """
+        Return the cached value for key, or MISSING if it is absent or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value, negative: bool = False):
+        """
+        Store a value, evicting the least recently used entries when the cache is full.
+        """
+        ttl = self.negative_ttl if negative else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
 
 class RedisCache:
     def __init__(self):
         """
         Initialize RedisCache with the Redis URL from the configuration.
+        When CACHE_L1_ENABLED is set, lookups are served from an in-process cache first.
         """
         self.redis_url = config.REDIS_URL
         self.redis = None
+        self.local_cache = None
+        self._token_bucket = None
+        self._alert_window = None
+        self._alert_attach = None
+        self._invalidation_task = None
+        if config.CACHE_L1_ENABLED:
+            self.local_cache = LocalCache(
+                max_size=config.CACHE_L1_MAX_SIZE,
+                ttl=config.CACHE_L1_TTL_SECONDS,
+                negative_ttl=config.CACHE_L1_NEGATIVE_TTL_SECONDS,
+            )
 
     async def connect(self):
         """
         Initialize the Redis connection.
         """
         try:
-            logging.info(f"Connecting to Redis at {self.redis_url}")
+            logger.info("Connecting to Redis at %s", self.redis_url)
             self.redis = await aioredis.from_url(self.redis_url, decode_responses=True)
 
             # Check the connection
             if not await self.redis.ping():
                 raise ConnectionError("Ping to Redis failed.")
 
-            logging.info("Successfully connected to Redis.")
+            logger.info("Successfully connected to Redis.")
         except Exception as e:
-            logging.error(f"Failed to connect to Redis: {e}")
+            logger.error("Failed to connect to Redis: %s", e)
             raise ConnectionError(f"Redis connection failed: {e}")
 
+        if self.local_cache is not None and self._invalidation_task is None:
+            self._invalidation_task = asyncio.create_task(self._listen_for_invalidations())
+
     async def disconnect(self):
         """
         Close the Redis connection.
         """
+        if self._invalidation_task:
+            self._invalidation_task.cancel()
+            try:
+                await self._invalidation_task
+            except asyncio.CancelledError:
+                pass
+            self._invalidation_task = None
+
         if self.redis:
             try:
-                logging.info("Disconnecting from Redis.")
+                logger.info("Disconnecting from Redis.")
                 await self.redis.close()
                 self.redis = None
-                logging.info("Redis disconnected successfully.")
+                logger.info("Redis disconnected successfully.")
             except Exception as e:
-                logging.error(f"Error while disconnecting from Redis: {e}")
+                logger.error("Error while disconnecting from Redis: %s", e)
+
+    def pool_connections(self) -> dict:
+        """
+        Current usage of the Redis connection pool, for the iot_redis_pool_connections gauge.
+        """
+        pool = getattr(self.redis, "connection_pool", None)
+        if pool is None:
+            return {}
+        return {
+            ("in_use",): len(getattr(pool, "_in_use_connections", ())),
+            ("idle",): len(getattr(pool, "_available_connections", ())),
+        }
 
     async def ensure_connection(self):
         """
         Ensure the Redis connection is active and reconnect if necessary.
         """
         if not self.redis:
-            logging.warning("Redis connection is not active. Reconnecting...")
+            logger.warning("Redis connection is not active. Reconnecting...")
             await self.connect()
 
+    async def _listen_for_invalidations(self):
+        """
+        Drop local cache entries that another service instance has changed.
+        If the subscription is lost the whole local cache is cleared, since updates may have been missed.
+        """
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(REDIS_INVALIDATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.local_cache.invalidate(message["data"])
+            except asyncio.CancelledError:
+                if pubsub is not None:
+                    await pubsub.close()
+                raise
+            except Exception as e:
+                logger.error("Cache invalidation subscription failed: %s", e)
+                self.local_cache.clear()
+                await asyncio.sleep(1)
+
+    async def _invalidate(self, key: str):
+        """
+        Invalidate a local cache entry here and on every other service instance.
+        """
+        if self.local_cache is None:
+            return
+        self.local_cache.invalidate(key)
+        try:
+            await self.redis.publish(REDIS_INVALIDATION_CHANNEL, key)
+        except Exception as e:
+            logger.error("Error publishing cache invalidation for %s: %s", key, e)
+
+    async def _invalidate_many(self, keys: List[str]):
+        """
+        Invalidate several local cache entries with one pipelined round of publishes.
+        """
+        if self.local_cache is None or not keys:
+            return
+        for key in keys:
+            self.local_cache.invalidate(key)
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.publish(REDIS_INVALIDATION_CHANNEL, key)
+            await pipeline.execute()
+        except Exception as e:
+            logger.error("Error publishing cache invalidation for %s keys: %s", len(keys), e)
+
+    def cache_stats(self) -> Optional[dict]:
+        """
+        Hit, miss and eviction counters of the local cache, or None when it is disabled.
+        """
+        return self.local_cache.stats() if self.local_cache is not None else None
+
+    def cache_metrics(self) -> dict:
+        """
+        The cache_stats counters for the iot_cache_l1_stats gauge, empty when the local cache is disabled.
+        """
+        return {(name,): value for name, value in (self.cache_stats() or {}).items()}
+
     async def get_sensor(self, device_id: str) -> Optional[dict]:
         """
-        Fetch sensor details from Redis.
+        Fetch sensor details from the local cache or Redis.
 
         :param device_id: The unique ID of the sensor.
         :return: Sensor details as a dictionary or None if not found.
         """
+        cache_key = f"sensor:{device_id}"
+        if self.local_cache is not None:
+            cached = self.local_cache.get(cache_key)
+            if cached is not MISSING:
+                return cached
+
         await self.ensure_connection()
         try:
-            logging.info(f"Fetching sensor details for device_id: {device_id}")
+            logger.debug("Fetching sensor details for device_id: %s", device_id)
             data = await self.redis.hget(REDIS_SENSOR_KEY, device_id)
-            if data:
-                logging.info(f"Sensor details found for device_id: {device_id}")
-                return json.loads(data)
-            logging.info(f"No sensor details found for device_id: {device_id}")
+            details = cache_codec.decode(data) if data else None
+            if self.local_cache is not None:
+                self.local_cache.set(cache_key, details, negative=details is None)
+            if details:
+                logger.debug("Sensor details found for device_id: %s", device_id)
+                return details
+            logger.debug("No sensor details found for device_id: %s", device_id)
             return None
         except Exception as e:
-            logging.error(f"Error fetching sensor for device_id {device_id}: {e}")
+            logger.error("Error fetching sensor for device_id %s: %s", device_id, e)
             return None
 
+    async def get_sensors(self, device_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+        """
+        Fetch details of several sensors with a single HMGET.
+
+        :param device_ids: The unique IDs of the sensors.
+        :return: A dictionary mapping every device_id to its details, or None if not found.
+        """
+        sensors = {}
+        missing = []
+        for device_id in dict.fromkeys(device_ids):
+            cached = self.local_cache.get(f"sensor:{device_id}") if self.local_cache is not None else MISSING
+            if cached is MISSING:
+                missing.append(device_id)
+            else:
+                sensors[device_id] = cached
+        if not missing:
+            return sensors
+
+        await self.ensure_connection()
+        try:
+            logger.debug("Fetching sensor details for %s devices.", len(missing))
+            values = await self.redis.hmget(REDIS_SENSOR_KEY, missing)
+        except Exception as e:
+            logger.error("Error fetching sensors for %s devices: %s", len(missing), e)
+            sensors.update((device_id, None) for device_id in missing)
+            return sensors
+
+        for device_id, data in zip(missing, values):
+            details = cache_codec.decode(data) if data else None
+            sensors[device_id] = details
+            if self.local_cache is not None:
+                self.local_cache.set(f"sensor:{device_id}", details, negative=details is None)
+        return sensors
+
+    async def add_sensors_if_absent(self, sensors: Dict[str, dict]) -> List[str]:
+        """
+        Register several sensors in one pipelined round trip, keeping existing entries untouched.
+
+        :param sensors: A dictionary mapping device_id to the sensor details to store.
+        :return: The device IDs that were actually added.
+        """
+        if not sensors:
+            return []
+
+        await self.ensure_connection()
+        try:
+            pipeline = self.redis.pipeline(transaction=False)
+            for device_id, details in sensors.items():
+                pipeline.hsetnx(REDIS_SENSOR_KEY, device_id, cache_codec.encode(details))
+            results = await pipeline.execute()
+        except Exception as e:
+            logger.error("Error adding %s sensors: %s", len(sensors), e)
+            return []
+
+        added = [device_id for device_id, result in zip(sensors, results) if result]
+        await self._invalidate_many([f"sensor:{device_id}" for device_id in added])
+        logger.info("Added %s of %s sensors to Redis.", len(added), len(sensors))
+        return added
+
     async def add_sensor(self, device_id: str, details: dict):
         """
         Add a sensor to the Redis cache.
@@ -84,11 +414,12 @@ class RedisCache:
         """
         await self.ensure_connection()
         try:
-            logging.info(f"Adding sensor {device_id} to Redis.")
-            await self.redis.hset(REDIS_SENSOR_KEY, device_id, json.dumps(details))
-            logging.info(f"Sensor {device_id} added successfully.")
+            logger.info("Adding sensor %s to Redis.", device_id)
+            await self.redis.hset(REDIS_SENSOR_KEY, device_id, cache_codec.encode(details))
+            await self._invalidate(f"sensor:{device_id}")
+            logger.info("Sensor %s added successfully.", device_id)
         except Exception as e:
-            logging.error(f"Error adding sensor {device_id}: {e}")
+            logger.error("Error adding sensor %s: %s", device_id, e)
 
     async def is_authorized_user(self, user_id: str) -> bool:
         """
@@ -97,15 +428,56 @@ class RedisCache:
         :param user_id: The unique ID of the user.
         :return: True if the user is authorized, False otherwise.
         """
+        cache_key = f"user:{user_id}"
+        if self.local_cache is not None:
+            cached = self.local_cache.get(cache_key)
+            if cached is not MISSING:
+                return cached
+
         await self.ensure_connection()
         try:
             authorized = await self.redis.sismember(REDIS_AUTHORIZED_USERS_KEY, user_id)
-            logging.info(f"User {user_id} authorization status: {authorized}")
+            logger.debug("User %s authorization status: %s", user_id, authorized)
+            if self.local_cache is not None:
+                self.local_cache.set(cache_key, authorized, negative=not authorized)
             return authorized
         except Exception as e:
-            logging.error(f"Error checking authorization for user_id {user_id}: {e}")
+            logger.error("Error checking authorization for user_id %s: %s", user_id, e)
             return False
 
+    async def are_authorized_users(self, user_ids: Iterable[str]) -> Dict[str, bool]:
+        """
+        Check several users with a single SMISMEMBER.
+
+        :param user_ids: The unique IDs of the users.
+        :return: A dictionary mapping every user_id to its authorization status.
+        """
+        statuses = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            cached = self.local_cache.get(f"user:{user_id}") if self.local_cache is not None else MISSING
+            if cached is MISSING:
+                missing.append(user_id)
+            else:
+                statuses[user_id] = cached
+        if not missing:
+            return statuses
+
+        await self.ensure_connection()
+        try:
+            results = await self.redis.execute_command("SMISMEMBER", REDIS_AUTHORIZED_USERS_KEY, *missing)
+        except Exception as e:
+            logger.error("Error checking authorization for %s users: %s", len(missing), e)
+            statuses.update((user_id, False) for user_id in missing)
+            return statuses
+
+        for user_id, result in zip(missing, results):
+            authorized = bool(int(result))
+            statuses[user_id] = authorized
+            if self.local_cache is not None:
+                self.local_cache.set(f"user:{user_id}", authorized, negative=not authorized)
+        return statuses
+
     async def add_authorized_user(self, user_id: str):
         """
         Add a user to the authorized users list.
@@ -114,8 +486,161 @@ class RedisCache:
         """
         await self.ensure_connection()
         try:
-            logging.info(f"Adding user {user_id} to authorized users list.")
+            logger.info("Adding user %s to authorized users list.", user_id)
             await self.redis.sadd(REDIS_AUTHORIZED_USERS_KEY, user_id)
-            logging.info(f"User {user_id} added to authorized users successfully.")
+            await self._invalidate(f"user:{user_id}")
+            logger.info("User %s added to authorized users successfully.", user_id)
+        except Exception as e:
+            logger.error("Error adding authorized user %s: %s", user_id, e)
+
+    async def claim_keys(self, keys: List[str], ttl: int) -> List[bool]:
+        """
+        Claim idempotency keys with SET NX EX in one pipelined round trip.
+        If Redis fails every key counts as claimed, so events are not dropped.
+
+        :param keys: The idempotency keys of the events.
+        :param ttl: Seconds a claimed key is remembered.
+        :return: For every key, True if this call claimed it and False if it was claimed before.
+        """
+        if not keys:
+            return []
+
+        try:
+            await self.ensure_connection()
+            pipeline = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipeline.set(f"{REDIS_DEDUP_PREFIX}{key}", 1, nx=True, ex=ttl)
+            results = await pipeline.execute()
+        except Exception as e:
+            logger.error("Error claiming %s idempotency keys: %s", len(keys), e)
+            return [True] * len(keys)
+        return [bool(result) for result in results]
+
+    async def release_keys(self, keys: List[str]):
+        """
+        Forget claimed idempotency keys, so the events can be sent again after they failed to be stored.
+        """
+        if not keys:
+            return
+
+        try:
+            await self.ensure_connection()
+            await self.redis.delete(*[f"{REDIS_DEDUP_PREFIX}{key}" for key in keys])
+        except Exception as e:
+            logger.error("Error releasing %s idempotency keys: %s", len(keys), e)
+
+    async def open_alert_windows(self, windows: List[Tuple[str, int]], max_age: int) -> List[str]:
+        """
+        Open or extend alert cooldown windows in one atomic script call.
+        If Redis fails every window counts as new, so alerts are stored as without cooldowns.
+
+        :param windows: (window key, cooldown in milliseconds) pairs, a key may repeat.
+        :param max_age: Milliseconds after its opening that a window closes however often it was extended.
+        :return: For every window "new", "pending" or the id of the alert to collapse into.
+        """
+        if not windows:
+            return []
+
+        try:
+            await self.ensure_connection()
+            if self._alert_window is None or self._alert_window.registered_client is not self.redis:
+                self._alert_window = self.redis.register_script(ALERT_WINDOW_SCRIPT)
+            result = await self._alert_window(
+                keys=[f"{REDIS_ALERT_WINDOW_PREFIX}{key}" for key, _ in windows],
+                args=[max_age] + [cooldown for _, cooldown in windows],
+            )
         except Exception as e:
-            logging.error(f"Error adding authorized user {user_id}: {e}")
+            logger.error("Error opening %s alert windows: %s", len(windows), e)
+            return ["new"] * len(windows)
+        return [value.decode() if isinstance(value, bytes) else str(value) for value in result]
+
+    async def attach_alerts(self, alerts: List[Tuple[str, int]]) -> List[int]:
+        """
+        Record the ids of the alerts inserted for new windows.
+
+        :param alerts: (window key, alert id) pairs.
+        :return: For every window, the occurrences that arrived while its alert was being inserted.
+        """
+        if not alerts:
+            return []
+
+        try:
+            await self.ensure_connection()
+            if self._alert_attach is None or self._alert_attach.registered_client is not self.redis:
+                self._alert_attach = self.redis.register_script(ALERT_ATTACH_SCRIPT)
+            result = await self._alert_attach(
+                keys=[f"{REDIS_ALERT_WINDOW_PREFIX}{key}" for key, _ in alerts],
+                args=[alert_id for _, alert_id in alerts],
+            )
+        except Exception as e:
+            logger.error("Error attaching %s alerts to their windows: %s", len(alerts), e)
+            return [0] * len(alerts)
+        return [int(value) for value in result]
+
+    async def close_alert_windows(self, keys: List[str]):
+        """
+        Close windows whose alert could not be stored, so the next occurrence inserts it again.
+        """
+        if not keys:
+            return
+
+        try:
+            await self.ensure_connection()
+            await self.redis.delete(*[f"{REDIS_ALERT_WINDOW_PREFIX}{key}" for key in keys])
+        except Exception as e:
+            logger.error("Error closing %s alert windows: %s", len(keys), e)
+
+    async def save_window_snapshot(self, name: str, snapshot: str, ttl: Optional[int] = None):
+        """
+        Store the snapshot of the windowed alert rules of a consumer process.
+
+        :param name: Name of the snapshot, e.g. the worker index of the process.
+        :param snapshot: The serialized windows.
+        :param ttl: Seconds until the snapshot expires, None keeps it.
+        """
+        try:
+            await self.ensure_connection()
+            await self.redis.set(f"{REDIS_WINDOW_SNAPSHOT_PREFIX}{name}", snapshot, ex=ttl)
+        except Exception as e:
+            logger.error("Error saving window snapshot %s: %s", name, e)
+
+    async def load_window_snapshot(self, name: str) -> Optional[str]:
+        """
+        The last snapshot of the windowed alert rules of a consumer process, or None.
+        """
+        try:
+            await self.ensure_connection()
+            return await self.redis.get(f"{REDIS_WINDOW_SNAPSHOT_PREFIX}{name}")
+        except Exception as e:
+            logger.error("Error loading window snapshot %s: %s", name, e)
+            return None
+
+    async def take_tokens(self, costs: Dict[str, int], rate: float, burst: int) -> Dict[str, Tuple[int, float]]:
+        """
+        Take tokens from the rate limit bucket of every device in one atomic script call.
+        If Redis fails every request is granted, the limit must not take the ingestion down with it.
+
+        :param costs: A dictionary mapping device_id to the number of events it wants to send.
+        :param rate: Tokens added per second.
+        :param burst: Capacity of a bucket.
+        :return: A dictionary mapping device_id to the events granted and the seconds until the rest would be.
+        """
+        if not costs:
+            return {}
+
+        try:
+            await self.ensure_connection()
+            if self._token_bucket is None or self._token_bucket.registered_client is not self.redis:
+                self._token_bucket = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+            result = await self._token_bucket(
+                keys=[f"{REDIS_RATE_LIMIT_PREFIX}{device_id}" for device_id in costs],
+                args=[rate, burst, *costs.values()],
+            )
+        except Exception as e:
+            logger.error("Error taking rate limit tokens for %s devices: %s", len(costs), e)
+            return {device_id: (cost, 0.0) for device_id, cost in costs.items()}
+
+        return {
+            device_id: (int(result[2 * index]), max(0.0, int(result[2 * index + 1]) / 1000))
+            for index, device_id in enumerate(costs)
+        }
@@ -0,0 +1,127 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Optional
+from uuid import UUID
+from fastapi.responses import JSONResponse, ORJSONResponse
+from config import config
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional speedup
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = "application/json"
+MSGPACK_CONTENT_TYPE = "application/msgpack"
+
+
+def encode_default(value):
+    """
+    Encode the values the standard encoders do not know, the same way orjson does.
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+class Codec(ABC):
+    """
+    Serializes broker messages and cache values to bytes and back.
+    """
+    name = None
+    content_type = None
+
+    @abstractmethod
+    def encode(self, value) -> bytes:
+        ...
+
+    @abstractmethod
+    def decode(self, data):
+        ...
+
+
+class JsonCodec(Codec):
+    name = "json"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, value) -> bytes:
+        return json.dumps(value, default=encode_default).encode()
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+    content_type = JSON_CONTENT_TYPE
+
+    def encode(self, value) -> bytes:
+        return orjson.dumps(value, default=encode_default)
+
+    def decode(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+    content_type = MSGPACK_CONTENT_TYPE
+
+    def encode(self, value) -> bytes:
+        return msgpack.packb(value, default=encode_default, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+# Codecs available in this installation, selected by name with BROKER_CODEC and CACHE_CODEC
+CODECS = {"json": JsonCodec()}
+if orjson is not None:
+    CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    CODECS["msgpack"] = MsgpackCodec()
+
+
+def get_codec(name: str) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"Codec {name} is unknown or its package is not installed")
+    return CODECS[name]
+
+
+# The fastest installed codec producing JSON
+json_codec = CODECS.get("orjson", CODECS["json"])
+
+
+def codec_for(content_type: Optional[str]) -> Codec:
+    """
+    Pick the codec for a received message from its content type.
+    Messages without a content type come from producers that predate it and are JSON.
+    """
+    if content_type == MSGPACK_CONTENT_TYPE:
+        return get_codec("msgpack")
+    return json_codec
+
+
+def decode_message(body: bytes, content_type: Optional[str] = None):
+    return codec_for(content_type).decode(body)
+
+
+broker_codec = get_codec(config.BROKER_CODEC)
+
+# Cache values are read by every service instance, so they stay JSON whatever the codec
+cache_codec = get_codec(config.CACHE_CODEC)
+if cache_codec.content_type != JSON_CONTENT_TYPE:
+    logger.warning("CACHE_CODEC %s does not produce JSON, using %s.", cache_codec.name, json_codec.name)
+    cache_codec = json_codec
+
+# Response class of both APIs, orjson renders large event and alert lists several times faster
+APIResponse = ORJSONResponse if orjson is not None else JSONResponse
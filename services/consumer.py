@@ -1,108 +1,385 @@
-import json
+import asyncio
 import logging
 import aio_pika
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from alerting_service.app.models import Alert
 from services.cache import RedisCache
-from services.db import SessionLocal
+from services.db import AsyncSessionLocal
+from services.debounce import AlertDebouncer, collapse_alerts
+from services.dedup import DuplicateFilter
+from services.metrics import (
+    ALERTS_TOTAL, CACHE_L1_STATS, DUPLICATES_TOTAL, INFLIGHT, REDIS_POOL_CONNECTIONS, WINDOW_KEYS, StageTimer,
+    observe_lag
+)
+from services.rollups import RollupAggregator
+from services.rules import RuleEngine
+from services.sharding import assign_queues, ordered_delivery, queue_arguments, queue_names, shard_count
+from services.transport import decode_payload, get_memory_transport
 from config import config
 from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 redis_cache = RedisCache()
+rule_engine = RuleEngine(ordered=ordered_delivery())
+window_store = rule_engine.windows
+rollup_aggregator = RollupAggregator("alerts")
+# Keys of the events processed by this process, so redelivered messages are skipped with an in-memory check
+event_filter = DuplicateFilter(stage="consumer")
+alert_debouncer = AlertDebouncer()
+REDIS_POOL_CONNECTIONS.set_function(redis_cache.pool_connections)
+CACHE_L1_STATS.set_function(redis_cache.cache_metrics)
+WINDOW_KEYS.set_function(lambda: {(): len(window_store)})
 
 
 class RabbitMQConsumer:
-    def __init__(self):
+    def __init__(self, transport=None, queues: List[str] = None, arguments: dict = None):
+        """
+        Consume events from RabbitMQ, or from another transport such as the in-process queue.
+
+        :param transport: Transport to consume from instead of RabbitMQ. With BROKER_TRANSPORT=memory
+            the in-process transport of this process is used by default.
+        :param queues: Queues to consume from on one channel, RABBITMQ_QUEUE by default.
+        :param arguments: Arguments the queues are declared with, e.g. SHARD_QUEUE_ARGUMENTS.
+        """
+        if transport is None and config.BROKER_TRANSPORT == "memory":
+            transport = get_memory_transport()
+        self.transport = transport
+        self.queue_names = queues
+        self.arguments = arguments
         self.connection = None
+        self._owns_connection = True
         self.channel = None
         self.queue = None
+        self.queues = []
+        self.batch_mode = config.CONSUMER_BATCH_MODE
+        self.batch_size = config.CONSUMER_BATCH_SIZE
+        self.flush_interval = config.CONSUMER_FLUSH_INTERVAL_MS / 1000
+        self._batch = []
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
 
-    async def connect(self):
+    @property
+    def snapshot_name(self) -> str:
+        """
+        Name of the window snapshot of this consumer, after the queues it consumes, so a restarted consumer
+        restores the windows of the same devices and consumers of other queues or transports never share one.
+        """
+        queues = ",".join(self.queue_names or [config.RABBITMQ_QUEUE])
+        return f"memory:{queues}" if self.transport is not None else queues
+
+    async def connect(self, connection=None):
         """
         Establish an asynchronous connection to RabbitMQ and declare the queue.
+
+        :param connection: An open connection to add this consumer's channel to, instead of opening one.
         """
-        logging.info("Connecting to RabbitMQ...")
-        self.connection = await aio_pika.connect_robust(config.RABBITMQ_URL)
+        if self.transport is not None:
+            await self.transport.connect()
+            return
+        if connection is None:
+            logger.info("Connecting to RabbitMQ...")
+            connection = await aio_pika.connect_robust(config.RABBITMQ_URL)
+        else:
+            self._owns_connection = False
+        self.connection = connection
         self.channel = await self.connection.channel()
-        # await self.channel.set_qos(prefetch_count=1)
-        self.queue = await self.channel.declare_queue(config.RABBITMQ_QUEUE, durable=True)
-        logging.info("Connected to RabbitMQ and queue declared.")
+        await self.channel.set_qos(prefetch_count=config.RABBITMQ_PREFETCH_COUNT)
+        for name in self.queue_names or [config.RABBITMQ_QUEUE]:
+            if self.arguments:
+                queue = await self.channel.declare_queue(name, durable=True, arguments=self.arguments)
+            else:
+                queue = await self.channel.declare_queue(name, durable=True)
+            self.queues.append(queue)
+        self.queue = self.queues[0]
+        logger.info("Connected to RabbitMQ and queue declared.")
 
     async def consume(self):
         """
         Start consuming messages from RabbitMQ asynchronously.
         """
-        logging.info("Starting RabbitMQ consumer...")
-        await self.queue.consume(self.callback, no_ack=False)
+        logger.info("Starting RabbitMQ consumer...")
+        callback = self.batch_callback if self.batch_mode else self.callback
+        if self.transport is not None:
+            await self.transport.consume(callback)
+        else:
+            for queue in self.queues:
+                await queue.consume(callback, no_ack=False)
 
     async def callback(self, message: aio_pika.IncomingMessage):
         """
         Callback function to process each message.
         """
-        async with message.process():
+        INFLIGHT.labels("consume").inc()
+        try:
+            async with message.process():
+                try:
+                    event = decode_payload(message)
+                    logger.debug("Received event: %s", event)
+                    if event_filter.seen(event.get("event_key")):
+                        logger.debug("Skipped redelivered event %s.", event.get("event_key"))
+                        return
+                    await self.process_event(event)
+                except Exception as e:
+                    logger.error("Failed to process message: %s", e)
+        finally:
+            INFLIGHT.labels("consume").dec()
+            observe_lag(message.headers)
+
+    async def batch_callback(self, message: aio_pika.IncomingMessage):
+        """
+        Callback function used in batch mode. Buffers messages until the batch is full
+        or the flush interval has passed.
+        """
+        self._batch.append(message)
+        INFLIGHT.labels("consume").inc()
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.flush_interval, lambda: asyncio.ensure_future(self.flush())
+            )
+
+    async def flush(self):
+        """
+        Evaluate the buffered messages, store all resulting alerts in one transaction
+        and acknowledge the whole batch with a single multiple-ack.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        async with self._flush_lock:
+            messages, self._batch = self._batch, []
+            if not messages:
+                return
+            timer = StageTimer("process_batch")
+
+            # Group the decoded events by type so each group is evaluated in one pass, skipping redeliveries
+            events_by_type = {}
+            keys = set()
+            for message in messages:
+                try:
+                    event = decode_payload(message)
+                    key = event.get("event_key")
+                    if key in keys:
+                        DUPLICATES_TOTAL.labels(event_filter.stage).inc()
+                        continue
+                    if event_filter.seen(key):
+                        continue
+                    if key:
+                        keys.add(key)
+                    events_by_type.setdefault(event.get("event_type"), []).append(event)
+                except Exception as e:
+                    logger.error("Failed to process message: %s", e)
+            timer.lap("decode")
+
+            # Record the earlier events of sequence rules first, the types are evaluated one after another
+            for event_type, events in events_by_type.items():
+                try:
+                    rule_engine.observe(event_type, events)
+                except Exception as e:
+                    logger.error("Failed to observe %s events: %s", event_type, e)
+
+            alerts = []
+            for event_type, events in events_by_type.items():
+                try:
+                    descriptions = await rule_engine.evaluate_batch(event_type, events, redis_cache, observed=True)
+                except Exception as e:
+                    logger.error("Failed to evaluate %s events: %s", event_type, e)
+                    continue
+                alerts.extend(
+                    self.new_alert(event, description)
+                    for event, description in zip(events, descriptions)
+                    if description
+                )
+            timer.lap("evaluate")
+
+            session: AsyncSession = AsyncSessionLocal()
+            new_alerts = []
             try:
-                event = json.loads(message.body)
-                logging.info(f"Received event: {event}")
-                await self.process_event(event)
+                if alerts:
+                    # Alerts of a device and event type that is still in its cooldown only add occurrences
+                    new_alerts, collapsed = await alert_debouncer.split(redis_cache, alerts)
+                    session.add_all(new_alerts)
+                    await collapse_alerts(session, collapsed)
+                    await session.commit()
+                    await self.attach_alerts(session, new_alerts)
+                    self.record_alerts(new_alerts)
+                    logger.info(
+                        "Stored %s alerts from batch of %s messages, collapsed %s.",
+                        len(new_alerts), len(messages), len(alerts) - len(new_alerts)
+                    )
             except Exception as e:
-                logging.error(f"Failed to process message: {e}")
+                logger.error("Error storing alert batch: %s", e)
+                await session.rollback()
+                await alert_debouncer.release(redis_cache, new_alerts)
+                await messages[-1].nack(multiple=True, requeue=True)
+                return
+            finally:
+                await session.close()
+                INFLIGHT.labels("consume").dec(len(messages))
+
+            event_filter.remember(list(keys))
+            await messages[-1].ack(multiple=True)
+            timer.lap("commit")
+            timer.finish()
+            for message in messages:
+                observe_lag(message.headers)
+
+    async def build_alert(self, event) -> Optional[Alert]:
+        """
+        Decide whether the event triggers an alert.
+
+        :param event: The decoded event message.
+        :return: A new, unsaved Alert or None if no alert is needed.
+        """
+        alert_description = await rule_engine.evaluate(event, redis_cache)
+        if not alert_description:
+            return None
+
+        return self.new_alert(event, alert_description)
+
+    @staticmethod
+    def new_alert(event, alert_description: str) -> Alert:
+        """
+        Create an unsaved Alert for an event that matched a rule.
+        """
+        logger.warning(alert_description)
+        now = datetime.now()
+        return Alert(
+            device_id=event.get("device_id"),
+            event_type=event.get("event_type"),
+            description=alert_description,
+            meta_data=event.get("meta_data"),
+            created_at=now,
+            occurrence_count=1,
+            last_seen_at=now
+        )
+
+    @staticmethod
+    async def attach_alerts(session: AsyncSession, alerts: List[Alert]):
+        """
+        Record committed alerts in their cooldown windows and add the occurrences collapsed while they were
+        being inserted. The alerts are stored either way, so errors are only logged.
+        """
+        try:
+            pending = await alert_debouncer.attach(redis_cache, alerts)
+            if pending:
+                await collapse_alerts(session, pending)
+                await session.commit()
+        except Exception as e:
+            logger.error("Error attaching %s alerts to their cooldown windows: %s", len(alerts), e)
+
+    @staticmethod
+    def record_alerts(alerts):
+        """
+        Count stored alerts in the metrics and in the per-minute and hourly rollups.
+        Alerts collapsed into an earlier one are counted by the debouncer in iot_alerts_collapsed_total.
+        """
+        for alert in alerts:
+            ALERTS_TOTAL.labels(alert.event_type).inc()
+            rollup_aggregator.add(alert.device_id, alert.event_type, alert.created_at, alert.meta_data)
 
     async def process_event(self, event):
         """
         Process the event and decide whether to trigger an alert. Store alerts in PostgreSQL.
         """
-        session: Session = SessionLocal()
+        session: AsyncSession = AsyncSessionLocal()
+        timer = StageTimer("process_event")
 
+        new_alerts = []
         try:
-            alert_description = None
-            event_type = event.get("event_type")
+            alert = await self.build_alert(event)
+            timer.lap("evaluate")
+            if alert:
+                new_alerts, collapsed = await alert_debouncer.split(redis_cache, [alert])
+                if new_alerts:
+                    session.add(alert)
+                await collapse_alerts(session, collapsed)
+                await session.commit()
+                timer.lap("commit")
+                await self.attach_alerts(session, new_alerts)
+                self.record_alerts(new_alerts)
+                if new_alerts:
+                    logger.info("Alert stored in database: %s", alert.description)
+                else:
+                    logger.info("Alert collapsed into an earlier one: %s", alert.description)
+            event_filter.remember([event.get("event_key")])
+            timer.finish()
 
-            if event_type == "access_attempt":
-                user_id = event.get("meta_data", {}).get("user_id")
+        except Exception as e:
+            logger.error("Error processing event: %s", e)
+            await session.rollback()
+            await alert_debouncer.release(redis_cache, new_alerts)
 
-                authorized = await redis_cache.is_authorized_user(user_id)
-                if not authorized:
-                    alert_description = f"user is not authorized to access"
+        finally:
+            await session.close()
 
-            elif event_type == "speed_violation":
-                speed = event.get("meta_data", {}).get("speed_kmh", 0)
-                if speed > 100:
-                    alert_description = f"Speed violation detected: {speed} km/h"
+    async def close(self):
+        """
+        Flush any buffered batch and close RabbitMQ connection.
+        """
+        if self._batch:
+            await self.flush()
+        if self.connection and self._owns_connection:
+            await self.connection.close()
+            logger.info("RabbitMQ connection closed.")
+        elif self.channel:
+            await self.channel.close()
 
-            elif event_type == "motion_detected":
-                confidence = event.get("meta_data", {}).get("confidence", 0)
-                if confidence > 0.9:
-                    alert_description = f"Motion detected with high confidence: {confidence}"
 
-            else:
-                logging.info(f"No alert generated for event type: {event_type}")
+class ConsumerGroup:
+    def __init__(self, concurrency: int = None, worker_index: int = 0, workers: int = None, transport=None):
+        """
+        Several consumers in one process, each on its own channel with its own prefetch window and batch.
+        With RABBITMQ_SHARDS the shard queues are dealt out over the consumers of all worker processes,
+        so every device is handled by one consumer at a time and its events stay in order.
 
-            if alert_description:
-                logging.warning(alert_description)
+        :param concurrency: Consumers in this process, CONSUMER_CONCURRENCY by default.
+        :param worker_index: Index of this process among the workers started by the supervisor.
+        :param workers: Number of worker processes, CONSUMER_WORKERS by default.
+        :param transport: Transport to consume from instead of RabbitMQ, see RabbitMQConsumer.
+        """
+        self.concurrency = max(1, concurrency or config.CONSUMER_CONCURRENCY)
+        workers = max(1, workers or config.CONSUMER_WORKERS)
+        shards = shard_count()
+        queues = queue_names(config.RABBITMQ_QUEUE, shards)
+        slots = workers * self.concurrency
+        if 1 < shards < slots:
+            logger.warning("%s consumers share %s shard queues, %s of them stay idle.", slots, shards, slots - shards)
 
-                new_alert = Alert(
-                    event_type=event_type,
-                    description=alert_description,
-                    meta_data=event.get("meta_data"),
-                    created_at=datetime.now()
-                )
+        self.connection = None
+        self.consumers = []
+        for index in range(self.concurrency):
+            assigned = assign_queues(queues, worker_index * self.concurrency + index, slots)
+            if assigned:
+                self.consumers.append(RabbitMQConsumer(transport, assigned, queue_arguments(shards)))
 
-                session.add(new_alert)
-                session.commit()
-                logging.info(f"Alert stored in database: {alert_description}")
+    @property
+    def snapshot_name(self) -> Optional[str]:
+        """
+        Name of the window snapshot of this process, after the queues of its consumers. None without consumers.
+        """
+        return ",".join(consumer.snapshot_name for consumer in self.consumers) or None
 
-        except Exception as e:
-            logging.error(f"Error processing event: {e}")
-            session.rollback()
+    async def connect(self):
+        """
+        Open one connection and a channel per consumer.
+        """
+        if self.consumers and self.consumers[0].transport is None:
+            logger.info("Connecting to RabbitMQ with %s consumers...", len(self.consumers))
+            self.connection = await aio_pika.connect_robust(config.RABBITMQ_URL)
+        for consumer in self.consumers:
+            await consumer.connect(self.connection)
 
-        finally:
-            session.close()
+    async def consume(self):
+        await asyncio.gather(*(consumer.consume() for consumer in self.consumers))
 
     async def close(self):
-        """
-        Close RabbitMQ connection.
-        """
+        await asyncio.gather(*(consumer.close() for consumer in self.consumers), return_exceptions=True)
         if self.connection:
             await self.connection.close()
-            logging.info("RabbitMQ connection closed.")
+            self.connection = None
+            logger.info("RabbitMQ connection closed.")
@@ -0,0 +1,125 @@
+"""
+Run the alert consumer in several worker processes, restarting any that exit.
+
+Usage:
+    python -m services.consumer_supervisor --workers 4
+
+Each worker runs CONSUMER_CONCURRENCY consumers. With RABBITMQ_SHARDS, the shard queues are dealt out over all
+consumers of all workers, so use at least workers x concurrency shards. Turn off ALERTING_CONSUMER_ENABLED
+for the alerting API while the supervisor runs the consumers.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from config import config
+from services.logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between restarts of a worker that keeps exiting, and for workers to stop on shutdown
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 30.0
+
+
+async def run_worker(worker_index: int, workers: int):
+    """
+    Consume until SIGTERM or SIGINT, then flush the pending batch and rollups and snapshot the windows.
+    """
+    from services.consumer import ConsumerGroup, redis_cache, rollup_aggregator, window_store
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    group = ConsumerGroup(worker_index=worker_index, workers=workers)
+    await redis_cache.connect()
+    await group.connect()
+    consume_task = asyncio.create_task(group.consume())
+    rollup_task = asyncio.create_task(rollup_aggregator.run_forever())
+    snapshot_name = group.snapshot_name
+    window_task = asyncio.create_task(window_store.run_forever(redis_cache, snapshot_name)) if snapshot_name else None
+    logger.info("Consumer worker %s of %s started with %s consumers.", worker_index, workers, len(group.consumers))
+
+    await stop.wait()
+    consume_task.cancel()
+    await asyncio.gather(consume_task, return_exceptions=True)
+    await group.close()
+    if window_task:
+        window_task.cancel()
+        await window_store.save(redis_cache, snapshot_name)
+    rollup_task.cancel()
+    await rollup_aggregator.flush()
+    await redis_cache.disconnect()
+    logger.info("Consumer worker %s stopped.", worker_index)
+
+
+def worker_main(worker_index: int, workers: int):
+    setup_logging()
+    asyncio.run(run_worker(worker_index, workers))
+
+
+class Supervisor:
+    def __init__(self, workers: int = None):
+        """
+        Start and watch the consumer worker processes.
+        Workers are started with the spawn method, so they do not inherit the supervisor's threads.
+
+        :param workers: Number of worker processes, CONSUMER_WORKERS by default.
+        """
+        self.workers = max(1, workers or config.CONSUMER_WORKERS)
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = {}
+        self.stopping = False
+
+    def start_worker(self, index: int):
+        process = self.context.Process(
+            target=worker_main, args=(index, self.workers), name=f"alert-consumer-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info("Started consumer worker %s (pid %s).", index, process.pid)
+
+    def stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.start_worker(index)
+
+        while not self.stopping:
+            time.sleep(RESTART_DELAY)
+            for index, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping:
+                    logger.error("Consumer worker %s exited with code %s, restarting.", index, process.exitcode)
+                    self.start_worker(index)
+
+        logger.info("Stopping %s consumer workers...", len(self.processes))
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process in self.processes.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Consumer worker %s did not stop in time, killing it.", process.name)
+                process.kill()
+                process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=config.CONSUMER_WORKERS)
+    args = parser.parse_args()
+
+    setup_logging()
+    Supervisor(args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Tuple
+from sqlalchemy import bindparam, update
+from alerting_service.app.models import Alert
+from services.metrics import ALERTS_COLLAPSED_TOTAL
+from config import config
+
+logger = logging.getLogger(__name__)
+
+alerts_table = Alert.__table__
+
+# Adds occurrences to existing alerts, executed once with the parameters of every collapsed alert
+COLLAPSE_STATEMENT = (
+    update(alerts_table)
+    .where(alerts_table.c.id == bindparam("alert_id"))
+    .values(
+        occurrence_count=alerts_table.c.occurrence_count + bindparam("occurrences"),
+        last_seen_at=bindparam("seen_at"),
+    )
+)
+
+
+def parse_cooldowns(value: str) -> Dict[str, float]:
+    """
+    Parse "motion_detected=30,speed_violation=300" into a mapping of event type to cooldown seconds.
+    """
+    cooldowns = {}
+    for item in value.split(","):
+        if "=" in item:
+            event_type, seconds = item.split("=", 1)
+            cooldowns[event_type.strip()] = float(seconds)
+    return cooldowns
+
+
+async def collapse_alerts(session, collapsed: Dict[int, Tuple[int, datetime]]):
+    """
+    Add occurrences to stored alerts with one UPDATE statement.
+
+    :param collapsed: A dictionary mapping alert id to the occurrences to add and the time of the last one.
+    """
+    if collapsed:
+        await session.execute(
+            COLLAPSE_STATEMENT,
+            [
+                {"alert_id": alert_id, "occurrences": occurrences, "seen_at": seen_at}
+                for alert_id, (occurrences, seen_at) in collapsed.items()
+            ],
+        )
+
+
+class AlertDebouncer:
+    def __init__(self, cooldown: float = None, cooldowns: Dict[str, float] = None, max_age: float = None):
+        """
+        Collapse repeated alerts of a device and event type into one row while their cooldown window is open.
+        Windows live in Redis, so every consumer replica sees the same ones. Each occurrence extends its
+        window, so a device that keeps alerting adds to the same alert until it has been quiet for a whole
+        cooldown, but at most max_age after the alert was raised. A device that never stops alerting thus
+        gets a new alert every max_age.
+
+        :param cooldown: Window length in seconds, ALERT_COOLDOWN_SECONDS by default. 0 disables collapsing.
+        :param cooldowns: Window lengths of single event types, ALERT_COOLDOWNS by default.
+        :param max_age: Longest time in seconds a window stays open after its first alert,
+            ALERT_COOLDOWN_MAX_SECONDS by default. Cooldowns longer than this are kept.
+        """
+        self.cooldown = config.ALERT_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self.cooldowns = parse_cooldowns(config.ALERT_COOLDOWNS) if cooldowns is None else cooldowns
+        self.max_age = config.ALERT_COOLDOWN_MAX_SECONDS if max_age is None else max_age
+
+    def cooldown_for(self, event_type: str) -> float:
+        return self.cooldowns.get(event_type, self.cooldown)
+
+    @staticmethod
+    def window_key(alert: Alert) -> str:
+        return f"{alert.event_type}:{alert.device_id}"
+
+    def _windowed(self, alerts: List[Alert]) -> List[Alert]:
+        return [alert for alert in alerts if self.cooldown_for(alert.event_type) > 0]
+
+    async def split(self, cache, alerts: List[Alert]) -> Tuple[List[Alert], Dict[int, Tuple[int, datetime]]]:
+        """
+        Open or extend the window of every alert.
+
+        :param cache: The RedisCache holding the windows.
+        :return: The alerts to insert, and the occurrences to add to stored alerts as collapse_alerts expects.
+        """
+        windowed = self._windowed(alerts)
+        if not windowed:
+            return list(alerts), {}
+
+        results = await cache.open_alert_windows(
+            [(self.window_key(alert), int(self.cooldown_for(alert.event_type) * 1000)) for alert in windowed],
+            int(self.max_age * 1000),
+        )
+        decisions = {id(alert): result for alert, result in zip(windowed, results)}
+        new = []
+        collapsed = {}
+        for alert in alerts:
+            result = decisions.get(id(alert), "new")
+            if result == "new":
+                new.append(alert)
+                continue
+            ALERTS_COLLAPSED_TOTAL.labels(alert.event_type).inc()
+            if result != "pending":
+                occurrences, seen_at = collapsed.get(int(result), (0, alert.created_at))
+                collapsed[int(result)] = (occurrences + 1, max(seen_at, alert.created_at))
+        if len(new) < len(alerts):
+            logger.debug("Collapsed %s of %s alerts into earlier ones.", len(alerts) - len(new), len(alerts))
+        return new, collapsed
+
+    async def attach(self, cache, alerts: List[Alert]) -> Dict[int, Tuple[int, datetime]]:
+        """
+        Record the ids of inserted alerts in their windows, once they are committed.
+
+        :return: The occurrences that arrived while the alerts were inserted, as collapse_alerts expects.
+        """
+        windowed = [alert for alert in self._windowed(alerts) if alert.id is not None]
+        pending = await cache.attach_alerts([(self.window_key(alert), alert.id) for alert in windowed])
+        now = datetime.now()
+        return {alert.id: (occurrences, now) for alert, occurrences in zip(windowed, pending) if occurrences}
+
+    async def release(self, cache, alerts: List[Alert]):
+        """
+        Close the windows opened for alerts that could not be stored.
+        """
+        windowed = self._windowed(alerts)
+        if windowed:
+            await cache.close_alert_windows([self.window_key(alert) for alert in windowed])
@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import math
+from datetime import datetime
+from typing import List, Optional
+from services.metrics import DUPLICATES_TOTAL
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+def event_key(device_id: str, event_type: str, timestamp: datetime, event_id: Optional[str] = None) -> str:
+    """
+    Idempotency key of an event: the client's event_id, scoped to the device, or else a hash of
+    device_id, event type and timestamp, so a retried event gets the same key.
+    """
+    if event_id:
+        return f"id:{device_id}:{event_id}"
+    identity = f"{device_id}|{event_type}|{timestamp.isoformat()}"
+    return "h:" + hashlib.blake2b(identity.encode(), digest_size=16).hexdigest()
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        A fixed-size set of strings that answers "maybe seen" or "certainly not seen".
+
+        :param capacity: Keys it holds before the false positive rate exceeds error_rate.
+        :param error_rate: Share of unseen keys reported as seen at capacity.
+        """
+        self.capacity = capacity
+        self.bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from the two halves of one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        position = int.from_bytes(digest[:8], "little") % self.bits
+        step = int.from_bytes(digest[8:], "little") | 1
+        for _ in range(self.hashes):
+            yield position
+            position = (position + step) % self.bits
+
+    def __contains__(self, key: str) -> bool:
+        array = self.array
+        for position in self._positions(key):
+            # Most unseen keys stop at the first or second unset bit
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, key: str):
+        array = self.array
+        for position in self._positions(key):
+            array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class RotatingBloomFilter:
+    def __init__(self, capacity: int, error_rate: float):
+        """
+        Two Bloom filters used in turn, so memory stays bounded however many keys pass through.
+        When the current filter is full it replaces the previous one, and an empty filter takes its place.
+        Keys are remembered for at least `capacity` further keys.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous: Optional[BloomFilter] = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.current or (self.previous is not None and key in self.previous)
+
+    def add(self, key: str):
+        if self.current.count >= self.capacity:
+            self.previous, self.current = self.current, BloomFilter(self.capacity, self.error_rate)
+        self.current.add(key)
+
+    @property
+    def memory(self) -> int:
+        """
+        Bytes used by the bit arrays.
+        """
+        return sum(len(bloom.array) for bloom in (self.current, self.previous) if bloom is not None)
+
+
+class DuplicateFilter:
+    def __init__(self, stage: str = "ingestion", ttl: int = None, capacity: int = None, error_rate: float = None,
+                 enabled: bool = None):
+        """
+        Drop retried events before they are stored, published or alerted on.
+        Keys of stored events are kept in a local Bloom filter, so a retry reaching the same process costs one
+        in-memory check. Keys the filter has not seen are claimed in Redis with SET NX EX, which catches
+        retries handled by another replica.
+
+        :param stage: Label of the duplicate counter, "ingestion" or "consumer".
+        :param ttl: Seconds a key is kept in Redis, DEDUP_TTL by default.
+        :param capacity: Keys per Bloom filter generation, DEDUP_FILTER_CAPACITY by default.
+        :param error_rate: False positive rate of the filter, DEDUP_ERROR_RATE by default. A false positive
+            drops a new event as a duplicate.
+        :param enabled: DEDUP_ENABLED by default.
+        """
+        self.stage = stage
+        self.ttl = config.DEDUP_TTL if ttl is None else ttl
+        self.enabled = config.DEDUP_ENABLED if enabled is None else enabled
+        self.local = RotatingBloomFilter(
+            config.DEDUP_FILTER_CAPACITY if capacity is None else capacity,
+            config.DEDUP_ERROR_RATE if error_rate is None else error_rate,
+        )
+
+    def seen(self, key: Optional[str]) -> bool:
+        """
+        Check a key against the local filter only.
+        """
+        if not self.enabled or not key or key not in self.local:
+            return False
+        DUPLICATES_TOTAL.labels(self.stage).inc()
+        return True
+
+    async def claim(self, cache, keys: List[str]) -> List[bool]:
+        """
+        Claim the keys of new events. Keys repeated within the list are duplicates after their first occurrence.
+
+        :param cache: The RedisCache holding the claimed keys, or None to check the local filter only.
+        :return: For every key, True if the event is new and False if it is a duplicate.
+        """
+        if not self.enabled:
+            return [True] * len(keys)
+
+        new = []
+        pending = set()
+        for key in keys:
+            new.append(key not in self.local and key not in pending)
+            pending.add(key)
+        candidates = [key for key, is_new in zip(keys, new) if is_new]
+        if cache is not None and candidates:
+            claimed = iter(await cache.claim_keys(candidates, self.ttl))
+            new = [next(claimed) if is_new else False for is_new in new]
+
+        duplicates = len(keys) - sum(new)
+        if duplicates:
+            DUPLICATES_TOTAL.labels(self.stage).inc(duplicates)
+            logger.debug("Dropped %s duplicate events of %s.", duplicates, len(keys))
+        return new
+
+    def remember(self, keys: List[str]):
+        """
+        Add the keys of stored events to the local filter.
+        """
+        if self.enabled:
+            for key in keys:
+                if key:
+                    self.local.add(key)
+
+    async def release(self, cache, keys: List[str]):
+        """
+        Forget claimed keys of events that could not be stored, so their retries are accepted.
+        """
+        if self.enabled and cache is not None:
+            await cache.release_keys(keys)
@@ -0,0 +1,150 @@
+import atexit
+import copy
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+from config import config
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+
+_listener = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Put records on the queue for the listener thread, which does the formatting of the log line
+    and the I/O. The message and the exception text are rendered here, while the arguments
+    still hold the values of the call, as the caller may change them or they may not be
+    thread-safe. Records are dropped, and counted, when the queue is full instead of blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, rate: float, level: int = logging.WARNING):
+        """
+        Let through at most `rate` records per second for every message template below `level`.
+        With lazy %-style calls all records of one log line share a template, so a per-event
+        line is sampled while rare lines are unaffected.
+
+        :param rate: Records per second and template, 0 disables the limit.
+        :param level: Records at or above this level are never limited.
+        """
+        super().__init__()
+        self.rate = rate
+        self.level = level
+        self._lock = threading.Lock()
+        # (logger name, template) -> [tokens, last refill, suppressed]
+        self._buckets: Dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= self.level:
+            return True
+
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.rate, now, 0]
+            bucket[0] = min(self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed and isinstance(record.msg, str):
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, fmt: str = LOG_FORMAT, max_length: int = None):
+        """
+        Cut messages down to max_length characters, so dumped payloads do not flood the logs.
+        Tracebacks are kept in full.
+        """
+        super().__init__(fmt)
+        self.max_length = config.LOG_MAX_MESSAGE_LENGTH if max_length is None else max_length
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        if self.max_length and len(record.message) > self.max_length:
+            cut = len(record.message) - self.max_length
+            record.message = f"{record.message[:self.max_length]}... [{cut} more characters]"
+        return super().formatMessage(record)
+
+
+def parse_levels(levels: str) -> Dict[str, str]:
+    """
+    Parse "services.cache=WARNING,aio_pika=ERROR" into a logger name to level mapping.
+    """
+    result = {}
+    for item in levels.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            result[name.strip()] = level.strip().upper()
+    return result
+
+
+def setup_logging():
+    """
+    Send all log records through a bounded queue to a background listener thread.
+    Safe to call more than once, only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(TruncatingFormatter())
+
+    log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+    for name, level in parse_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Write out the queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
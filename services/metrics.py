@@ -0,0 +1,301 @@
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# AMQP header with the publish time (Unix seconds), used to measure the consumer lag
+PUBLISHED_AT_HEADER = "x-published-at"
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow commits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry=None):
+        """
+        Base of the in-process metrics. Children per label combination are created on first use
+        and cached, so the hot path is a dictionary lookup and an addition.
+
+        :param name: Prometheus metric name.
+        :param documentation: HELP text.
+        :param labelnames: Names of the labels; values are passed positionally to labels().
+        :param registry: Registry to expose the metric in, the default one if omitted.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        # Metrics without labels act as their only child
+        return self.labels()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"
+            for values, child in self._children.items()
+        ]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """
+        Compute the gauge at scrape time instead, e.g. from a connection pool.
+
+        :param function: Returns a mapping of label values to the current value.
+        """
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                values = self._function()
+            except Exception:
+                values = {}
+            return [
+                f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+                for labels, value in values.items()
+            ]
+        return [
+            f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"
+            for values, child in self._children.items()
+        ]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, values, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class StageTimer:
+    def __init__(self, operation: str):
+        """
+        Record how long each stage of an operation takes, e.g. the Redis lookup of create_event.
+        Every lap() observes the time since the previous lap under the given stage name.
+        """
+        self.operation = operation
+        self.started = self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> float:
+        now = time.perf_counter()
+        elapsed = now - self.last
+        STAGE_SECONDS.labels(self.operation, stage).observe(elapsed)
+        self.last = now
+        return elapsed
+
+    def finish(self):
+        STAGE_SECONDS.labels(self.operation, "total").observe(time.perf_counter() - self.started)
+
+
+# Metrics shared by both services
+STAGE_SECONDS = Histogram(
+    "iot_stage_duration_seconds", "Duration of the stages of event ingestion and processing.", ["operation", "stage"]
+)
+INFLIGHT = Gauge("iot_inflight", "Requests or messages currently being processed.", ["operation"])
+EVENTS_TOTAL = Counter("iot_events_ingested_total", "Events stored by the ingestion service.", ["event_type"])
+ALERTS_TOTAL = Counter("iot_alerts_total", "Alerts stored by the alert consumer.", ["event_type"])
+ALERTS_COLLAPSED_TOTAL = Counter(
+    "iot_alerts_collapsed_total", "Alerts collapsed into an earlier alert of the same device and event type.",
+    ["event_type"]
+)
+CONSUMER_LAG_SECONDS = Histogram(
+    "iot_consumer_lag_seconds", "Time from publishing an event to finishing its processing.", buckets=LAG_BUCKETS
+)
+CONSUMER_LAST_LAG_SECONDS = Gauge(
+    "iot_consumer_last_lag_seconds", "Lag of the most recently processed message."
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "iot_db_pool_connections", "Connections of the database pools.", ["engine", "state"]
+)
+REDIS_POOL_CONNECTIONS = Gauge(
+    "iot_redis_pool_connections", "Connections of the Redis pool.", ["state"]
+)
+CACHE_L1_STATS = Gauge(
+    "iot_cache_l1_stats", "Size and hit, miss and eviction counts of the in-process cache in front of Redis.", ["stat"]
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "iot_admission_rejected_total", "Requests or events refused with 429, by reason.", ["reason"]
+)
+ADMISSION_LIMIT = Gauge("iot_admission_inflight_limit", "Current in-flight request limit of the ingestion API.")
+PHOTO_POOL_TASKS = Gauge("iot_photo_pool_tasks", "Photos processed and waiting in the photo pool.", ["state"])
+PHOTO_POOL_WORKERS = Gauge("iot_photo_pool_workers", "Workers of the photo pool.")
+DUPLICATES_TOTAL = Counter("iot_duplicate_events_total", "Events dropped as retries of earlier ones.", ["stage"])
+WINDOW_KEYS = Gauge("iot_window_keys", "Windows held by the windowed alert rules of the consumer.")
+
+
+def observe_lag(headers) -> None:
+    """
+    Record the consumer lag of a message from its x-published-at header.
+    """
+    published_at = headers.get(PUBLISHED_AT_HEADER) if isinstance(headers, dict) else None
+    if isinstance(published_at, (int, float)):
+        lag = max(0.0, time.time() - published_at)
+        CONSUMER_LAG_SECONDS.observe(lag)
+        CONSUMER_LAST_LAG_SECONDS.set(lag)
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Expose all metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
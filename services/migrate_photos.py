@@ -0,0 +1,100 @@
+"""
+Move photo bytes out of the photos table into the configured photo store.
+
+Usage:
+    python -m services.migrate_photos --batch-size 500
+
+Rows are processed in id order, in batches, each batch in its own transaction,
+so the tool can be stopped and restarted at any time.
+"""
+import argparse
+import logging
+from sqlalchemy import inspect, select, text, update
+from ingestion_service.app.models import Photo
+from services.db import engine, SessionLocal
+from services.logging_setup import setup_logging
+from services.photo_store import PhotoStore, get_photo_store
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_photo_columns():
+    """
+    Add the photo store and thumbnail columns to a photos table not managed by Alembic
+    and allow empty inline photos. Columns that already exist are left alone.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("photos")}
+    with engine.begin() as connection:
+        if "content_hash" not in columns:
+            logger.info("Adding photos.content_hash column...")
+            connection.execute(text("ALTER TABLE photos ADD COLUMN content_hash VARCHAR(64)"))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_photos_content_hash ON photos (content_hash)"))
+        if "size" not in columns:
+            logger.info("Adding photos.size column...")
+            connection.execute(text("ALTER TABLE photos ADD COLUMN size INTEGER"))
+        if "thumbnail_hash" not in columns:
+            logger.info("Adding photos.thumbnail_hash column...")
+            connection.execute(text("ALTER TABLE photos ADD COLUMN thumbnail_hash VARCHAR(64)"))
+        if engine.dialect.name == "postgresql":
+            connection.execute(text("ALTER TABLE photos ALTER COLUMN photo DROP NOT NULL"))
+
+
+def migrate_photos(batch_size: int = 500, store: PhotoStore = None) -> int:
+    """
+    Copy inline photos to the photo store and clear them from the table.
+
+    :param batch_size: Number of rows read and updated per transaction.
+    :param store: Target photo store, the configured one by default.
+    :return: The number of migrated rows.
+    """
+    store = store or get_photo_store()
+    migrated = 0
+    last_id = 0
+
+    while True:
+        session = SessionLocal()
+        try:
+            rows = session.execute(
+                select(Photo.id, Photo.photo)
+                .where(Photo.id > last_id, Photo.content_hash.is_(None), Photo.photo.isnot(None))
+                .order_by(Photo.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            updates = []
+            for photo_id, photo in rows:
+                content_hash = store.put(photo)
+                updates.append({"id": photo_id, "content_hash": content_hash, "size": len(photo), "photo": None})
+
+            # Bulk UPDATE by primary key
+            session.execute(update(Photo), updates)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error("Failed to migrate photos after id %s: %s", last_id, e)
+            raise
+        finally:
+            session.close()
+
+        last_id = rows[-1][0]
+        migrated += len(rows)
+        logger.info("Migrated %s photos (last id %s).", migrated, last_id)
+
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_logging()
+    ensure_photo_columns()
+    migrated = migrate_photos(batch_size=args.batch_size)
+    logger.info("Photo migration finished, %s photos moved to the photo store.", migrated)
+
+
+if __name__ == "__main__":
+    main()
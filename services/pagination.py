@@ -0,0 +1,90 @@
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Callable, Optional, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import tuple_
+from services.codec import json_codec
+from services.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    """
+    Build an opaque cursor pointing just after the given row.
+
+    :param sort_value: The timestamp of the last returned row.
+    :param row_id: The id of the last returned row, which breaks ties between equal timestamps.
+    """
+    payload = json.dumps([sort_value.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor created by encode_cursor.
+    Raises HTTPException(400) for cursors that were not issued by this service.
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(payload)
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def apply_keyset(statement, sort_column, id_column, cursor: Optional[str]):
+    """
+    Order a select by (sort_column, id_column) and continue after the cursor.
+    The row-value comparison lets PostgreSQL walk a composite index instead of using OFFSET.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(sort_column, id_column) > tuple_(sort_value, row_id))
+    return statement.order_by(sort_column, id_column)
+
+
+def paginate(db, statement, limit: int, cursor_of: Callable):
+    """
+    Fetch one page of ORM objects.
+
+    :param db: The session to query with.
+    :param statement: A select already ordered with apply_keyset.
+    :param limit: Page size.
+    :param cursor_of: Returns the (sort_value, id) of an object.
+    :return: The objects of the page and the cursor of the next page, or None on the last page.
+    """
+    rows = db.scalars(statement.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*cursor_of(rows[-1]))
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def stream_ndjson(statement, serialize: Callable, batch_size: int = 1000):
+    """
+    Yield one JSON document per row, reading the rows through a server-side cursor.
+    Uses its own session because the request session is closed before a streamed body is sent.
+
+    :param statement: The select to stream.
+    :param serialize: Converts a result row into a JSON-serializable dictionary.
+    :param batch_size: Rows fetched from the database per round trip.
+    """
+    session = SessionLocal()
+    try:
+        result = session.execute(statement.execution_options(yield_per=batch_size))
+        for row in result:
+            yield json_codec.encode(serialize(row)) + b"\n"
+    except Exception as e:
+        logger.error("Failed to stream rows: %s", e)
+        raise
+    finally:
+        session.close()
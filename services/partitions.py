@@ -0,0 +1,238 @@
+"""
+Native PostgreSQL range partitioning of the events and alerts tables.
+
+Usage:
+    python -m services.partitions
+
+With DB_PARTITION_INTERVAL set to "day" or "week", init_db creates events and alerts as tables
+partitioned by RANGE on events.timestamp / alerts.created_at, each with a DEFAULT partition for
+rows outside every range. The maintenance pass pre-creates the next DB_PARTITION_PRECREATE
+partitions and drops (or detaches) the partitions that ended more than DB_RETENTION_DAYS ago.
+The services run it periodically; the command above runs it once, e.g. from cron.
+"""
+import asyncio
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+import alerting_service.app.models  # noqa: F401 - registers the alerts table
+import ingestion_service.app.models  # noqa: F401 - registers the events table
+from services.db import Base, engine
+from services.logging_setup import setup_logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Partitioned tables and their partition key
+PARTITIONED_TABLES = {
+    "events": "timestamp",
+    "alerts": "created_at",
+}
+
+PARTITION_INTERVALS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+RETENTION_MODES = ["drop", "detach"]
+
+# Upper bound of a partition as printed by pg_get_expr, e.g. FOR VALUES FROM ('...') TO ('2024-01-02 00:00:00')
+UPPER_BOUND_PATTERN = re.compile(r"TO \('([^']+)'\)")
+
+LIST_PARTITIONS = text("""
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = :table
+""")
+
+
+def partition_start(day: date, interval: str) -> date:
+    """
+    First day of the partition holding the given day. Weekly partitions start on Monday.
+    """
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def partition_name(table: str, start: date) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def partitioned_table(table: Table, column: str) -> Table:
+    """
+    Copy a model table into a table PostgreSQL can partition by RANGE (column).
+    The partition key has to be part of the primary key, so the copy uses (id, column);
+    the ORM models keep mapping id alone.
+
+    :param table: The model table, e.g. Event.__table__.
+    :param column: The partition key column.
+    """
+    partitioned = table.to_metadata(MetaData())
+    partitioned.c.id.autoincrement = True
+    partitioned.c[column].primary_key = True
+    partitioned.append_constraint(PrimaryKeyConstraint(partitioned.c.id, partitioned.c[column]))
+    partitioned.dialect_kwargs["postgresql_partition_by"] = f"RANGE ({column})"
+    return partitioned
+
+
+class PartitionManager:
+    def __init__(self, tables: List[str] = None, interval: str = None, precreate: int = None,
+                 retention_days: int = None, retention_mode: str = None, bind=None):
+        """
+        Create and expire the partitions of the events and alerts tables.
+
+        :param tables: The tables to manage, both by default.
+        :param interval: "day" or "week"; empty disables partitioning.
+        :param precreate: Number of future partitions kept ahead of the current one.
+        :param retention_days: Partitions ending more than this many days ago are expired, 0 keeps them all.
+        :param retention_mode: "drop" deletes expired partitions, "detach" keeps them as standalone tables.
+        :param bind: The engine to run against.
+        """
+        self.tables = tables or list(PARTITIONED_TABLES)
+        self.interval = config.DB_PARTITION_INTERVAL if interval is None else interval
+        self.precreate = config.DB_PARTITION_PRECREATE if precreate is None else precreate
+        self.retention_days = config.DB_RETENTION_DAYS if retention_days is None else retention_days
+        self.retention_mode = retention_mode or config.DB_RETENTION_MODE
+        self.engine = bind or engine
+
+        if self.interval and self.interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Unknown partition interval: {self.interval}")
+        if self.retention_mode not in RETENTION_MODES:
+            raise ValueError(f"Unknown retention mode: {self.retention_mode}")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.interval) and self.engine.dialect.name == "postgresql"
+
+    def create_tables(self, connection):
+        """
+        Create the partitioned parent tables, their indexes and DEFAULT partitions.
+        Tables that already exist are left as they are.
+        """
+        for table in self.tables:
+            if inspect(connection).has_table(table):
+                continue
+            partitioned_table(Base.metadata.tables[table], PARTITIONED_TABLES[table]).create(connection)
+            connection.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+            logger.info("Created partitioned table %s (%sly partitions).", table, self.interval)
+
+    def list_partitions(self, connection, table: str) -> Dict[str, Optional[datetime]]:
+        """
+        Return the partitions of a table with their exclusive upper bound (None for the DEFAULT partition).
+        """
+        partitions = {}
+        for name, bound in connection.execute(LIST_PARTITIONS, {"table": table}):
+            match = UPPER_BOUND_PATTERN.search(bound or "")
+            partitions[name] = datetime.fromisoformat(match.group(1)) if match else None
+        return partitions
+
+    def ensure_partitions(self, connection, today: date = None) -> List[str]:
+        """
+        Create the current partition and the next `precreate` ones.
+
+        :return: The names of the created partitions.
+        """
+        today = today or datetime.utcnow().date()
+        step = PARTITION_INTERVALS[self.interval]
+        first = partition_start(today, self.interval)
+        created = []
+
+        for table in self.tables:
+            existing = self.list_partitions(connection, table)
+            for offset in range(self.precreate + 1):
+                lower = first + offset * step
+                name = partition_name(table, lower)
+                if name in existing:
+                    continue
+                try:
+                    # A savepoint keeps one failing partition from aborting the whole pass
+                    with connection.begin_nested():
+                        connection.execute(text(
+                            f"CREATE TABLE {name} PARTITION OF {table} "
+                            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{(lower + step).isoformat()}')"
+                        ))
+                    created.append(name)
+                except SQLAlchemyError as e:
+                    # Usually rows for this range already sit in the DEFAULT partition
+                    logger.error("Failed to create partition %s: %s", name, e)
+
+        if created:
+            logger.info("Created partitions: %s", ', '.join(created))
+        return created
+
+    def expire_partitions(self, connection, today: date = None) -> List[str]:
+        """
+        Drop or detach the partitions whose whole range is older than the retention.
+
+        :return: The names of the expired partitions.
+        """
+        if not self.retention_days:
+            return []
+        cutoff = datetime.combine(today or datetime.utcnow().date(), datetime.min.time())
+        cutoff -= timedelta(days=self.retention_days)
+        expired = []
+
+        for table in self.tables:
+            for name, upper in self.list_partitions(connection, table).items():
+                if upper is None or upper > cutoff:
+                    continue
+                if self.retention_mode == "detach":
+                    connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                else:
+                    connection.execute(text(f"DROP TABLE {name}"))
+                expired.append(name)
+
+        if expired:
+            logger.info("Expired partitions (%s): %s", self.retention_mode, ', '.join(expired))
+        return expired
+
+    def run_maintenance(self, today: date = None) -> Tuple[List[str], List[str]]:
+        """
+        Run one maintenance pass in a single transaction.
+        An advisory lock keeps replicas of the same service from running it concurrently.
+
+        :return: The created and the expired partitions.
+        """
+        if not self.enabled:
+            return [], []
+        lock_key = "partitions:" + ",".join(sorted(self.tables))
+        with self.engine.begin() as connection:
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:key))"), {"key": lock_key}
+            ).scalar()
+            if not locked:
+                logger.info("Partition maintenance is running elsewhere, skipping.")
+                return [], []
+            created = self.ensure_partitions(connection, today)
+            expired = self.expire_partitions(connection, today)
+        return created, expired
+
+    async def run_forever(self):
+        """
+        Run the maintenance pass every DB_PARTITION_MAINTENANCE_INTERVAL seconds until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.run_maintenance)
+            except Exception as e:
+                logger.error("Partition maintenance failed: %s", e)
+            await asyncio.sleep(config.DB_PARTITION_MAINTENANCE_INTERVAL)
+
+
+def main():
+    setup_logging()
+    manager = PartitionManager()
+    if not manager.enabled:
+        logger.info("Partitioning is disabled (set DB_PARTITION_INTERVAL on a PostgreSQL database).")
+        return
+    created, expired = manager.run_maintenance()
+    logger.info("Partition maintenance finished, %s created, %s expired.", len(created), len(expired))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import asyncio
+import base64
+import binascii
+import io
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, NamedTuple, Optional, Union
+from services.photo_store import PhotoStore
+from config import config
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - thumbnails are optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+PHOTO_POOL_KINDS = ("thread", "process")
+
+
+class PhotoTooLarge(ValueError):
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"Photo of {size} bytes exceeds the limit of {max_bytes} bytes")
+        self.size = size
+        self.max_bytes = max_bytes
+
+
+class InvalidPhoto(ValueError):
+    """
+    The photo_base64 of an event is not valid base64.
+    """
+
+
+class ProcessedPhoto(NamedTuple):
+    content_hash: str
+    size: int
+    thumbnail_hash: Optional[str]
+
+
+def decoded_size(photo_base64: str) -> int:
+    """
+    Size of the decoded photo, computed from the length of the base64 string without decoding it.
+    """
+    padding = photo_base64[-2:].count("=")
+    return len(photo_base64) * 3 // 4 - padding
+
+
+def make_thumbnail(data: bytes, size: int) -> Optional[bytes]:
+    """
+    A JPEG of at most size x size pixels, or None without Pillow or if the photo is not an image.
+    """
+    if Image is None or size <= 0:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # Lets the JPEG decoder skip most of the pixels of large frames
+            image.draft("RGB", (size, size))
+            image.thumbnail((size, size))
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=80)
+            return output.getvalue()
+    except Exception as e:
+        logger.debug("No thumbnail for a photo of %s bytes: %s", len(data), e)
+        return None
+
+
+def process_photo(photo_base64: str, store: PhotoStore, max_bytes: int, thumbnail_size: int) -> ProcessedPhoto:
+    """
+    Decode, check, hash and store a photo and its thumbnail. Runs in a pool worker, and only the hashes
+    travel back to the event loop, not the photo bytes.
+    """
+    try:
+        data = base64.b64decode(photo_base64, validate=True)
+    except binascii.Error as e:
+        raise InvalidPhoto(f"photo_base64 is not valid base64: {e}") from None
+    if max_bytes and len(data) > max_bytes:
+        raise PhotoTooLarge(len(data), max_bytes)
+    content_hash = store.put(data)
+    thumbnail = make_thumbnail(data, thumbnail_size)
+    thumbnail_hash = store.put(thumbnail) if thumbnail else None
+    return ProcessedPhoto(content_hash, len(data), thumbnail_hash)
+
+
+class PhotoProcessor:
+    def __init__(self, workers: int = None, kind: str = None, max_bytes: int = None, thumbnail_size: int = None):
+        """
+        Run photo decoding, hashing and thumbnailing in a worker pool, so large uploads do not block the
+        event loop. A process pool also takes the work off the GIL, at the cost of copying the base64
+        string to the worker.
+
+        :param workers: Pool size, PHOTO_POOL_WORKERS by default.
+        :param kind: "thread" or "process", PHOTO_POOL_KIND by default.
+        :param max_bytes: Largest decoded photo accepted, PHOTO_MAX_BYTES by default. 0 disables the limit.
+        :param thumbnail_size: Longest side of thumbnails in pixels, PHOTO_THUMBNAIL_SIZE by default. 0 disables them.
+        """
+        self.workers = max(1, workers or config.PHOTO_POOL_WORKERS or os.cpu_count() or 1)
+        self.kind = kind or config.PHOTO_POOL_KIND
+        if self.kind not in PHOTO_POOL_KINDS:
+            raise ValueError(f"Unknown PHOTO_POOL_KIND {self.kind}, expected one of {PHOTO_POOL_KINDS}")
+        self.max_bytes = config.PHOTO_MAX_BYTES if max_bytes is None else max_bytes
+        self.thumbnail_size = config.PHOTO_THUMBNAIL_SIZE if thumbnail_size is None else thumbnail_size
+        self.executor: Optional[Executor] = None
+        self.pending = 0
+
+    def too_large(self, photo_base64: str) -> bool:
+        return bool(self.max_bytes) and decoded_size(photo_base64) > self.max_bytes
+
+    def _executor(self) -> Executor:
+        if self.executor is None:
+            if self.kind == "process":
+                self.executor = ProcessPoolExecutor(self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="photo")
+        return self.executor
+
+    async def process(self, photo_base64: str, store: PhotoStore) -> ProcessedPhoto:
+        """
+        Process a photo in the pool.
+
+        :raise PhotoTooLarge: If the decoded photo exceeds max_bytes.
+        :raise InvalidPhoto: If the photo is not valid base64.
+        """
+        if self.too_large(photo_base64):
+            raise PhotoTooLarge(decoded_size(photo_base64), self.max_bytes)
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        try:
+            return await loop.run_in_executor(
+                self._executor(), process_photo, photo_base64, store, self.max_bytes, self.thumbnail_size
+            )
+        finally:
+            self.pending -= 1
+
+    async def process_many(self, photos: List[str], store: PhotoStore) -> List[Union[ProcessedPhoto, Exception]]:
+        """
+        Process several photos in the pool. A photo that fails gets its exception in place of the result,
+        so one bad photo does not fail the others.
+        """
+        return list(await asyncio.gather(*(self.process(photo, store) for photo in photos), return_exceptions=True))
+
+    def pool_tasks(self) -> dict:
+        """
+        Photos being processed and waiting for a worker, for the saturation gauge.
+        """
+        running = min(self.pending, self.workers)
+        return {("running",): running, ("waiting",): self.pending - running}
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class PhotoStore(ABC):
+    """
+    Interface of the photo blob stores. Photos are addressed by the SHA-256 of their content,
+    so identical frames are stored once.
+    """
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @abstractmethod
+    def put(self, data: bytes, content_hash: str = None) -> str:
+        """
+        Store a photo and return its content hash.
+
+        :param data: The raw photo bytes.
+        :param content_hash: The SHA-256 of data, if the caller already computed it.
+        """
+
+    @abstractmethod
+    def exists(self, content_hash: str) -> bool:
+        ...
+
+    @abstractmethod
+    def read(self, content_hash: str):
+        """
+        Context manager giving the photo bytes as a buffer (bytes, memoryview or mmap), valid until it exits:
+            with photo_store.read(content_hash) as buffer: ...
+        Raises FileNotFoundError if the photo is not in the store.
+        """
+
+    def path(self, content_hash: str) -> Optional[str]:
+        """
+        Return a local file path for the photo when the backend has one, so it can be served with sendfile.
+        """
+        return None
+
+    def size(self, content_hash: str) -> int:
+        with self.read(content_hash) as buffer:
+            return len(buffer)
+
+
+class LocalPhotoStore(PhotoStore):
+    def __init__(self, root: str, shard_depth: int = 2):
+        """
+        Store photos on the local filesystem, sharded into directories by hash prefix:
+        <root>/ab/cd/abcd....
+
+        :param root: Base directory of the store.
+        :param shard_depth: Number of two-character directory levels.
+        """
+        self.root = root
+        self.shard_depth = shard_depth
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, content_hash: str) -> str:
+        shards = [content_hash[2 * level:2 * level + 2] for level in range(self.shard_depth)]
+        return os.path.join(self.root, *shards, content_hash)
+
+    def put(self, data: bytes, content_hash: str = None) -> str:
+        content_hash = content_hash or self.content_hash(data)
+        target = self.path(content_hash)
+        if os.path.exists(target):
+            return content_hash
+
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial photo
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, "wb") as photo_file:
+                photo_file.write(data)
+            os.replace(temporary, target)
+        except Exception:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
+        logger.debug("Stored photo %s (%s bytes).", content_hash, len(data))
+        return content_hash
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(self.path(content_hash))
+
+    @contextmanager
+    def read(self, content_hash: str):
+        """
+        Map the photo into memory instead of copying it into a bytes object. The map is closed on exit.
+        """
+        with open(self.path(content_hash), "rb") as photo_file:
+            if os.fstat(photo_file.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(photo_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield buffer
+
+    def size(self, content_hash: str) -> int:
+        return os.path.getsize(self.path(content_hash))
+
+
+# Available photo store backends, selected with PHOTO_STORE_BACKEND
+PHOTO_STORE_BACKENDS = {
+    "local": lambda: LocalPhotoStore(config.PHOTO_STORE_PATH),
+}
+
+_photo_store = None
+
+
+def get_photo_store() -> PhotoStore:
+    """
+    Return the configured photo store, creating it on first use.
+    """
+    global _photo_store
+    if _photo_store is None:
+        backend = config.PHOTO_STORE_BACKEND
+        if backend not in PHOTO_STORE_BACKENDS:
+            raise ValueError(f"Unknown photo store backend: {backend}")
+        _photo_store = PHOTO_STORE_BACKENDS[backend]()
+    return _photo_store
@@ -1,10 +1,15 @@
+import asyncio
 import json
 import logging
+import time
+import aio_pika
 import pika
+from services.codec import Codec, broker_codec
+from services.metrics import PUBLISHED_AT_HEADER
+from services.sharding import queue_arguments, queue_for, queue_names, shard_count
 from config import config
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
 
 
 class RabbitMQPublisher:
@@ -20,13 +25,13 @@ class RabbitMQPublisher:
         Establish a connection to RabbitMQ and declare the queue.
         """
         try:
-            logging.info("Connecting to RabbitMQ...")
+            logger.info("Connecting to RabbitMQ...")
             self.connection = pika.BlockingConnection(pika.URLParameters(config.RABBITMQ_URL))
             self.channel = self.connection.channel()
             self.channel.queue_declare(queue=config.RABBITMQ_QUEUE, durable=True)
-            logging.info("Successfully connected to RabbitMQ.")
+            logger.info("Successfully connected to RabbitMQ.")
         except Exception as e:
-            logging.error(f"Failed to connect to RabbitMQ: {e}")
+            logger.error("Failed to connect to RabbitMQ: %s", e)
             raise ConnectionError(f"RabbitMQ connection failed: {e}")
 
     def publish(self, message: dict):
@@ -36,20 +41,20 @@ class RabbitMQPublisher:
         :param message: The message to be published, as a dictionary.
         """
         if not self.channel:
-            logging.error("RabbitMQ connection not initialized. Call 'connect()' first.")
+            logger.error("RabbitMQ connection not initialized. Call 'connect()' first.")
             raise ConnectionError("RabbitMQ connection not initialized.")
 
         try:
-            logging.info(f"Publishing message to queue {config.RABBITMQ_QUEUE}: {message}")
+            logger.debug("Publishing message to queue %s: %s", config.RABBITMQ_QUEUE, message)
             self.channel.basic_publish(
                 exchange='',
                 routing_key=config.RABBITMQ_QUEUE,
                 body=json.dumps(message),
                 properties=pika.BasicProperties(delivery_mode=2)  # Persistent messages
             )
-            logging.info("Message published successfully.")
+            logger.debug("Message published successfully.")
         except Exception as e:
-            logging.error(f"Failed to publish message: {e}")
+            logger.error("Failed to publish message: %s", e)
             raise RuntimeError(f"Publishing message failed: {e}")
 
     def close(self):
@@ -58,8 +63,185 @@ class RabbitMQPublisher:
         """
         if self.connection:
             try:
-                logging.info("Closing RabbitMQ connection...")
+                logger.info("Closing RabbitMQ connection...")
                 self.connection.close()
-                logging.info("RabbitMQ connection closed.")
+                logger.info("RabbitMQ connection closed.")
             except Exception as e:
-                logging.error(f"Error while closing RabbitMQ connection: {e}")
+                logger.error("Error while closing RabbitMQ connection: %s", e)
+
+
+class AsyncRabbitMQPublisher:
+    def __init__(self, pool_size: int = None, batch_size: int = None, flush_interval_ms: int = None,
+                 codec: Codec = None, shards: int = None):
+        """
+        Initialize an asyncio publisher backed by a pool of persistent channels.
+
+        :param pool_size: Number of channels kept open for publishing.
+        :param batch_size: Maximum number of messages whose confirms are awaited together.
+        :param flush_interval_ms: How long a partial batch may wait before it is published.
+        :param codec: Serializes the message bodies, BROKER_CODEC by default.
+        :param shards: Queues the events are spread over by device_id, RABBITMQ_SHARDS by default.
+        """
+        self.codec = codec or broker_codec
+        self.shards = shards or shard_count()
+        self.pool_size = pool_size or config.RABBITMQ_PUBLISHER_POOL_SIZE
+        self.batch_size = batch_size or config.RABBITMQ_CONFIRM_BATCH_SIZE
+        self.flush_interval = (flush_interval_ms or config.RABBITMQ_CONFIRM_FLUSH_MS) / 1000
+        self.connections = []
+        self.channels = None
+        self._pending = []
+        self._flush_handle = None
+        self._flush_tasks = set()
+        self._unconfirmed = 0
+
+    async def connect(self):
+        """
+        Open the connection pool and declare the queue.
+        Robust connections and channels re-establish themselves after a broker restart.
+        """
+        try:
+            logger.info("Opening RabbitMQ publisher pool with %s channels...", self.pool_size)
+            connection_count = max(1, min(config.RABBITMQ_PUBLISHER_CONNECTIONS, self.pool_size))
+            for _ in range(connection_count):
+                self.connections.append(await aio_pika.connect_robust(config.RABBITMQ_URL))
+
+            self.channels = asyncio.Queue()
+            for index in range(self.pool_size):
+                connection = self.connections[index % connection_count]
+                channel = await connection.channel(publisher_confirms=True)
+                if index == 0:
+                    await self.declare_queues(channel)
+                self.channels.put_nowait(channel)
+            logger.info("RabbitMQ publisher pool ready.")
+        except Exception as e:
+            logger.error("Failed to open RabbitMQ publisher pool: %s", e)
+            raise ConnectionError(f"RabbitMQ connection failed: {e}")
+
+    async def declare_queues(self, channel):
+        """
+        Declare the event queue, or every shard queue when the events are sharded.
+        """
+        arguments = queue_arguments(self.shards)
+        for name in queue_names(config.RABBITMQ_QUEUE, self.shards):
+            if arguments:
+                await channel.declare_queue(name, durable=True, arguments=arguments)
+            else:
+                await channel.declare_queue(name, durable=True)
+
+    async def publish(self, message: dict):
+        """
+        Publish a single message and wait until the broker has confirmed it.
+        Concurrent calls are grouped so that their confirms are awaited as one batch.
+
+        :param message: The message to be published, as a dictionary.
+        """
+        if self.channels is None:
+            logger.error("RabbitMQ publisher pool not initialized. Call 'connect()' first.")
+            raise ConnectionError("RabbitMQ connection not initialized.")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((message, future))
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.flush_interval, self._start_flush)
+        await future
+
+    async def publish_batch(self, messages: list):
+        """
+        Publish several messages on one pooled channel and wait for all of their confirms.
+
+        :param messages: The messages to be published, as dictionaries.
+        :return: A list with None for every confirmed message or the exception that message failed with.
+        """
+        if self.channels is None:
+            logger.error("RabbitMQ publisher pool not initialized. Call 'connect()' first.")
+            raise ConnectionError("RabbitMQ connection not initialized.")
+
+        self._unconfirmed += len(messages)
+        channel = await self.channels.get()
+        try:
+            if channel.is_closed:
+                await channel.reopen()
+            exchange = channel.default_exchange
+            results = await asyncio.gather(
+                *(
+                    exchange.publish(
+                        aio_pika.Message(
+                            body=self.codec.encode(message),
+                            content_type=self.codec.content_type,
+                            # Lets the consumer measure how long the message waited
+                            headers={PUBLISHED_AT_HEADER: time.time()},
+                            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        ),
+                        # Events of one device always go to the same shard queue
+                        routing_key=queue_for(config.RABBITMQ_QUEUE, message.get("device_id"), self.shards),
+                    )
+                    for message in messages
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            self.channels.put_nowait(channel)
+            self._unconfirmed -= len(messages)
+
+        errors = [result if isinstance(result, BaseException) else None for result in results]
+        failed = sum(1 for error in errors if error is not None)
+        if failed:
+            logger.error("%s of %s messages were not confirmed by RabbitMQ.", failed, len(messages))
+        return errors
+
+    @property
+    def backlog(self) -> int:
+        """
+        Messages waiting to be published or confirmed.
+        """
+        return len(self._pending) + self._unconfirmed
+
+    def _start_flush(self):
+        """
+        Hand the pending messages to a background task that publishes them as one batch.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: list):
+        """
+        Publish a batch of pending messages and resolve the futures of their callers.
+        """
+        try:
+            errors = await self.publish_batch([message for message, _ in batch])
+        except Exception as e:
+            errors = [e] * len(batch)
+
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(RuntimeError(f"Publishing message failed: {error}"))
+
+    async def close(self):
+        """
+        Publish whatever is still pending and close the connection pool.
+        """
+        self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+        for connection in self.connections:
+            try:
+                await connection.close()
+            except Exception as e:
+                logger.error("Error while closing RabbitMQ connection: %s", e)
+        self.connections = []
+        self.channels = None
+        logger.info("RabbitMQ publisher pool closed.")
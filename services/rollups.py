@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, String, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declared_attr
+from services.db import AsyncSessionLocal, Base
+from config import config
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+# The metric of the rows that only count events
+COUNT_METRIC = ""
+
+
+class RollupColumns:
+    """
+    Columns shared by the rollup tables. One row holds the aggregate of one metric
+    for one (source, event_type, device_id) in one time bucket.
+    """
+    source = Column(String, primary_key=True)  # "events" or "alerts"
+    event_type = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    device_id = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)  # numeric meta_data field, COUNT_METRIC for the plain counter
+    count = Column(BigInteger, nullable=False)
+    value_sum = Column(Float)
+    value_min = Column(Float)
+    value_max = Column(Float)
+
+    @declared_attr.directive
+    def __table_args__(cls):
+        # The primary key serves (source, event_type, time range), this index serves per-device series
+        return (Index(f"ix_{cls.__tablename__}_source_device_id_bucket", "source", "device_id", "bucket"),)
+
+
+class Rollup1m(RollupColumns, Base):
+    __tablename__ = "rollups_1m"
+
+
+class Rollup1h(RollupColumns, Base):
+    __tablename__ = "rollups_1h"
+
+
+# Rollup tables and the width of their buckets in seconds
+ROLLUP_MODELS = {
+    Rollup1m.__tablename__: (Rollup1m, 60),
+    Rollup1h.__tablename__: (Rollup1h, 3600),
+}
+
+
+def to_utc_naive(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def floor_bucket(timestamp: datetime, seconds: int) -> datetime:
+    """
+    Start of the bucket of the given width holding the timestamp. Buckets are aligned to the Unix epoch.
+    """
+    elapsed = int((to_utc_naive(timestamp) - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def numeric_metrics(meta_data: Optional[dict]) -> List[Tuple[str, float]]:
+    if not meta_data:
+        return []
+    return [
+        (key, float(value))
+        for key, value in meta_data.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+
+
+def merge_aggregate(aggregates: dict, key, count: int, total: Optional[float],
+                    low: Optional[float], high: Optional[float]):
+    """
+    Add a partial aggregate [count, sum, min, max] to aggregates[key]. Count-only rows have no sum, min or max.
+    """
+    current = aggregates.get(key)
+    if current is None:
+        aggregates[key] = [count, total, low, high]
+        return
+    current[0] += count
+    if total is not None:
+        current[1] = total if current[1] is None else current[1] + total
+        current[2] = low if current[2] is None else min(current[2], low)
+        current[3] = high if current[3] is None else max(current[3], high)
+
+
+def upsert_statement(table, dialect_name: str):
+    """
+    INSERT ... ON CONFLICT DO UPDATE adding a batch of partial aggregates to the stored ones.
+    """
+    if dialect_name == "postgresql":
+        insert, smaller, larger = postgresql.insert, func.least, func.greatest
+    elif dialect_name == "sqlite":
+        # SQLite's min()/max() with two arguments are scalar functions
+        insert, smaller, larger = sqlite.insert, func.min, func.max
+    else:
+        raise ValueError(f"Rollups are not supported on {dialect_name}")
+
+    statement = insert(table)
+    excluded = statement.excluded
+    return statement.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key.columns],
+        set_={
+            "count": table.c["count"] + excluded["count"],
+            "value_sum": table.c.value_sum + excluded.value_sum,
+            "value_min": smaller(table.c.value_min, excluded.value_min),
+            "value_max": larger(table.c.value_max, excluded.value_max),
+        },
+    )
+
+
+class RollupAggregator:
+    def __init__(self, source: str, flush_interval: float = None, max_pending: int = None, session_factory=None):
+        """
+        Aggregate events or alerts in memory and upsert the partial aggregates in batches.
+
+        :param source: "events" or "alerts".
+        :param flush_interval: Seconds between flushes.
+        :param max_pending: Number of pending rows that triggers an early flush.
+        :param session_factory: Factory of the async sessions used to write.
+        """
+        self.source = source
+        self.enabled = config.ROLLUPS_ENABLED
+        self.flush_interval = config.ROLLUP_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.max_pending = max_pending or config.ROLLUP_MAX_PENDING
+        self.session_factory = session_factory or AsyncSessionLocal
+        # (table, event_type, bucket, device_id, metric) -> [count, sum, min, max]
+        self._pending: Dict[tuple, list] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, device_id: Optional[str], event_type: str, timestamp: datetime, meta_data: Optional[dict] = None):
+        """
+        Count one event or alert and its numeric meta_data fields.
+        """
+        if not self.enabled or timestamp is None:
+            return
+        values = [(COUNT_METRIC, None)] + numeric_metrics(meta_data)
+        for table, (_, seconds) in ROLLUP_MODELS.items():
+            bucket = floor_bucket(timestamp, seconds)
+            for metric, value in values:
+                key = (table, event_type or "", bucket, device_id or "", metric)
+                merge_aggregate(self._pending, key, 1, value, value, value)
+
+        if len(self._pending) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> int:
+        """
+        Upsert the pending aggregates in one transaction.
+        On failure they are kept and retried with the next flush.
+
+        :return: The number of upserted rows.
+        """
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            # Sorted keys make concurrent upserts from several instances lock rows in the same order
+            rows_by_table = {}
+            for key in sorted(pending):
+                table, event_type, bucket, device_id, metric = key
+                count, total, low, high = pending[key]
+                rows_by_table.setdefault(table, []).append({
+                    "source": self.source,
+                    "event_type": event_type,
+                    "bucket": bucket,
+                    "device_id": device_id,
+                    "metric": metric,
+                    "count": count,
+                    "value_sum": total,
+                    "value_min": low,
+                    "value_max": high,
+                })
+
+            session = self.session_factory()
+            try:
+                dialect_name = session.bind.dialect.name
+                for table, rows in rows_by_table.items():
+                    model = ROLLUP_MODELS[table][0]
+                    await session.execute(upsert_statement(model.__table__, dialect_name), rows)
+                await session.commit()
+            except Exception as e:
+                logger.error("Failed to flush %s %s rollup rows: %s", len(pending), self.source, e)
+                await session.rollback()
+                for key, values in pending.items():
+                    merge_aggregate(self._pending, key, *values)
+                return 0
+            finally:
+                await session.close()
+
+            return len(pending)
+
+    async def run_forever(self):
+        """
+        Flush every flush_interval seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,389 @@
+import json
+import logging
+import operator
+import os
+import time
+from numbers import Number
+from typing import Optional, Tuple
+import numpy as np
+from services.windows import SLIDING, TUMBLING, Aggregate, WindowStore, event_time, numeric_value
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(__file__), "alert_rules.json")
+
+# Comparison operators usable in rule files, with their scalar and NumPy forms
+COMPARISONS = {
+    ">": (operator.gt, np.greater),
+    ">=": (operator.ge, np.greater_equal),
+    "<": (operator.lt, np.less),
+    "<=": (operator.le, np.less_equal),
+    "==": (operator.eq, np.equal),
+    "!=": (operator.ne, np.not_equal),
+}
+
+# Operators that need a lookup in the cache instead of a comparison
+NOT_AUTHORIZED = "not_authorized"
+
+# Window aggregates a windowed rule can compare, also usable as "{count}" etc. in descriptions
+AGGREGATES = Aggregate._fields
+
+
+def compile_predicate(field: str, compare, threshold):
+    def predicate(meta_data: dict) -> bool:
+        value = meta_data.get(field)
+        if value is None:
+            return False
+        try:
+            return compare(value, threshold)
+        except TypeError:
+            return False
+
+    return predicate
+
+
+def always(meta_data: dict) -> bool:
+    return True
+
+
+def key_of(event: dict, field: Optional[str]) -> str:
+    """
+    The value of device_id or of a meta_data field that windows are kept per. Without a field all events share one.
+    """
+    if field is None:
+        return "*"
+    if field == "device_id":
+        return str(event.get("device_id"))
+    return str((event.get("meta_data") or {}).get(field))
+
+
+def format_number(value) -> str:
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+class WindowSpec:
+    __slots__ = ("kind", "seconds", "key", "field", "aggregate", "compare", "value")
+
+    def __init__(self, definition: dict, field: Optional[str], rule: str):
+        """
+        The window of a windowed rule: the events matching the rule are aggregated per key, and the rule
+        fires when the aggregate passes the comparison.
+
+        :param definition: The "window" object of the rule, see the README.
+        :param field: The field of the rule, whose values are aggregated unless the window names another.
+        :param rule: Name of the rule, used in errors.
+        """
+        self.kind = definition.get("kind", SLIDING)
+        self.seconds = float(definition["seconds"])
+        self.key = definition.get("key", "device_id")
+        self.field = definition.get("field", field)
+        self.aggregate = definition.get("aggregate", "count")
+        self.value = definition["value"]
+        if self.kind not in (SLIDING, TUMBLING):
+            raise ValueError(f"Unknown window kind '{self.kind}' in rule '{rule}'")
+        if self.seconds <= 0:
+            raise ValueError(f"Window of rule '{rule}' must be longer than 0 seconds")
+        if self.aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{self.aggregate}' in rule '{rule}'")
+        if definition["op"] not in COMPARISONS:
+            raise ValueError(f"Unknown operator '{definition['op']}' in window of rule '{rule}'")
+        self.compare = COMPARISONS[definition["op"]][0]
+
+    def matches(self, aggregate: Aggregate) -> bool:
+        value = getattr(aggregate, self.aggregate)
+        return value is not None and self.compare(value, self.value)
+
+
+class SequenceSpec:
+    __slots__ = ("event_type", "seconds", "key", "match", "predicate")
+
+    def __init__(self, definition: dict, rule: str):
+        """
+        The earlier event of a sequence rule: the rule fires when an event of event_type passing the
+        optional comparison came at most seconds before.
+
+        :param definition: The "after" object of the rule, see the README.
+        :param rule: Name of the rule, used in errors.
+        """
+        self.event_type = definition["event_type"]
+        self.seconds = float(definition["seconds"])
+        # Field of the earlier event and of the rule's event whose values must be equal, e.g. "device_id"
+        self.key = definition.get("key")
+        self.match = definition.get("match", self.key)
+        op = definition.get("op")
+        if op is None:
+            self.predicate = always
+        elif op in COMPARISONS:
+            self.predicate = compile_predicate(definition["field"], COMPARISONS[op][0], definition.get("value"))
+        else:
+            raise ValueError(f"Unknown operator '{op}' in sequence of rule '{rule}'")
+
+
+class AlertRule:
+    __slots__ = (
+        "name", "event_type", "field", "op", "value", "description", "predicate", "ufunc", "window", "after"
+    )
+
+    def __init__(self, name: str, event_type: str, field: Optional[str], op: Optional[str], value, description: str,
+                 window: dict = None, after: dict = None):
+        """
+        A single compiled alert rule.
+
+        :param name: Name of the rule, used in logs and as the name of its windows.
+        :param event_type: The event type the rule applies to.
+        :param field: The meta_data field the rule looks at.
+        :param op: A comparison operator from COMPARISONS or "not_authorized". Windowed and sequence rules
+            may leave it out to consider every event of the type.
+        :param value: The threshold the field is compared against.
+        :param description: Alert description template, "{value}" is replaced by the field value and
+            "{count}", "{sum}", "{avg}", "{min}" and "{max}" by the window aggregates.
+        :param window: Makes the rule fire on an aggregate of the matching events, see WindowSpec.
+        :param after: Makes the rule fire only shortly after another event, see SequenceSpec.
+        """
+        self.name = name
+        self.event_type = event_type
+        self.field = field
+        self.op = op
+        self.value = value
+        self.description = description
+        self.predicate = None
+        self.ufunc = None
+        self.window = WindowSpec(window, field, name) if window else None
+        self.after = SequenceSpec(after, name) if after else None
+
+        if op in COMPARISONS:
+            compare, ufunc = COMPARISONS[op]
+            self.predicate = compile_predicate(field, compare, value)
+            # Only numeric thresholds can be evaluated over a NumPy array
+            if isinstance(value, Number) and not isinstance(value, bool):
+                self.ufunc = ufunc
+        elif op is None and (self.window or self.after):
+            self.predicate = always
+        elif op != NOT_AUTHORIZED:
+            raise ValueError(f"Unknown operator '{op}' in rule '{name}'")
+        if self.window and self.after:
+            raise ValueError(f"Rule '{name}' cannot have both a window and a sequence")
+
+    @property
+    def stateful(self) -> bool:
+        return self.window is not None or self.after is not None
+
+    def describe(self, meta_data: dict, aggregate: Aggregate = None) -> str:
+        description = self.description.replace("{value}", str(meta_data.get(self.field)))
+        if aggregate is not None:
+            for name, value in zip(AGGREGATES, aggregate):
+                description = description.replace(f"{{{name}}}", format_number(value))
+        return description
+
+
+class RuleEngine:
+    def __init__(self, rules_file: str = None, reload_interval: float = None, windows: WindowStore = None,
+                 ordered: bool = True):
+        """
+        Evaluate alert rules loaded from a JSON file.
+        Rules are compiled once into a dispatch table keyed by event type.
+
+        :param rules_file: Path of the rules file.
+        :param reload_interval: Seconds between checks of the file for changes.
+        :param windows: State of the windowed and sequence rules.
+        :param ordered: Every event of a device reaches this engine, in order. Otherwise windowed and sequence
+            rules are skipped with a warning, as their windows would only see part of the events.
+        """
+        self.rules_file = rules_file or config.ALERT_RULES_FILE or DEFAULT_RULES_FILE
+        self.reload_interval = config.ALERT_RULES_RELOAD_INTERVAL if reload_interval is None else reload_interval
+        self.windows = windows or WindowStore()
+        self.ordered = ordered
+        self.dispatch = {}
+        # Sequence rules by the event type of their earlier event
+        self.followers = {}
+        self._mtime = None
+        self._next_check = 0.0
+
+    def load(self):
+        """
+        Read and compile the rules file, then swap the dispatch table in one step.
+        """
+        mtime = os.stat(self.rules_file).st_mtime
+        with open(self.rules_file) as rules_file:
+            definitions = json.load(rules_file).get("rules", [])
+
+        dispatch = {}
+        followers = {}
+        stateful = {}
+        skipped = []
+        for definition in definitions:
+            rule = AlertRule(
+                name=definition.get("name", definition["event_type"]),
+                event_type=definition["event_type"],
+                field=definition.get("field"),
+                op=definition.get("op"),
+                value=definition.get("value"),
+                description=definition["description"],
+                window=definition.get("window"),
+                after=definition.get("after"),
+            )
+            if rule.stateful and not self.ordered:
+                skipped.append(rule.name)
+                continue
+            dispatch.setdefault(rule.event_type, []).append(rule)
+            if rule.stateful:
+                # Windows are kept per rule name
+                if rule.name in stateful:
+                    raise ValueError(f"Windowed rule name '{rule.name}' is not unique")
+                if rule.window:
+                    stateful[rule.name] = (rule.window.kind, rule.window.seconds)
+                else:
+                    stateful[rule.name] = (SLIDING, rule.after.seconds)
+            if rule.after:
+                followers.setdefault(rule.after.event_type, []).append(rule)
+        if skipped:
+            logger.warning(
+                "Skipped windowed rules %s, they need the events of a device in order. "
+                "Set RABBITMQ_SHARDS above 1 to consume sharded queues.", ", ".join(skipped)
+            )
+
+        self.dispatch = {event_type: tuple(rules) for event_type, rules in dispatch.items()}
+        self.followers = {event_type: tuple(rules) for event_type, rules in followers.items()}
+        self.windows.retain(stateful)
+        self._mtime = mtime
+        logger.info("Loaded %s alert rules for %s event types.", len(definitions), len(self.dispatch))
+
+    def maybe_reload(self):
+        """
+        Reload the rules when the file has changed. Checks at most once per reload interval.
+        A broken file is logged and the previous rules stay active.
+        """
+        now = time.monotonic()
+        # Also throttles retries of a missing or broken file that never loaded
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+
+        try:
+            if self._mtime is None or os.stat(self.rules_file).st_mtime != self._mtime:
+                self.load()
+        except Exception as e:
+            logger.error("Failed to load alert rules from %s: %s", self.rules_file, e)
+
+    def rules_for(self, event_type: str) -> tuple:
+        self.maybe_reload()
+        return self.dispatch.get(event_type, ())
+
+    def observe(self, event_type: str, events: list):
+        """
+        Record the events that sequence rules wait for. evaluate and evaluate_batch do this themselves, unless
+        the events of a batch with several types were observed before any of them was evaluated.
+        """
+        self.maybe_reload()
+        for rule in self.followers.get(event_type, ()):
+            spec = rule.after
+            for event in events:
+                if spec.predicate(event.get("meta_data") or {}):
+                    self.windows.add(rule.name, key_of(event, spec.key), SLIDING, spec.seconds, event_time(event))
+
+    def advance(self, rule: AlertRule, event: dict, meta_data: dict) -> Tuple[bool, Optional[Aggregate]]:
+        """
+        Add an event matching a windowed rule to its window, or look up the earlier event of a sequence rule.
+
+        :return: Whether the rule fires, and the window aggregate of a windowed rule.
+        """
+        timestamp = event_time(event)
+        if rule.window is not None:
+            spec = rule.window
+            aggregate = self.windows.add(
+                rule.name, key_of(event, spec.key), spec.kind, spec.seconds, timestamp,
+                numeric_value(meta_data.get(spec.field))
+            )
+            # A late event of a closed tumbling window is dropped and never fires
+            return aggregate is not None and spec.matches(aggregate), aggregate
+        spec = rule.after
+        return self.windows.seen(rule.name, key_of(event, spec.match), timestamp - spec.seconds, timestamp), None
+
+    async def evaluate(self, event: dict, cache, observed: bool = False) -> Optional[str]:
+        """
+        Evaluate the rules for a single event.
+        Windowed rules see every matching event, also after an earlier rule matched.
+
+        :param event: The decoded event message.
+        :param cache: RedisCache used for authorization rules.
+        :param observed: The event was already passed to observe.
+        :return: The description of the first matching rule or None.
+        """
+        event_type = event.get("event_type")
+        if not observed:
+            self.observe(event_type, [event])
+        meta_data = event.get("meta_data") or {}
+        description = None
+        for rule in self.rules_for(event_type):
+            if description is not None and not rule.stateful:
+                continue
+            if rule.predicate is not None:
+                matched = rule.predicate(meta_data)
+            else:
+                matched = not await cache.is_authorized_user(meta_data.get(rule.field))
+            aggregate = None
+            if matched and rule.stateful:
+                matched, aggregate = self.advance(rule, event, meta_data)
+            if matched and description is None:
+                description = rule.describe(meta_data, aggregate)
+        return description
+
+    async def evaluate_batch(self, event_type: str, events: list, cache, observed: bool = False) -> list:
+        """
+        Evaluate the rules for a batch of events of the same type.
+        Numeric thresholds are applied to all events at once with NumPy. Windowed rules see every
+        matching event in order, also after an earlier rule matched.
+
+        :param event_type: The event type shared by all events.
+        :param events: The decoded event messages.
+        :param cache: RedisCache used for authorization rules.
+        :param observed: The events were already passed to observe.
+        :return: A description or None for every event, in order.
+        """
+        if not observed:
+            self.observe(event_type, events)
+        meta_datas = [event.get("meta_data") or {} for event in events]
+        descriptions = [None] * len(events)
+        pending = np.ones(len(events), dtype=bool)
+        everything = np.ones(len(events), dtype=bool)
+
+        for rule in self.rules_for(event_type):
+            if not pending.any() and not rule.stateful:
+                continue
+            considered = everything if rule.stateful else pending
+
+            if rule.ufunc is not None:
+                values = np.fromiter(
+                    (
+                        value if isinstance(value, Number) and not isinstance(value, bool) else np.nan
+                        for value in (meta_data.get(rule.field) for meta_data in meta_datas)
+                    ),
+                    dtype=np.float64,
+                    count=len(meta_datas),
+                )
+                matched = rule.ufunc(values, rule.value) & ~np.isnan(values) & considered
+            elif rule.predicate is not None:
+                matched = np.zeros(len(events), dtype=bool)
+                for index in np.flatnonzero(considered):
+                    matched[index] = rule.predicate(meta_datas[index])
+            else:
+                # Resolve all users of the batch with one bulk lookup
+                indexes = np.flatnonzero(considered)
+                authorized = await cache.are_authorized_users(meta_datas[index].get(rule.field) for index in indexes)
+                matched = np.zeros(len(events), dtype=bool)
+                for index in indexes:
+                    matched[index] = not authorized.get(meta_datas[index].get(rule.field), False)
+
+            aggregates = {}
+            if rule.stateful:
+                # Windows depend on the order of the events, so they are advanced one event at a time
+                for index in np.flatnonzero(matched):
+                    matched[index], aggregates[index] = self.advance(rule, events[index], meta_datas[index])
+                matched &= pending
+
+            for index in np.flatnonzero(matched):
+                descriptions[index] = rule.describe(meta_datas[index], aggregates.get(index))
+            pending &= ~matched
+
+        return descriptions
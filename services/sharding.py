@@ -0,0 +1,58 @@
+import zlib
+from typing import List, Optional
+from config import config
+
+# Declared on every shard queue: RabbitMQ delivers a queue to one consumer at a time and fails over
+# to the next one, so the events of a device are processed in order however many consumers run
+SHARD_QUEUE_ARGUMENTS = {"x-single-active-consumer": True}
+
+
+def shard_count() -> int:
+    return max(1, config.RABBITMQ_SHARDS)
+
+
+def ordered_delivery() -> bool:
+    """
+    Whether every event of a device reaches one consumer, in order: with the in-process transport of a single
+    process, or with shard queues that each have a single active consumer. Windowed alert rules need this.
+    """
+    return config.BROKER_TRANSPORT == "memory" or shard_count() > 1
+
+
+def queue_names(base: str, shards: int = None) -> List[str]:
+    """
+    Names of the event queues: the configured queue itself, or "<queue>.<shard>" for every shard.
+    """
+    shards = shard_count() if shards is None else shards
+    if shards <= 1:
+        return [base]
+    return [f"{base}.{shard}" for shard in range(shards)]
+
+
+def queue_arguments(shards: int = None) -> Optional[dict]:
+    shards = shard_count() if shards is None else shards
+    return SHARD_QUEUE_ARGUMENTS if shards > 1 else None
+
+
+def shard_for(device_id: Optional[str], shards: int) -> int:
+    """
+    Shard of a device. CRC32 is stable across processes and restarts, unlike hash().
+    """
+    return zlib.crc32((device_id or "").encode()) % shards if shards > 1 else 0
+
+
+def queue_for(base: str, device_id: Optional[str], shards: int = None) -> str:
+    shards = shard_count() if shards is None else shards
+    if shards <= 1:
+        return base
+    return f"{base}.{shard_for(device_id, shards)}"
+
+
+def assign_queues(queues: List[str], slot: int, slots: int) -> List[str]:
+    """
+    Queues consumed by one of `slots` consumers. Shard queues are dealt out round robin, so every shard has
+    one consumer. A single unsharded queue is shared by all consumers, which then compete for its messages.
+    """
+    if len(queues) <= 1:
+        return list(queues)
+    return queues[slot::slots]
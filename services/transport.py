@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+from services.codec import decode_message
+from services.metrics import PUBLISHED_AT_HEADER
+from services.publisher import AsyncRabbitMQPublisher
+from config import config
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ("amqp", "memory")
+
+
+class MemoryMessage:
+    """
+    A message of the in-process transport, with the parts of aio_pika.IncomingMessage the consumer uses.
+    The payload is the published dictionary itself, it is neither copied nor serialized,
+    so consumers must not modify it.
+    """
+    __slots__ = ("transport", "payload", "headers", "delivery_tag")
+    body = None
+    content_type = None
+
+    def __init__(self, transport, payload: dict, delivery_tag: int):
+        self.transport = transport
+        self.payload = payload
+        self.headers = {PUBLISHED_AT_HEADER: time.time()}
+        self.delivery_tag = delivery_tag
+
+    @asynccontextmanager
+    async def process(self):
+        try:
+            yield self
+        except Exception:
+            await self.reject()
+            raise
+        await self.ack()
+
+    async def ack(self, multiple: bool = False):
+        self.transport.settle(self, multiple)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self.transport.settle(self, multiple, failed=True, requeue=requeue)
+
+    async def reject(self, requeue: bool = False):
+        self.transport.settle(self, False, failed=True, requeue=requeue)
+
+
+class MemoryTransport:
+    def __init__(self, max_size: int = None, prefetch: int = None):
+        """
+        Hand events from the ingestion endpoints to the alert consumer through a bounded asyncio queue,
+        for single-node deployments running both in one process.
+        Publishers wait while the queue is full, which slows down ingestion instead of growing memory.
+        Messages are acknowledged like with RabbitMQ, but anything still queued is lost if the process exits.
+
+        :param max_size: Messages the queue holds before publishers wait, MEMORY_TRANSPORT_MAX_SIZE by default.
+        :param prefetch: Unacknowledged messages the consumer may hold, RABBITMQ_PREFETCH_COUNT by default.
+        """
+        self.max_size = config.MEMORY_TRANSPORT_MAX_SIZE if max_size is None else max_size
+        self.prefetch = config.RABBITMQ_PREFETCH_COUNT if prefetch is None else prefetch
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_size)
+        self._unacked: Dict[int, MemoryMessage] = {}
+        self._settled = asyncio.Event()
+        self._requeue_tasks = set()
+        self._next_tag = 1
+
+    async def connect(self):
+        logger.info("Using the in-process transport with room for %s messages.", self.max_size)
+
+    async def close(self):
+        if self.queue.qsize() or self._unacked:
+            logger.warning("Closing the in-process transport with %s queued and %s unacknowledged messages.",
+                           self.queue.qsize(), len(self._unacked))
+
+    def _message(self, payload: dict) -> MemoryMessage:
+        message = MemoryMessage(self, payload, self._next_tag)
+        self._next_tag += 1
+        return message
+
+    async def publish(self, message: dict):
+        """
+        Queue a single message, waiting while the queue is full.
+        """
+        await self.queue.put(self._message(message))
+
+    async def publish_batch(self, messages: list):
+        """
+        Queue several messages.
+
+        :return: A list with None for every message, like AsyncRabbitMQPublisher.publish_batch.
+        """
+        for message in messages:
+            await self.queue.put(self._message(message))
+        return [None] * len(messages)
+
+    async def consume(self, callback):
+        """
+        Deliver messages to callback until cancelled. Like aio_pika, every message is handled in its own task,
+        and at most `prefetch` messages are unacknowledged at a time.
+        """
+        tasks = set()
+        try:
+            while True:
+                while self.prefetch and len(self._unacked) >= self.prefetch:
+                    self._settled.clear()
+                    await self._settled.wait()
+                message = await self.queue.get()
+                self._unacked[message.delivery_tag] = message
+                task = asyncio.create_task(callback(message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def settle(self, message: MemoryMessage, multiple: bool, failed: bool = False, requeue: bool = False):
+        """
+        Acknowledge or reject a message, and with multiple every earlier unacknowledged one.
+        Requeued messages go to the back of the queue, once it has room for them.
+        """
+        if multiple:
+            tags = [tag for tag in self._unacked if tag <= message.delivery_tag]
+        else:
+            tags = [message.delivery_tag]
+        for tag in tags:
+            settled = self._unacked.pop(tag, None)
+            if settled is None:
+                continue
+            if failed and requeue:
+                settled.delivery_tag = self._next_tag
+                self._next_tag += 1
+                task = asyncio.ensure_future(self._requeue(settled))
+                self._requeue_tasks.add(task)
+                task.add_done_callback(self._requeue_tasks.discard)
+                continue
+            self.queue.task_done()
+            if failed:
+                logger.warning("Dropped a rejected message for device %s.", settled.payload.get("device_id"))
+        self._settled.set()
+
+    async def _requeue(self, message: MemoryMessage):
+        # Counted as done only once it is queued again, so join() does not return in between
+        await self.queue.put(message)
+        self.queue.task_done()
+
+    async def join(self):
+        """
+        Wait until every published message has been acknowledged or dropped.
+        """
+        await self.queue.join()
+
+    @property
+    def unacked(self) -> int:
+        return len(self._unacked)
+
+    @property
+    def backlog(self) -> int:
+        """
+        Messages queued or being processed by the consumer.
+        """
+        return self.queue.qsize() + len(self._unacked)
+
+
+def decode_payload(message) -> dict:
+    """
+    The event carried by a message of either transport.
+    """
+    if isinstance(message, MemoryMessage):
+        return message.payload
+    return decode_message(message.body, message.content_type)
+
+
+_memory_transport = None
+
+
+def get_memory_transport() -> MemoryTransport:
+    """
+    The in-process transport shared by the publisher and the consumer of this process.
+    """
+    global _memory_transport
+    if _memory_transport is None:
+        _memory_transport = MemoryTransport()
+    return _memory_transport
+
+
+def create_publisher():
+    """
+    The event publisher selected by BROKER_TRANSPORT: the RabbitMQ publisher pool or the in-process queue.
+    """
+    if config.BROKER_TRANSPORT not in TRANSPORTS:
+        raise ValueError(f"Unknown BROKER_TRANSPORT {config.BROKER_TRANSPORT}, expected one of {TRANSPORTS}")
+    if config.BROKER_TRANSPORT == "memory":
+        return get_memory_transport()
+    return AsyncRabbitMQPublisher()
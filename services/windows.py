@@ -0,0 +1,356 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+import numpy as np
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SLIDING = "sliding"
+TUMBLING = "tumbling"
+
+
+class Aggregate(NamedTuple):
+    """
+    Aggregate of the events in a window. Sum, avg, min and max only cover events with a numeric value
+    and are None if there is none.
+    """
+    count: int
+    sum: Optional[float] = None
+    avg: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+
+
+def aggregate_values(count: int, values: np.ndarray) -> Aggregate:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return Aggregate(count)
+    total = float(values.sum())
+    return Aggregate(count, total, total / len(values), float(values.min()), float(values.max()))
+
+
+def event_time(event: dict) -> float:
+    """
+    Unix time of an event from its "timestamp", which is a datetime with the in-process transport and an
+    ISO 8601 string after a broker. Naive timestamps are UTC. Events without one use the current time.
+    """
+    timestamp = event.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            timestamp = datetime.fromisoformat(timestamp)
+        except ValueError:
+            timestamp = None
+    if not isinstance(timestamp, datetime):
+        return time.time()
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+def numeric_value(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+class RingBuffer:
+    __slots__ = ("times", "values", "start", "size", "latest", "touched")
+
+    def __init__(self, capacity: int):
+        """
+        The events of one sliding window in preallocated arrays. Once full, the oldest event is overwritten,
+        so a window never holds more than capacity events.
+        """
+        self.times = np.zeros(capacity)
+        self.values = np.zeros(capacity)
+        self.start = 0
+        self.size = 0
+        self.latest = -np.inf
+        self.touched = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.times)
+
+    def append(self, timestamp: float, value: float):
+        capacity = self.capacity
+        if self.size == capacity:
+            index = self.start
+            self.start = (self.start + 1) % capacity
+        else:
+            index = (self.start + self.size) % capacity
+            self.size += 1
+        self.times[index] = timestamp
+        self.values[index] = value
+        self.latest = max(self.latest, timestamp)
+
+    def evict_before(self, cutoff: float):
+        """
+        Drop the oldest events until the first one at or after cutoff.
+        """
+        while self.size and self.times[self.start] < cutoff:
+            self.start = (self.start + 1) % self.capacity
+            self.size -= 1
+
+    def ordered(self):
+        """
+        The times and values of the buffered events, oldest first.
+        """
+        end = self.start + self.size
+        if end <= self.capacity:
+            return self.times[self.start:end], self.values[self.start:end]
+        end -= self.capacity
+        return (
+            np.concatenate((self.times[self.start:], self.times[:end])),
+            np.concatenate((self.values[self.start:], self.values[:end])),
+        )
+
+    def add(self, timestamp: float, value: float, seconds: float) -> Aggregate:
+        """
+        Add an event and aggregate the events of the last seconds up to the newest event.
+        Events older than that are evicted. Late events still count while they are inside the window.
+        """
+        self.append(timestamp, value)
+        cutoff = self.latest - seconds
+        self.evict_before(cutoff)
+        times, values = self.ordered()
+        inside = times > cutoff
+        return aggregate_values(int(inside.sum()), values[inside])
+
+    def after(self, start: float, end: float) -> bool:
+        """
+        Whether an event was buffered in the interval [start, end].
+        """
+        times, _ = self.ordered()
+        return bool(((times >= start) & (times <= end)).any())
+
+    def to_state(self, seconds: float) -> list:
+        times, values = self.ordered()
+        inside = times > self.latest - seconds
+        return [times[inside].tolist(), [None if np.isnan(value) else value for value in values[inside].tolist()]]
+
+    def load_state(self, state: list):
+        for timestamp, value in zip(*state):
+            self.append(timestamp, np.nan if value is None else value)
+
+
+class TumblingWindow:
+    __slots__ = ("start", "count", "valued", "total", "low", "high", "touched")
+
+    def __init__(self):
+        """
+        The running aggregate of one tumbling window, which restarts at every multiple of its length.
+        """
+        self.start = -np.inf
+        self.count = 0
+        self.valued = 0
+        self.total = 0.0
+        self.low = np.inf
+        self.high = -np.inf
+        self.touched = 0.0
+
+    def add(self, timestamp: float, value: float, seconds: float) -> Optional[Aggregate]:
+        """
+        Add an event and aggregate the window holding it.
+        Events of an earlier, already closed window are dropped and return None.
+        """
+        start = timestamp - timestamp % seconds
+        if start < self.start:
+            return None
+        if start > self.start:
+            self.start, self.count, self.valued, self.total, self.low, self.high = start, 0, 0, 0.0, np.inf, -np.inf
+        self.count += 1
+        if not np.isnan(value):
+            self.valued += 1
+            self.total += value
+            self.low = min(self.low, value)
+            self.high = max(self.high, value)
+        return self.aggregate()
+
+    def aggregate(self) -> Aggregate:
+        if not self.valued:
+            return Aggregate(self.count)
+        return Aggregate(self.count, self.total, self.total / self.valued, self.low, self.high)
+
+    def to_state(self, seconds: float) -> list:
+        return [self.start, self.count, self.valued, self.total, self.low, self.high]
+
+    def load_state(self, state: list):
+        self.start, self.count, self.valued, self.total, self.low, self.high = state
+
+
+class WindowStore:
+    def __init__(self, capacity: int = None, idle_seconds: float = None, max_keys: int = None,
+                 snapshot_interval: float = None):
+        """
+        State of the windowed alert rules, one window per (rule, key), e.g. per rule and device.
+        Windows are kept in least recently used order, so idle keys are evicted from the front.
+
+        :param capacity: Events buffered per sliding window, WINDOW_BUFFER_SIZE by default.
+        :param idle_seconds: Windows without events for this long are evicted, WINDOW_IDLE_SECONDS by default.
+        :param max_keys: Most windows kept, the least recently used are evicted first. WINDOW_MAX_KEYS by default.
+        :param snapshot_interval: Seconds between snapshots to Redis, WINDOW_SNAPSHOT_INTERVAL by default.
+            0 disables snapshots.
+        """
+        self.capacity = capacity or config.WINDOW_BUFFER_SIZE
+        self.idle_seconds = config.WINDOW_IDLE_SECONDS if idle_seconds is None else idle_seconds
+        self.max_keys = max_keys or config.WINDOW_MAX_KEYS
+        self.snapshot_interval = config.WINDOW_SNAPSHOT_INTERVAL if snapshot_interval is None else snapshot_interval
+        # (rule name, key) -> window
+        self._windows = OrderedDict()
+        # (kind, length in seconds) of the windows of every rule, used to trim snapshots
+        self._specs = {}
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def _get(self, rule: str, key: str, kind: str, seconds: float):
+        if self._specs.get(rule) != (kind, seconds):
+            # The rule changed its kind or length, so its windows start over
+            self.retain({**self._specs, rule: (kind, seconds)})
+            self._specs[rule] = (kind, seconds)
+        now = time.time()
+        window = self._windows.get((rule, key))
+        if window is None:
+            # Idle windows are at the front, so this stops at the first window still in use
+            self.evict(now)
+            window = RingBuffer(self.capacity) if kind == SLIDING else TumblingWindow()
+            self._windows[(rule, key)] = window
+            if len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end((rule, key))
+        window.touched = now
+        return window
+
+    def add(self, rule: str, key: str, kind: str, seconds: float, timestamp: float,
+            value: float = np.nan) -> Optional[Aggregate]:
+        """
+        Add an event to the window of a rule and key.
+
+        :param kind: SLIDING or TUMBLING.
+        :param seconds: Length of the window.
+        :param timestamp: Unix time of the event.
+        :param value: The value aggregated into sum, avg, min and max, NaN if the event has none.
+        :return: The aggregate of the window including the event, or None if the event belongs to a tumbling
+            window that has already closed and was dropped.
+        """
+        return self._get(rule, key, kind, seconds).add(timestamp, value, seconds)
+
+    def seen(self, rule: str, key: str, start: float, end: float) -> bool:
+        """
+        Whether an event was added to the sliding window of a rule and key between start and end.
+        """
+        window = self._windows.get((rule, key))
+        return isinstance(window, RingBuffer) and window.after(start, end)
+
+    def evict(self, now: float = None) -> int:
+        """
+        Drop the windows that have been idle for idle_seconds.
+
+        :return: The number of dropped windows.
+        """
+        if not self.idle_seconds:
+            return 0
+        cutoff = (now or time.time()) - self.idle_seconds
+        evicted = 0
+        while self._windows:
+            window = next(iter(self._windows.values()))
+            if window.touched >= cutoff:
+                break
+            self._windows.popitem(last=False)
+            evicted += 1
+        if evicted:
+            logger.debug("Evicted %s idle windows.", evicted)
+        return evicted
+
+    def retain(self, specs: Dict[str, Tuple[str, float]]):
+        """
+        Drop the windows of rules that no longer exist or whose windows changed kind or length,
+        e.g. after the rules file changed.
+
+        :param specs: (kind, length in seconds) of the windows of every windowed and sequence rule by name.
+        """
+        stale = {rule for rule, spec in self._specs.items() if specs.get(rule) != spec}
+        for window_key in [window_key for window_key in self._windows if window_key[0] in stale]:
+            del self._windows[window_key]
+        for rule in stale:
+            del self._specs[rule]
+
+    def snapshot(self) -> str:
+        """
+        Serialize all windows, least recently used first. Sliding windows only keep the events still inside.
+        """
+        windows = [
+            [rule, key, *self._specs[rule], window.touched, window.to_state(self._specs[rule][1])]
+            for (rule, key), window in self._windows.items()
+        ]
+        return json.dumps({"saved_at": time.time(), "windows": windows}, separators=(",", ":"))
+
+    def restore(self, snapshot: str) -> int:
+        """
+        Load the windows of a snapshot, replacing windows of the same rule and key.
+        Windows of a rule that has since changed kind or length are dropped on its next event.
+
+        :return: The number of restored windows.
+        """
+        restored = 0
+        for rule, key, kind, seconds, touched, state in json.loads(snapshot)["windows"]:
+            if self._specs.get(rule, (kind, seconds)) != (kind, seconds):
+                continue
+            window = RingBuffer(self.capacity) if kind == SLIDING else TumblingWindow()
+            window.load_state(state)
+            window.touched = touched
+            self._windows[(rule, key)] = window
+            self._windows.move_to_end((rule, key))
+            self._specs[rule] = (kind, seconds)
+            restored += 1
+        while len(self._windows) > self.max_keys:
+            self._windows.popitem(last=False)
+        return restored
+
+    async def save(self, cache, name: str):
+        """
+        Evict idle windows and write a snapshot to Redis. Does nothing when snapshots are disabled.
+        """
+        if not self.snapshot_interval:
+            return
+        self.evict()
+        await cache.save_window_snapshot(name, self.snapshot(), int(self.idle_seconds) or None)
+
+    async def load(self, cache, name: str):
+        """
+        Restore the windows from the snapshot in Redis, if there is one.
+        """
+        snapshot = await cache.load_window_snapshot(name)
+        if not snapshot:
+            return
+        try:
+            restored = self.restore(snapshot)
+        except Exception as e:
+            logger.error("Failed to restore the window snapshot %s: %s", name, e)
+            return
+        self.evict()
+        logger.info("Restored %s windows from snapshot %s.", restored, name)
+
+    async def run_forever(self, cache, name: str):
+        """
+        Restore the last snapshot, then save a snapshot every snapshot_interval seconds until cancelled.
+
+        :param cache: The RedisCache holding the snapshots.
+        :param name: Name of the snapshot, unique per consumer process, see RabbitMQConsumer.snapshot_name.
+        """
+        if not self.snapshot_interval:
+            return
+        await self.load(cache, name)
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await self.save(cache, name)
+            except Exception as e:
+                logger.error("Failed to save the window snapshot %s: %s", name, e)